@@ -0,0 +1,202 @@
+# coding: utf8
+"""
+Micro benchmarks for the process output pipeline.
+
+Synthetic streams are fed through `AsyncProcess.read`, the stdout formatter and
+`CellEventsSocket.stdout` for every logging interval, measuring throughput,
+allocations and callback counts.
+
+Usage:
+
+    python -m benchmarks.output_pipeline --intervals 0,0.01,0.1 \
+        --output results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import time
+import tracemalloc
+
+os.environ.setdefault('UNKLEARN_ENVIRONMENT_TYPE', 'testing')
+
+from core.constants import CELLS_NAMESPACE
+from core.utils import AsyncProcess, CellEventsSocket, LocalSocketIO
+
+# Same limit as the stream readers of asyncio.create_subprocess_exec
+STREAM_LIMIT = 2**16
+
+
+class CountingSocketIO:
+    """Counts emits without keeping payloads around"""
+
+    def __init__(self):
+        self.emits = 0
+        self.bytes = 0
+
+    def emit(self, event, args, **kwargs):
+        self.emits += 1
+        self.bytes += len(args.get('output', ''))
+
+
+def short_lines(scale):
+    """Many short lines written in small steady chunks"""
+    line = b'progress: step completed successfully\n'
+    return [line * 64 for _ in range(int(1600 * scale))], 0
+
+
+def huge_lines(scale):
+    """A few lines of one megabyte each"""
+    return [b'x' * 2**20 + b'\n' for _ in range(max(1, int(4 * scale)))], 0
+
+
+def binary_garbage(scale):
+    """Random bytes with the odd newline, which is not valid utf-8"""
+    rng = random.Random(0)
+    return [
+        bytes(rng.getrandbits(8) for _ in range(4096))
+        for _ in range(max(1, int(64 * scale)))
+    ], 0
+
+
+def bursty(scale):
+    """Bursts of lines separated by idle gaps"""
+    line = b'epoch 1/10 - loss: 0.1234 - accuracy: 0.9876\n'
+    return [line * 2000 for _ in range(max(1, int(20 * scale)))], 0.005
+
+
+def steady(scale):
+    """One line at a time with the loop yielding between writes"""
+    line = b'epoch 1/10 - loss: 0.1234 - accuracy: 0.9876\n'
+    return [line for _ in range(int(20000 * scale))], 0
+
+
+SCENARIOS = {
+    'short-lines': short_lines,
+    'huge-lines': huge_lines,
+    'binary-garbage': binary_garbage,
+    'bursty': bursty,
+    'steady': steady
+}
+
+
+async def feed(stream, chunks, gap):
+    for chunk in chunks:
+        stream.feed_data(chunk)
+        # Let the reader catch up, or idle between bursts
+        await asyncio.sleep(gap)
+    stream.feed_eof()
+
+
+async def run_pipeline(chunks, gap, logging_interval):
+    """Feed chunks through read -> formatter -> CellEventsSocket.stdout"""
+    socketio = CountingSocketIO()
+    cell_socket = CellEventsSocket(
+        LocalSocketIO(socketio, channel='bench', namespace=CELLS_NAMESPACE),
+        'bench-cell')
+    counts = {'callbacks': 0, 'linesDelivered': 0, 'formatterCalls': 0}
+
+    def display(lines):
+        counts['callbacks'] += 1
+        counts['linesDelivered'] += len(lines)
+        cell_socket.stdout(lines)
+
+    def formatter(line):
+        counts['formatterCalls'] += 1
+        return line.replace('.file_bench.sh', '')
+
+    process = AsyncProcess(None, stdout_cb=display)
+    stream = asyncio.StreamReader(limit=STREAM_LIMIT)
+
+    error = None
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(
+            feed(stream, chunks, gap),
+            process.read(stream,
+                         display,
+                         formatter=formatter,
+                         logging_interval=logging_interval))
+    except Exception as e:
+        error = '{}: {}'.format(type(e).__name__, e)
+    seconds = time.perf_counter() - start
+
+    counts.update(emits=socketio.emits,
+                  bytesEmitted=socketio.bytes,
+                  seconds=seconds,
+                  error=error)
+    return counts
+
+
+def measure(chunks, gap, logging_interval):
+    loop = asyncio.new_event_loop()
+    try:
+        result = loop.run_until_complete(
+            run_pipeline(chunks, gap, logging_interval))
+
+        # Allocations are measured in a separate pass, tracing slows it down
+        tracemalloc.start()
+        loop.run_until_complete(run_pipeline(chunks, gap, logging_interval))
+        _, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+    finally:
+        loop.close()
+
+    lines_fed = sum(chunk.count(b'\n') for chunk in chunks)
+    bytes_fed = sum(len(chunk) for chunk in chunks)
+    seconds = result['seconds']
+    result.update(
+        linesFed=lines_fed,
+        bytesFed=bytes_fed,
+        linesPerSecond=result['linesDelivered'] / seconds if seconds else None,
+        bytesPerSecond=result['bytesEmitted'] / seconds if seconds else None,
+        peakTracedBytes=peak,
+        liveAllocatedBlocks=sum(s.count
+                                for s in snapshot.statistics('filename')))
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--intervals',
+                        default='0,0.001,0.01,0.1',
+                        help='Comma separated logging intervals in seconds')
+    parser.add_argument('--scenarios',
+                        default=','.join(SCENARIOS),
+                        help='Comma separated list of scenarios to run')
+    parser.add_argument('--scale',
+                        type=float,
+                        default=1.0,
+                        help='Multiplier for the size of each stream')
+    parser.add_argument('--output', help='Write JSON results to this file')
+    args = parser.parse_args(argv)
+
+    intervals = [float(i) for i in args.intervals.split(',') if i]
+    results = {}
+    for name in [s for s in args.scenarios.split(',') if s]:
+        if name not in SCENARIOS:
+            parser.error('Unknown scenario {}'.format(name))
+        chunks, gap = SCENARIOS[name](args.scale)
+        results[name] = {
+            str(interval): measure(chunks, gap, interval)
+            for interval in intervals
+        }
+
+    report = {
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'streamLimit': STREAM_LIMIT,
+        'scenarios': results
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,308 @@
+# coding: utf8
+"""
+End to end load test for the runtime.
+
+Boots `make_app()` with a counting stand-in for SocketIO and a local stub of
+the endpoint parse server, drives concurrent load against the execution and
+file routes and prints the results as JSON.
+
+Usage:
+
+    python -m benchmarks.runtime_load --concurrency 8 --requests 200 \
+        --output results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlparse, parse_qsl
+
+os.environ.setdefault('UNKLEARN_ENVIRONMENT_TYPE', 'testing')
+
+import tornado
+import tornado.escape
+import tornado.web
+from tornado.httpclient import AsyncHTTPClient, HTTPClientError
+from tornado.httpserver import HTTPServer
+from tornado.ioloop import IOLoop
+from tornado.netutil import bind_sockets
+
+from core.constants import CellEvents
+
+SCENARIOS = [
+    'interactive-shell', 'interactive-python', 'file-runs', 'endpoint-runs',
+    'files-get', 'files-post'
+]
+
+
+class CountingSocketIO:
+    """A stand-in for SocketIO that counts emitted events.
+
+    Unlike `support.socket.DummySocketIO` it does not print or keep payloads,
+    so it does not distort the measurements.
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self.total = 0
+
+    def emit(self, event, args, **kwargs):
+        self.counts[event] = self.counts.get(event, 0) + 1
+        self.total += 1
+
+
+class ParseStubHandler(tornado.web.RequestHandler):
+    """Stub of the server's endpoint parse API.
+
+    Query arguments of the request uri are returned as endpoint variables.
+    """
+
+    def post(self):
+        body = tornado.escape.json_decode(self.request.body)
+        query = dict(parse_qsl(urlparse(body['requestUri']).query))
+        self.write(json.dumps({'query': query, 'path': {}}))
+
+
+def start_parse_stub():
+    """Run the parse stub on its own thread and IOLoop.
+
+    Serving parse calls on the runtime's loop would add their cost to the
+    latencies being measured.
+    """
+    sockets = bind_sockets(0, '127.0.0.1')
+    port = sockets[0].getsockname()[1]
+    ready = threading.Event()
+
+    def run():
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        server = HTTPServer(
+            tornado.web.Application([
+                (r'/api/v1/cells/internal-endpoints/parse', ParseStubHandler)
+            ]))
+        server.add_sockets(sockets)
+        ready.set()
+        IOLoop.current().start()
+
+    threading.Thread(target=run, daemon=True).start()
+    ready.wait()
+    return 'http://127.0.0.1:{}'.format(port)
+
+
+def percentile(values, pct):
+    """Nearest rank percentile of a list of values"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(
+        0, min(len(ordered) - 1,
+               int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def summarize(latencies):
+    return {
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+        'mean': sum(latencies) / len(latencies) if latencies else None,
+        'max': max(latencies) if latencies else None
+    }
+
+
+def peak_rss_kb():
+    """Peak resident set size of the runtime and its children in kB"""
+    scale = 1024 if sys.platform == 'darwin' else 1
+    return {
+        'self': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // scale,
+        'children':
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss // scale
+    }
+
+
+class LoadTest:
+    """Boot the runtime and drive concurrent load against it"""
+
+    def __init__(self, concurrency, requests, shell_code, python_code):
+        self.concurrency = concurrency
+        self.requests = requests
+        self.shell_code = shell_code
+        self.python_code = python_code
+        self.socketio = CountingSocketIO()
+        self.work_dir = tempfile.mkdtemp(prefix='runtime-load-')
+
+    def boot(self):
+        from core.config import get_current_config
+        from core.app import make_app
+
+        config = get_current_config(os.environ['UNKLEARN_ENVIRONMENT_TYPE'])
+        config.SOCKETIO = self.socketio
+        config.SERVER_URI = start_parse_stub()
+        config.FILE_ROOT_DIR = os.path.join(self.work_dir, 'files')
+        config.ENDPOINT_CONFIG_ROOT_DIR = os.path.join(self.work_dir,
+                                                       'endpoint-configs')
+        os.makedirs(os.path.join(config.FILE_ROOT_DIR, 'bench'))
+        os.makedirs(config.ENDPOINT_CONFIG_ROOT_DIR)
+
+        with open(os.path.join(config.FILE_ROOT_DIR, 'bench/hello.py'),
+                  'w') as f:
+            f.write('def hello(name):\n    return "Hello " + name\n\n'
+                    'print(hello("file"))\n')
+
+        with open(
+                os.path.join(config.ENDPOINT_CONFIG_ROOT_DIR, 'hello.config'),
+                'w') as f:
+            f.write(
+                json.dumps({
+                    'name': 'hello',
+                    'filePath': 'bench/hello.py',
+                    'signature': 'hello(name)'
+                }))
+
+        sockets = bind_sockets(0, '127.0.0.1')
+        self.base_url = 'http://127.0.0.1:{}'.format(
+            sockets[0].getsockname()[1])
+        self.server = HTTPServer(make_app())
+        self.server.add_sockets(sockets)
+
+    def request_for(self, scenario, i):
+        """Return (path, method, body) of the i-th request of a scenario"""
+        cell = {'cellId': '{}-{}'.format(scenario, i), 'channel': 'bench'}
+        if scenario == 'interactive-shell':
+            return '/interactive?language=shell', 'POST', dict(
+                cell, code=self.shell_code)
+        if scenario == 'interactive-python':
+            return '/interactive?language=python', 'POST', dict(
+                cell, code=self.python_code)
+        if scenario == 'file-runs':
+            return '/file-runs', 'POST', dict(cell, filePath='bench/hello.py')
+        if scenario == 'endpoint-runs':
+            return '/endpoint-runs/hello?name=bench', 'GET', None
+        if scenario == 'files-get':
+            return '/files/bench%2Fhello.py', 'GET', None
+        if scenario == 'files-post':
+            return '/files', 'POST', {
+                'filePath': 'bench/written-{}.txt'.format(i % 16),
+                'content': 'line\n' * 64
+            }
+        raise ValueError('Unknown scenario {}'.format(scenario))
+
+    async def wait_for_runs(self, expected, timeout=60):
+        """Shell runs finish after the response, wait for their end events"""
+        deadline = time.time() + timeout
+        while self.socketio.counts.get(CellEvents.END_RUN, 0) < expected:
+            if time.time() > deadline:
+                return False
+            await asyncio.sleep(0.01)
+        return True
+
+    async def run_scenario(self, scenario):
+        # Not the shared client of the loop, whose slots the runtime needs
+        # for its own calls, such as endpoint parses
+        client = AsyncHTTPClient(force_instance=True,
+                                 max_clients=self.concurrency)
+        latencies = []
+        errors = []
+        remaining = iter(range(self.requests))
+        end_runs = self.socketio.counts.get(CellEvents.END_RUN, 0)
+        events = self.socketio.total
+
+        async def worker():
+            for i in remaining:
+                path, method, body = self.request_for(scenario, i)
+                start = time.perf_counter()
+                try:
+                    await client.fetch(
+                        self.base_url + path,
+                        method=method,
+                        body=json.dumps(body) if body is not None else None,
+                        request_timeout=120)
+                except (HTTPClientError, OSError) as e:
+                    errors.append(str(e))
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        try:
+            await asyncio.gather(*[worker() for _ in range(self.concurrency)])
+        finally:
+            client.close()
+        completed = True
+        if scenario == 'interactive-shell':
+            completed = await self.wait_for_runs(end_runs + self.requests)
+        duration = time.perf_counter() - start
+
+        emitted = self.socketio.total - events
+        return {
+            'requests': self.requests,
+            'concurrency': self.concurrency,
+            'errors': len(errors),
+            'sampleErrors': errors[:5],
+            'completed': completed,
+            'durationSeconds': duration,
+            'requestsPerSecond': self.requests / duration,
+            'latencySeconds': summarize(latencies),
+            'events': emitted,
+            'eventsPerSecond': emitted / duration
+        }
+
+    async def run(self, scenarios):
+        results = {}
+        for scenario in scenarios:
+            results[scenario] = await self.run_scenario(scenario)
+        return results
+
+    def close(self):
+        self.server.stop()
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests',
+                        type=int,
+                        default=100,
+                        help='Requests per scenario')
+    parser.add_argument('--scenarios',
+                        default=','.join(SCENARIOS),
+                        help='Comma separated list of scenarios to run')
+    parser.add_argument('--shell-code', default='echo Hello')
+    parser.add_argument('--python-code', default='print("Hello")')
+    parser.add_argument('--output', help='Write JSON results to this file')
+    args = parser.parse_args(argv)
+
+    scenarios = [s for s in args.scenarios.split(',') if s]
+    for s in scenarios:
+        if s not in SCENARIOS:
+            parser.error('Unknown scenario {}'.format(s))
+
+    load_test = LoadTest(args.concurrency, args.requests, args.shell_code,
+                         args.python_code)
+    load_test.boot()
+    try:
+        results = IOLoop.current().run_sync(lambda: load_test.run(scenarios))
+    finally:
+        load_test.close()
+
+    report = {
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'tornado': tornado.version,
+        'scenarios': results,
+        'peakRssKb': peak_rss_kb()
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
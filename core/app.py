@@ -4,38 +4,185 @@ import code
 
 from core.request_handlers import *
 from core.config import get_current_config
-from core.utils import ProcessRegistry
+from core.utils import ProcessRegistry, InstrumentedSocketIO, RunCache, \
+    Zygote, KernelLoop, CellScheduler, ChannelHub, StreamingSocketIO, \
+    EndpointRegistry, EndpointWorkerPool, FileIndex, ArtifactStore, \
+    OffloadingSocketIO, NamespaceInspector, Drain, Capacity, \
+    LoopLagMonitor, LoopWatchdog, metrics
+from core.utils.metrics import PROCESS_REGISTRY_SIZE, CELL_QUEUE_DEPTH, \
+    STREAM_SUBSCRIBERS, ENDPOINT_WORKER_TARGETS, log_request
 
 
-def make_app():
+def make_app(process_registry=None, worker_id=None):
+    """Create the runtime application
+
+    Parameters
+    ----------
+    process_registry: ProcessRegistry, optional
+        The registry of running processes. Pre-forked workers pass a registry
+        shared between workers. Defaults to an in-memory registry
+
+    worker_id: int, optional
+        The id of the pre-forked worker. Workers have namespaces of their own,
+        and snapshot them separately
+    """
     config = get_current_config(os.environ.get('UNKLEARN_ENVIRONMENT_TYPE'))
+
+    # Record emit latency for every event sent over the socket, publish
+    # events to clients subscribed over the runtime websocket and send large
+    # results as references to artifacts
+    hub = ChannelHub()
+    artifact_store = ArtifactStore(os.path.join(config.FILE_ROOT_DIR,
+                                                config.ARTIFACT_DIR_NAME),
+                                   max_bytes=config.ARTIFACT_MAX_BYTES)
+    socketio = StreamingSocketIO(InstrumentedSocketIO(config.SOCKETIO),
+                                 hub,
+                                 bypass_broker=config.STREAM_BYPASS_BROKER)
+    socketio = OffloadingSocketIO(socketio,
+                                  artifact_store,
+                                  config.ARTIFACT_THRESHOLD_BYTES,
+                                  preview_chars=config.ARTIFACT_PREVIEW_CHARS)
+    STREAM_SUBSCRIBERS.set_function(lambda: len(hub))
+
+    if process_registry is None:
+        process_registry = ProcessRegistry()
+    PROCESS_REGISTRY_SIZE.set_function(lambda: len(process_registry))
+
+    # The namespace python cells run in
+    console = code.InteractiveConsole()
+    snapshot_dir = config.SNAPSHOT_DIR
+    if worker_id is not None:
+        snapshot_dir = os.path.join(snapshot_dir,
+                                    'worker-{}'.format(worker_id))
+
+    # Shell cells run in order per notebook, and fairly across notebooks
+    scheduler = CellScheduler(max_concurrent=config.MAX_CONCURRENT_CELLS)
+    CELL_QUEUE_DEPTH.set_function(lambda: len(scheduler))
+
+    # Refuses new executions and waits for running cells on shutdown
+    drain = Drain(process_registry, scheduler, socketio)
+
+    # Load reported by /ready and /info
+    lag_monitor = LoopLagMonitor(interval=config.LOOP_LAG_INTERVAL)
+    capacity = Capacity(
+        process_registry,
+        scheduler,
+        lag_monitor,
+        drain,
+        max_processes=config.READY_MAX_PROCESSES,
+        max_queue_depth=config.READY_MAX_QUEUE_DEPTH,
+        max_loop_lag=config.READY_MAX_LOOP_LAG,
+        max_cpu_percent=config.READY_MAX_CPU_PERCENT,
+        min_memory_available=config.READY_MIN_MEMORY_AVAILABLE_BYTES)
+
+    # Metadata and hot contents of the files under the file root
+    file_index = FileIndex(
+        config.FILE_ROOT_DIR,
+        cache_max_bytes=config.FILE_CACHE_MAX_BYTES,
+        cache_max_file_bytes=config.FILE_CACHE_MAX_FILE_BYTES,
+        scan_interval=config.FILE_INDEX_SCAN_INTERVAL,
+        ignore=[config.ARTIFACT_DIR_NAME])
+
+    # Versioned endpoint configurations
+    endpoint_registry = EndpointRegistry(config.ENDPOINT_CONFIG_ROOT_DIR)
+
+    # File and endpoint runs fork from a process with preloaded modules
+    zygote = None
+    # Endpoint targets get a zygote of their own, reloaded on source changes
+    endpoint_workers = None
+    if config.ZYGOTE_PRELOAD is not None:
+        zygote = Zygote(config.ZYGOTE_PRELOAD)
+        endpoint_workers = EndpointWorkerPool(
+            config.FILE_ROOT_DIR,
+            preload=config.ZYGOTE_PRELOAD,
+            max_targets=config.ENDPOINT_WORKER_MAX_TARGETS)
+        ENDPOINT_WORKER_TARGETS.set_function(lambda: len(endpoint_workers))
+
     app = tornado.web.Application([
         # Ping handler
         (r"/ping/?", PingHandler),
+        # Readiness for more work
+        (r"/ready/?", ReadyHandler, dict(capacity=capacity)),
+        # Runtime metrics
+        (r"/metrics/?", MetricsHandler, dict(registry=metrics)),
+        # Cell events streamed directly to subscribed clients
+        (r"/cell-stream/?", CellStreamHandler,
+         dict(hub=hub, allowed_origins=config.STREAM_ALLOWED_ORIGINS)),
+        # Large cell results sent as references
+        (r"/artifacts/(?P<artifact_id>[0-9a-f]+)/?", ArtifactHandler,
+         dict(store=artifact_store)),
+        # Sampling profiler of the server process
+        (r"/debug/profile/?", ProfileHandler,
+         dict(enabled=config.DEBUG_PROFILER_ENABLED,
+              token=config.DEBUG_PROFILER_TOKEN)),
         # Get runtime info
-        (r"/info?", InfoRequestHandler),
+        (r"/info?", InfoRequestHandler, dict(capacity=capacity)),
         # Interactive REPL like
         (r"/interactive/?", InteractiveExecutionRequestHandler,
-         dict(socketio=config.SOCKETIO,
-              process_registry=ProcessRegistry(),
-              console=code.InteractiveConsole())),
+         dict(socketio=socketio,
+              process_registry=process_registry,
+              scheduler=scheduler,
+              console=console,
+              kernel=KernelLoop())),
+        # Variables of the interactive namespace
+        (r"/namespace/?", NamespaceHandler,
+         dict(console=console,
+              inspector=NamespaceInspector(
+                  time_budget=config.INSPECTOR_TIME_BUDGET,
+                  preview_chars=config.INSPECTOR_PREVIEW_CHARS))),
+        # Snapshots of the interactive namespace
+        (r"/namespace/snapshot/?(?P<action>restore)?/?",
+         NamespaceSnapshotHandler,
+         dict(console=console, snapshot_dir=snapshot_dir)),
         # Creating files
         (r"/files/?(?P<file_path>[A-Z0-9a-z_\-.%]+)?", FilesHandler,
-         dict(file_path_root=config.FILE_ROOT_DIR)),
+         dict(file_path_root=config.FILE_ROOT_DIR,
+              endpoint_workers=endpoint_workers,
+              file_index=file_index)),
+        # Changes between the files of a client and the runtime
+        (r"/file-diffs/?", FileTreeDiffHandler, dict(file_index=file_index)),
         # File runs
         (r"/file-runs/?", FileExecutionHandler,
-         dict(file_path_root=config.FILE_ROOT_DIR, socketio=config.SOCKETIO)),
+         dict(file_path_root=config.FILE_ROOT_DIR,
+              socketio=socketio,
+              run_cache=RunCache(config.RUN_CACHE_DIR,
+                                 max_bytes=config.RUN_CACHE_MAX_BYTES,
+                                 max_entries=config.RUN_CACHE_MAX_ENTRIES),
+              zygote=zygote)),
         # Endpoint config dir can be separate, but here is the same
-        (r"/endpoint-configs/?", EndpointConfigurationHandler,
-         dict(config_path_root=config.ENDPOINT_CONFIG_ROOT_DIR)),
+        (r"/endpoint-configs/?(?P<endpoint_name>[\w\-]+)?/?",
+         EndpointConfigurationHandler, dict(registry=endpoint_registry)),
+        # Batch endpoint runs
+        (r"/endpoint-batch-runs/(?P<endpoint_name>[\w\-\d]+)/?",
+         EndpointBatchExecutionHandler,
+         dict(registry=endpoint_registry,
+              file_path_root=config.FILE_ROOT_DIR,
+              zygote=zygote,
+              endpoint_workers=endpoint_workers)),
         # Endpoint execution runs
         (r"/endpoint-runs/?(?P<endpoint_name>[\w\-\d]+).*",
          EndpointExecutionHandler,
-         dict(config_path_root=config.ENDPOINT_CONFIG_ROOT_DIR,
-              file_path_root=config.FILE_ROOT_DIR))
+         dict(registry=endpoint_registry,
+              file_path_root=config.FILE_ROOT_DIR,
+              zygote=zygote,
+              endpoint_workers=endpoint_workers))
     ])
 
     # Set config on app object
     app.config = config
+    app.zygote = zygote
+    app.endpoint_workers = endpoint_workers
+    app.console = console
+    app.drain = drain
+    app.lag_monitor = lag_monitor
+    # Logs the stack of calls that block the event loop
+    app.watchdog = None
+    if config.LOOP_STALL_THRESHOLD is not None:
+        app.watchdog = LoopWatchdog(lag_monitor,
+                                    threshold=config.LOOP_STALL_THRESHOLD)
+    app.snapshot_dir = snapshot_dir
+
+    # Record request latencies per route when requests are logged
+    app.settings['log_function'] = log_request
 
     return app
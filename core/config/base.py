@@ -15,3 +15,107 @@ class BaseConfig:
     ENDPOINT_CONFIG_ROOT_DIR = '/tmp/endpoint-configs'
 
     SOCKETIO = None
+
+    # Seconds an endpoint run may take, unless its config sets a timeout
+    ENDPOINT_TIMEOUT = 60
+
+    # Bytes of stderr kept for the closing event of a streamed endpoint run
+    ENDPOINT_STREAM_STDERR_LIMIT = 64 * 1024
+
+    # Maximum number of argument sets in one batch endpoint run
+    ENDPOINT_BATCH_MAX_ITEMS = 10000
+
+    # Process registry shared between workers when running pre-forked
+    PROCESS_REGISTRY_PATH = '/tmp/unklearn-runtime/process-registry.db'
+
+    # Cache of file run results, used by runs that ask for it
+    RUN_CACHE_DIR = '/tmp/unklearn-runtime/run-cache'
+    RUN_CACHE_MAX_BYTES = 64 * 1024 * 1024
+    RUN_CACHE_MAX_ENTRIES = 512
+
+    # Send cell events only over the runtime websocket to channels that have
+    # websocket subscribers, instead of also relaying them over socketio
+    STREAM_BYPASS_BROKER = False
+
+    # Cell results larger than this many bytes are stored as artifacts under
+    # FILE_ROOT_DIR, and clients are sent a reference. None sends all results
+    # inline
+    ARTIFACT_THRESHOLD_BYTES = 256 * 1024
+    ARTIFACT_DIR_NAME = '.artifacts'
+    ARTIFACT_MAX_BYTES = 1024 * 1024 * 1024
+    # Characters of a text result sent along with its reference
+    ARTIFACT_PREVIEW_CHARS = 1000
+
+    # Origins other than the runtime allowed to open the websocket
+    STREAM_ALLOWED_ORIGINS = []
+
+    # Seconds running cells get to finish on SIGTERM before their processes
+    # are killed
+    SHUTDOWN_DRAIN_TIMEOUT = 30
+
+    # Seconds between ticks of the timer measuring event loop lag
+    LOOP_LAG_INTERVAL = 0.5
+
+    # Seconds the event loop lag timer may tick late before the stack of the
+    # loop thread is logged. None disables the watchdog
+    LOOP_STALL_THRESHOLD = 0.5
+
+    # Limits past which /ready reports the runtime as not ready. None
+    # disables a limit
+    READY_MAX_PROCESSES = 200
+    READY_MAX_QUEUE_DEPTH = 100
+    READY_MAX_LOOP_LAG = 1.0
+    READY_MAX_CPU_PERCENT = 95
+    READY_MIN_MEMORY_AVAILABLE_BYTES = 256 * 1024 * 1024
+
+    # Maximum number of shell cells running at once across all notebooks
+    MAX_CONCURRENT_CELLS = 8
+
+    # Number of rows reported in each table of a profiled cell run
+    PROFILE_TOP_N = 15
+
+    # Seconds spent summarising a page of the interactive namespace, after
+    # which variables only get their type
+    INSPECTOR_TIME_BUDGET = 0.2
+    # Maximum length of the preview of a variable
+    INSPECTOR_PREVIEW_CHARS = 200
+    # Maximum number of variables in a page
+    INSPECTOR_MAX_LIMIT = 500
+
+    # Snapshot of the interactive namespace, kept per worker when running
+    # pre-forked
+    SNAPSHOT_DIR = '/tmp/unklearn-runtime/namespace-snapshot'
+    # Numpy arrays of at least this many bytes are saved in a format that is
+    # memory mapped on restore, instead of being pickled
+    SNAPSHOT_ARRAY_THRESHOLD_BYTES = 1024 * 1024
+    # Load the snapshot into the namespace when the runtime starts
+    SNAPSHOT_RESTORE_ON_START = False
+
+    # Serve /debug/profile, which samples the stacks of the server threads.
+    # Requests must send the token as `Authorization: Bearer <token>`
+    DEBUG_PROFILER_ENABLED = False
+    DEBUG_PROFILER_TOKEN = None
+    # Maximum seconds a profile may sample for, and seconds between samples
+    DEBUG_PROFILER_MAX_SECONDS = 60
+    DEBUG_PROFILER_INTERVAL = 0.005
+
+    # Modules preloaded by the zygote that file and endpoint runs fork from.
+    # None runs every file in a fresh interpreter
+    ZYGOTE_PRELOAD = None
+
+    # Contents of small files served by /files are kept in memory
+    FILE_CACHE_MAX_BYTES = 32 * 1024 * 1024
+    FILE_CACHE_MAX_FILE_BYTES = 256 * 1024
+
+    # Seconds a walk of the file root is reused for by listings and diffs
+    FILE_INDEX_SCAN_INTERVAL = 5
+
+    # Maximum number of files in a page of a directory listing
+    FILE_LIST_MAX_LIMIT = 1000
+
+    # Seconds between checks for changed sources of endpoint targets, whose
+    # workers are then reloaded. Only used when the zygote is enabled
+    ENDPOINT_WORKER_POLL_INTERVAL = 2
+
+    # Number of endpoint targets kept warm in their own zygote
+    ENDPOINT_WORKER_MAX_TARGETS = 16
@@ -1,6 +1,6 @@
 import os
 from .base import BaseConfig
-from flask_socketio import SocketIO
+from core.utils.socket import LazySocketIO
 
 
 class DevelopmentConfig(BaseConfig):
@@ -11,4 +11,11 @@ class DevelopmentConfig(BaseConfig):
     MODES = os.environ['UNKLEARN_RUNTIME_MODES'].split(',')
     LANGUAGES = os.environ['UNKLEARN_RUNTIME_LANGUAGES'].split(',')
 
-    SOCKETIO = SocketIO(message_queue=REDIS_BROKER_URL)
\ No newline at end of file
+    # Connects to the message queue on first use
+    SOCKETIO = LazySocketIO(message_queue=REDIS_BROKER_URL)
+
+    # Comma separated, e.g. numpy,pandas
+    ZYGOTE_PRELOAD = [
+        m
+        for m in os.environ.get('UNKLEARN_ZYGOTE_PRELOAD', '').split(',') if m
+    ] or None
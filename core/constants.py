@@ -7,6 +7,10 @@ class CellEvents:
     START_RUN = 'cell_run_start'
     RESULT = 'cell_result'
     END_RUN = 'cell_run_end'
+    PROFILE = 'cell_profile'
+    QUEUED = 'cell_queued'
+    DEQUEUED = 'cell_dequeued'
+    RESULT_REF = 'cell_result_ref'
 
 
 class CellExecutionStatus:
@@ -1,5 +1,11 @@
 from .interactive import InteractiveExecutionRequestHandler
-from .file import FilesHandler, FileExecutionHandler
-from .ping import PingHandler
-from .endpoint import EndpointConfigurationHandler, EndpointExecutionHandler
+from .file import FilesHandler, FileTreeDiffHandler, FileExecutionHandler
+from .ping import PingHandler, ReadyHandler
+from .endpoint import EndpointConfigurationHandler, EndpointExecutionHandler, \
+    EndpointBatchExecutionHandler
 from .info import InfoRequestHandler
+from .metrics import MetricsHandler
+from .stream import CellStreamHandler
+from .artifacts import ArtifactHandler
+from .namespace import NamespaceHandler, NamespaceSnapshotHandler
+from .debug import ProfileHandler
@@ -0,0 +1,43 @@
+# coding: utf8
+import tornado.web
+from tornado.iostream import StreamClosedError
+
+# Bytes of an artifact sent at a time
+CHUNK_SIZE = 64 * 1024
+
+
+class ArtifactHandler(tornado.web.RequestHandler):
+    """Streams the content of a large cell result stored as an artifact"""
+
+    def initialize(self, store=None):
+        """
+        Parameters
+        ----------
+        store: ArtifactStore
+            The store holding the artifacts
+        """
+        self.store = store
+
+    async def get(self, artifact_id):
+        meta = self.store.get(artifact_id)
+        if meta is None:
+            raise tornado.web.HTTPError(
+                404, reason='No artifact {}'.format(artifact_id))
+        try:
+            f = self.store.open(artifact_id)
+        except FileNotFoundError:
+            # Evicted after its metadata was read
+            raise tornado.web.HTTPError(
+                404, reason='No artifact {}'.format(artifact_id))
+
+        self.set_header('Content-Type', meta['mimeType'])
+        self.set_header('Content-Length', meta['size'])
+        # Artifacts never change once written
+        self.set_header('Cache-Control', 'private, max-age=86400, immutable')
+        with f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                self.write(chunk)
+                try:
+                    await self.flush()
+                except StreamClosedError:
+                    return
@@ -0,0 +1,58 @@
+# coding: utf8
+import hmac
+
+import tornado.web
+from tornado.ioloop import IOLoop
+
+from core.utils.sampler import sample_stacks, format_collapsed
+
+
+class ProfileHandler(tornado.web.RequestHandler):
+    """Samples the stacks of the server threads for a number of seconds
+
+    Responds with collapsed stacks, the input format of flame graph tools.
+    The endpoint is off unless enabled in the config, and requests need the
+    configured token as `Authorization: Bearer <token>`.
+    """
+
+    def initialize(self, enabled=False, token=None):
+        """
+        Parameters
+        ----------
+        enabled: bool
+            Whether the endpoint is served at all
+
+        token: str
+            The token requests must present. Without one, every request is
+            refused
+        """
+        self.enabled = enabled
+        self.token = token
+
+    def prepare(self):
+        if not self.enabled:
+            raise tornado.web.HTTPError(404)
+        auth = self.request.headers.get('Authorization', '')
+        scheme, _, presented = auth.partition(' ')
+        if not self.token or scheme.lower() != 'bearer' or \
+                not hmac.compare_digest(presented.encode('utf-8'),
+                                        self.token.encode('utf-8')):
+            raise tornado.web.HTTPError(403)
+
+    async def get(self):
+        config = self.application.config
+        try:
+            seconds = float(self.get_argument('seconds', 10))
+        except ValueError:
+            seconds = -1
+        if not 0 < seconds <= config.DEBUG_PROFILER_MAX_SECONDS:
+            raise tornado.web.HTTPError(
+                400,
+                reason='seconds must be between 0 and {}'.format(
+                    config.DEBUG_PROFILER_MAX_SECONDS))
+        # Sampled from another thread, so the event loop keeps running and
+        # shows up in the samples
+        stacks = await IOLoop.current().run_in_executor(
+            None, sample_stacks, seconds, config.DEBUG_PROFILER_INTERVAL)
+        self.set_header('Content-Type', 'text/plain; charset=utf-8')
+        return self.write(format_collapsed(stacks))
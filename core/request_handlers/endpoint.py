@@ -1,29 +1,51 @@
 # coding: utf8
+import asyncio
+import functools
 import os
 import json
 import re
-import requests
+import shutil
+import signal
+import sys
+import tempfile
 import tornado.web
 import tornado.escape
-from subprocess import Popen, PIPE
-import sys
-
-from core.utils import secure_relative_file_path
+import time
+from contextlib import contextmanager
+from tornado import gen
+from tornado.httpclient import AsyncHTTPClient
+from tornado.ioloop import IOLoop
+from tornado.iostream import StreamClosedError
+from tornado.log import app_log
+
+from core.utils import secure_relative_file_path, ZygoteError, \
+    ZygoteRunLost, endpoint_batch
+from core.utils.metrics import PROCESS_DURATION, \
+    ENDPOINT_CONFIG_LOAD_DURATION, ENDPOINT_PARSE_DURATION
 
 __author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
 
+# Streaming modes an endpoint config can choose, with their content type
+STREAM_CONTENT_TYPES = {
+    'chunked': 'application/x-ndjson',
+    'sse': 'text/event-stream'
+}
+
+# Bytes read from a streamed process at a time
+STREAM_CHUNK_SIZE = 65536
+
 
 class EndpointConfigurationHandler(tornado.web.RequestHandler):
-    """Create new endpoint configurations"""
+    """Create, list, version and delete endpoint configurations"""
 
-    def initialize(self, config_path_root=None):
+    def initialize(self, registry=None):
         """
         Parameters
         ----------
-        config_path_root: str
-            The root folder to use for storing endpoint configurations
+        registry: EndpointRegistry
+            The registry storing endpoint configurations
         """
-        self.config_path_root = config_path_root
+        self.registry = registry
 
     def validate_body_arguments(self, body):
         """Validate input args"""
@@ -35,7 +57,26 @@ class EndpointConfigurationHandler(tornado.web.RequestHandler):
         if not body.get('filePath', None):
             raise tornado.web.HTTPError(400, 'File path must be specified')
 
-    def post(self):
+        try:
+            self.registry.validate_name(body['config'].get('name'))
+        except ValueError as e:
+            raise tornado.web.HTTPError(400, str(e))
+
+    def write_json(self, data):
+        self.set_header('Content-Type', 'application/json')
+        self.write(json.dumps(data))
+
+    def get(self, endpoint_name=None):
+        """List endpoints, or get the versions of one endpoint"""
+        if endpoint_name is None:
+            return self.write_json({'endpoints': self.registry.list()})
+        endpoint = self.registry.describe(endpoint_name)
+        if endpoint is None:
+            raise tornado.web.HTTPError(
+                404, 'No endpoint named {}'.format(endpoint_name))
+        return self.write_json(endpoint)
+
+    def post(self, endpoint_name=None):
         # An endpoint is like a dynamic route. We execute the endpoint by storing the config in a certain location.
         # Once the request is received, we will use the config to parse the request and execute the code within
         body = tornado.escape.json_decode(self.request.body)
@@ -50,28 +91,54 @@ class EndpointConfigurationHandler(tornado.web.RequestHandler):
 
         config['filePath'] = file_path
 
-        name = config['name']
-        full_path = os.path.normpath(
-            os.path.join(self.config_path_root, '{}.config'.format(name)))
-
-        base_dir = os.path.dirname(full_path)
-        if not os.path.exists(base_dir):
-            os.makedirs(base_dir)
-
-        # The endpoint configuration, which we will write to a file (or load from store later on)
-        with open(full_path, 'w') as f:
-            f.write(json.dumps(body['config'], sort_keys=True))
+        # Every change is a new version. Staged versions are activated later
+        version = self.registry.put(config,
+                                    activate=body.get('activate', True))
+        self.set_header('X-Endpoint-Version', str(version))
 
         # Return the sanitized config name
-        return self.write('{}.config'.format(name))
+        return self.write('{}.config'.format(config['name']))
+
+    def put(self, endpoint_name=None):
+        """Activate a version of an endpoint"""
+        body = tornado.escape.json_decode(self.request.body)
+        if endpoint_name is None or not isinstance(body.get('version'), int):
+            raise tornado.web.HTTPError(
+                400, 'An endpoint name and a version must be specified')
+        try:
+            self.registry.activate(endpoint_name, body['version'])
+        except KeyError:
+            raise tornado.web.HTTPError(
+                404,
+                'No version {} of endpoint {}'.format(body['version'],
+                                                      endpoint_name))
+        return self.write_json(self.registry.describe(endpoint_name))
+
+    def delete(self, endpoint_name=None):
+        """Delete an endpoint with all its versions"""
+        try:
+            self.registry.delete(endpoint_name)
+        except KeyError:
+            raise tornado.web.HTTPError(
+                404, 'No endpoint named {}'.format(endpoint_name))
+        return self.write('Ok')
 
 
 class EndpointExecutionHandler(tornado.web.RequestHandler):
     """Handle execution of endpoints"""
 
-    def initialize(self, file_path_root=None, config_path_root=None):
+    def initialize(self,
+                   file_path_root=None,
+                   registry=None,
+                   zygote=None,
+                   endpoint_workers=None):
         self.file_path_root = file_path_root
-        self.config_path_root = config_path_root
+        self.registry = registry
+        self.zygote = zygote
+        self.endpoint_workers = endpoint_workers
+
+    def prepare(self):
+        self.application.drain.reject_if_draining()
 
     def write_error(self, status_code, **kwargs):
         """Overwrite the error handler to send error code and reason"""
@@ -84,47 +151,219 @@ class EndpointExecutionHandler(tornado.web.RequestHandler):
                 }},
                 indent=2))
 
-    def _execute_endpoint(self, file_path):
-        """Execute the code provided by the file path"""
-        p = Popen(
-            [sys.executable, file_path],
-            env={
-                # Module discovery
-                'PYTHONPATH': self.file_path_root
-            },
-            stdout=PIPE,
-            stderr=PIPE,
-            cwd=self.file_path_root)
-        stdout, stderr = p.communicate()
+    @contextmanager
+    def _lease_zygote(self, target):
+        """The zygote to run an endpoint target with, or None"""
+        if self.endpoint_workers is None:
+            yield self.zygote
+            return
+        with self.endpoint_workers.lease(target) as zygote:
+            # The global zygote serves while the target's own is starting
+            yield zygote or self.zygote
+
+    async def _execute_endpoint(self, file_path, target, timeout, args=None):
+        """Execute the code provided by the file path
+
+        Raises a 504 if the run takes longer than timeout seconds
+        """
+        args = list(args or [])
+        env = self._endpoint_env(os.path.dirname(target))
+        with PROCESS_DURATION.time(mode='endpoint'), \
+                self._lease_zygote(target) as zygote, \
+                self.application.drain.tracking() as on_start:
+            if zygote is not None:
+                try:
+                    _, stdout, stderr = await IOLoop.current().run_in_executor(
+                        None,
+                        functools.partial(zygote.run,
+                                          file_path,
+                                          self.file_path_root,
+                                          env,
+                                          timeout=timeout,
+                                          on_start=on_start,
+                                          args=args))
+                    return stderr, stdout
+                except TimeoutError:
+                    self._raise_timeout(timeout)
+                except ZygoteRunLost as e:
+                    # The file may have run already, it is not run again
+                    raise tornado.web.HTTPError(500, reason=str(e))
+                except ZygoteError as e:
+                    # Not started yet, a fresh interpreter can take the run
+                    app_log.warning('Running %s without zygote: %s', file_path,
+                                    e)
+
+            p = await self._spawn(file_path, env, args)
+            on_start(p.pid)
+            try:
+                stdout, stderr = await asyncio.wait_for(
+                    p.communicate(), timeout)
+            except asyncio.TimeoutError:
+                await self._kill(p)
+                self._raise_timeout(timeout)
         return stderr.decode('utf-8'), stdout.decode('utf-8')
 
-    def _get_config(self, endpoint_name):
-        full_path = os.path.normpath(
-            os.path.join(self.config_path_root,
-                         '{}.config'.format(endpoint_name)))
+    def _endpoint_env(self, target_dir):
+        return {
+            # Module discovery. The endpoint file is not next to the target,
+            # so the directory of the target is added explicitly
+            'PYTHONPATH': os.pathsep.join([target_dir, self.file_path_root])
+        }
+
+    async def _spawn(self, file_path, env, args=()):
+        return await asyncio.create_subprocess_exec(
+            sys.executable,
+            file_path,
+            *args,
+            env=env,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=self.file_path_root,
+            # Own process group, so children are killed on timeout
+            start_new_session=True)
+
+    @staticmethod
+    async def _kill(p):
+        """Kill the process group of a spawned run"""
+        try:
+            os.killpg(p.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        await p.wait()
+
+    async def _stream_endpoint(self, file_path, target, timeout, mode):
+        """Send the stdout of the run to the client while it runs.
+
+        Every line of stdout is sent as an `output` event, as newline
+        delimited JSON in `chunked` mode or as Server-Sent Events in `sse`
+        mode. Only the tail of stderr is kept, and sent with the return code
+        in a closing `status` event.
+        """
+        self.set_header('Content-Type', STREAM_CONTENT_TYPES[mode])
+        self.set_header('Cache-Control', 'no-cache')
+
+        env = self._endpoint_env(os.path.dirname(target))
+        # Print output as it is produced instead of when the buffer fills
+        env['PYTHONUNBUFFERED'] = '1'
+
+        stderr_limit = self.application.config.ENDPOINT_STREAM_STDERR_LIMIT
+        stderr_tail = bytearray()
+
+        async def read_stderr(stream):
+            while True:
+                data = await stream.read(STREAM_CHUNK_SIZE)
+                if not data:
+                    return
+                stderr_tail.extend(data)
+                del stderr_tail[:-stderr_limit]
+
+        status = 'done'
+        with PROCESS_DURATION.time(mode='endpoint'), \
+                self.application.drain.tracking() as on_start:
+            p = await self._spawn(file_path, env)
+            on_start(p.pid)
+            try:
+                await asyncio.wait_for(
+                    asyncio.gather(self._send_lines(p.stdout, mode),
+                                   read_stderr(p.stderr)), timeout)
+                returncode = await p.wait()
+            except asyncio.TimeoutError:
+                await self._kill(p)
+                status = 'timeout'
+                returncode = p.returncode
+            except StreamClosedError:
+                # The client went away, nobody is left to read the output
+                await self._kill(p)
+                return
+
+        error = stderr_tail.decode('utf-8', 'replace')
+        if status == 'done' and (returncode != 0 or error):
+            status = 'error'
+        self._write_event(mode, 'status', {
+            'status': status,
+            'returncode': returncode,
+            'error': error
+        })
+
+    async def _send_lines(self, stream, mode):
+        """Send lines of a stream as output events, waiting for each flush"""
+        pending = b''
+        while True:
+            data = await stream.read(STREAM_CHUNK_SIZE)
+            if not data:
+                break
+            lines = (pending + data).split(b'\n')
+            pending = lines.pop()
+            # Very long lines are sent in pieces to bound memory
+            if len(pending) >= STREAM_CHUNK_SIZE:
+                lines.append(pending)
+                pending = b''
+            for line in lines:
+                self._write_event(mode, 'output',
+                                  line.decode('utf-8', 'replace'))
+            # Apply backpressure from slow clients to the child process
+            await self.flush()
+        if pending:
+            self._write_event(mode, 'output',
+                              pending.decode('utf-8', 'replace'))
+
+    def _write_event(self, mode, event, data):
+        if mode == 'sse':
+            self.write('event: {}\ndata: {}\n\n'.format(
+                event, json.dumps(data)))
+        else:
+            self.write(json.dumps({'event': event, 'data': data}) + '\n')
 
-        if not os.path.exists(full_path):
+    def _raise_timeout(self, timeout):
+        raise tornado.web.HTTPError(
+            504,
+            reason='Endpoint did not respond within {} seconds'.format(
+                timeout))
+
+    def _get_config(self, endpoint_name):
+        with ENDPOINT_CONFIG_LOAD_DURATION.time():
+            return self._load_config(endpoint_name)
+
+    def _get_timeout(self, config):
+        timeout = config.get('timeout',
+                             self.application.config.ENDPOINT_TIMEOUT)
+        if not isinstance(timeout, (int, float)) or \
+                isinstance(timeout, bool) or timeout <= 0:
+            raise tornado.web.HTTPError(
+                400,
+                reason='timeout of endpoint {} must be a positive '
+                'number'.format(config['name']))
+        return timeout
+
+    def _load_config(self, endpoint_name):
+        config = self.registry.get(endpoint_name)
+        if config is None:
             raise tornado.web.HTTPError(
                 404,
                 reason='Missing endpoint configuration for {}. '
                 'Please check if endpoint is defined.'.format(endpoint_name))
-        with open(full_path, 'r') as f:
-            return json.loads(f.read())
+        return config
 
-    def _parse_endpoint_vars(self, config):
+    async def _parse_endpoint_vars(self, config):
         app = self.application
-        response = requests.post(app.config.SERVER_URI +
-                                 '/api/v1/cells/internal-endpoints/parse',
-                                 json={
-                                     'config': config,
-                                     'requestUri': self.request.uri
-                                 })
-
-        if response.status_code == 400:
-            raise tornado.web.HTTPError(reason=response.json()['message'],
-                                        status_code=400)
-        elif response.status_code == 200:
-            response_body = response.json()
+        start = time.perf_counter()
+        response = await AsyncHTTPClient().fetch(
+            app.config.SERVER_URI + '/api/v1/cells/internal-endpoints/parse',
+            method='POST',
+            headers={'Content-Type': 'application/json'},
+            body=json.dumps({
+                'config': config,
+                'requestUri': self.request.uri
+            }),
+            raise_error=False)
+        ENDPOINT_PARSE_DURATION.observe(time.perf_counter() - start,
+                                        status=response.code)
+
+        if response.code == 400:
+            message = tornado.escape.json_decode(response.body)['message']
+            raise tornado.web.HTTPError(reason=message, status_code=400)
+        elif response.code == 200:
+            response_body = tornado.escape.json_decode(response.body)
 
             query_args = response_body['query']
             path_args = response_body['path']
@@ -148,10 +387,10 @@ class EndpointExecutionHandler(tornado.web.RequestHandler):
         else:
             raise tornado.web.HTTPError(
                 reason='Error while attempting to parse endpoint {}'.format(
-                    re.sub(r'\r\n', '', response.text)))
+                    re.sub(r'\r\n', '', response.body.decode('utf-8'))))
 
-    def _write_endpoint_file(self, config):
-        """Create endpoint file for execution"""
+    async def _write_endpoint_file(self, config):
+        """Create endpoint file for execution next to the target file"""
         file_path = config['filePath']
 
         full_path = os.path.normpath(
@@ -168,30 +407,45 @@ class EndpointExecutionHandler(tornado.web.RequestHandler):
         with open(full_path, 'r') as f:
             content = f.read()
 
-            file_postfix_content = self._parse_endpoint_vars(config)
+        file_postfix_content = await self._parse_endpoint_vars(config)
 
-            content += '\n' + file_postfix_content
+        content += '\n' + file_postfix_content
 
-            content += '\n\nprint({})'.format(config['signature'])
+        content += '\n\nprint({})'.format(config['signature'])
 
-            # Write to endpoint specific file
-            endpoint_file = full_path.replace('.py', '') + '--endpoint.py'
+        # Every invocation writes its own file, so concurrent calls of an
+        # endpoint do not overwrite each other. It sits next to the target,
+        # so code loading data relative to its own file still finds it
+        fd, endpoint_file = tempfile.mkstemp(
+            prefix=os.path.basename(full_path).replace('.py', '') +
+            '--endpoint-',
+            suffix='.py',
+            dir=os.path.dirname(full_path))
 
-            # Write the file to disk for execution
-            with open(endpoint_file, 'w') as wf:
-                wf.write(content + '\n')
+        # Write the file to disk for execution
+        with os.fdopen(fd, 'w') as wf:
+            wf.write(content + '\n')
 
-            return endpoint_file
+        return endpoint_file, full_path
 
-    def _handle_endpoint_execution(self, endpoint_name):
+    async def _handle_endpoint_execution(self, endpoint_name):
         # Run the specified endpoint using signature
         config = self._get_config(endpoint_name)
+        timeout = self._get_timeout(config)
+
         # Create endpoint_file and execute endpoint file
+        endpoint_file, target = await self._write_endpoint_file(config)
+        try:
 
-        endpoint_file = self._write_endpoint_file(config)
+            mode = config.get('stream')
+            if mode in STREAM_CONTENT_TYPES:
+                return await self._stream_endpoint(endpoint_file, target,
+                                                   timeout, mode)
 
-        # Synchronous execution
-        err, output = self._execute_endpoint(endpoint_file)
+            err, output = await self._execute_endpoint(endpoint_file, target,
+                                                       timeout)
+        finally:
+            os.unlink(endpoint_file)
 
         if err and len(err):
             self.set_status(500)
@@ -200,8 +454,104 @@ class EndpointExecutionHandler(tornado.web.RequestHandler):
             self.set_status(200)
             return self.write(output)
 
-    def get(self, endpoint_name):
-        return self._handle_endpoint_execution(endpoint_name)
+    async def get(self, endpoint_name):
+        return await self._handle_endpoint_execution(endpoint_name)
+
+    async def post(self, endpoint_name):
+        return await self._handle_endpoint_execution(endpoint_name)
+
+
+class EndpointBatchExecutionHandler(EndpointExecutionHandler):
+    """Run an endpoint for many argument sets at once
+
+    The body is a JSON array of objects, each mapping the variables of the
+    endpoint signature to values. The target file is loaded once per process
+    and the signature is evaluated for every item. Endpoints setting
+    `batchParallelism` in their config split the items into that many chunks
+    that run in parallel processes.
+    """
+
+    def _parse_items(self):
+        try:
+            items = tornado.escape.json_decode(self.request.body)
+        except ValueError:
+            items = None
+        if not isinstance(items, list) or not all(
+                isinstance(item, dict) for item in items):
+            raise tornado.web.HTTPError(
+                400, reason='Batch must be a JSON array of argument objects')
+        max_items = self.application.config.ENDPOINT_BATCH_MAX_ITEMS
+        if len(items) > max_items:
+            raise tornado.web.HTTPError(
+                400,
+                reason='Batch of {} items exceeds the limit of {}'.format(
+                    len(items), max_items))
+        return items
+
+    async def _run_chunk(self, config, items, scratch_dir, index, timeout):
+        """Run a chunk of items in one process. Returns a result per item"""
+        target = os.path.normpath(
+            os.path.join(self.file_path_root, config['filePath']))
+        items_path = os.path.join(scratch_dir, 'items-{}.json'.format(index))
+        results_path = os.path.join(scratch_dir,
+                                    'results-{}.json'.format(index))
+        with open(items_path, 'w') as f:
+            json.dump(items, f)
+
+        err, _ = await self._execute_endpoint(
+            endpoint_batch.__file__,
+            target,
+            timeout,
+            args=[target, config['signature'], items_path, results_path])
+
+        if not os.path.exists(results_path):
+            # The target failed to load, every item fails with it
+            return [{'error': err} for _ in items]
+        with open(results_path, 'r') as f:
+            return json.load(f)
+
+    async def _handle_batch_execution(self, endpoint_name):
+        config = self._get_config(endpoint_name)
+        items = self._parse_items()
+        timeout = self._get_timeout(config)
+
+        if not os.path.exists(
+                os.path.join(self.file_path_root, config['filePath'])):
+            raise tornado.web.HTTPError(
+                404,
+                reason='The target file {} of endpoint {} is missing'.format(
+                    config['filePath'], config['name']))
+
+        requested = config.get('batchParallelism', 1)
+        if not isinstance(requested, int) or isinstance(requested, bool) \
+                or requested < 1:
+            raise tornado.web.HTTPError(
+                400,
+                reason='batchParallelism of endpoint {} must be a positive '
+                'integer'.format(config['name']))
+
+        if not items:
+            self.set_header('Content-Type', 'application/json')
+            return self.write(json.dumps({'results': []}))
+
+        parallelism = min(requested, os.cpu_count() or 1, len(items))
+        chunk_size = -(-len(items) // parallelism)
+        chunks = [
+            items[i:i + chunk_size] for i in range(0, len(items), chunk_size)
+        ]
+
+        scratch_dir = tempfile.mkdtemp(prefix='endpoint-batch-')
+        try:
+            results = await gen.multi([
+                self._run_chunk(config, chunk, scratch_dir, i, timeout)
+                for i, chunk in enumerate(chunks)
+            ])
+        finally:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+
+        self.set_header('Content-Type', 'application/json')
+        return self.write(
+            json.dumps({'results': [r for chunk in results for r in chunk]}))
 
-    def post(self, endpoint_name):
-        return self._handle_endpoint_execution(endpoint_name)
+    async def post(self, endpoint_name):
+        return await self._handle_batch_execution(endpoint_name)
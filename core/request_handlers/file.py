@@ -1,12 +1,16 @@
+import datetime
+import email.utils
+import functools
 import json
-import sys
 import os
 import tornado.escape
 import tornado.web
-from subprocess import Popen, PIPE
+from tornado.ioloop import IOLoop
 
-from core.utils import secure_relative_file_path
+from core.utils import secure_relative_file_path, run_python_file, \
+    FileIndex, ZygoteRunLost
 from core.constants import CellEvents, CellExecutionStatus, CELLS_NAMESPACE
+from core.utils.metrics import PROCESS_DURATION, observe_cell_text
 
 
 class FilesHandler(tornado.web.RequestHandler):
@@ -17,21 +21,88 @@ class FilesHandler(tornado.web.RequestHandler):
         return os.path.join(self.file_path_root,
                             secure_relative_file_path(file_path))
 
-    def initialize(self, file_path_root=None):
+    def initialize(self,
+                   file_path_root=None,
+                   endpoint_workers=None,
+                   file_index=None):
         """Init called by tornado"""
         self.file_path_root = file_path_root
+        self.endpoint_workers = endpoint_workers
+        self.file_index = file_index or FileIndex(file_path_root)
+
+    def is_not_modified(self, entry):
+        """Whether the client already has the current version of a file"""
+        if self.request.headers.get('If-None-Match'):
+            return self.check_etag_header()
+        try:
+            since = email.utils.parsedate_to_datetime(
+                self.request.headers['If-Modified-Since'])
+        except (KeyError, TypeError, ValueError):
+            return False
+        # Last-Modified only has a resolution of seconds
+        return int(entry.mtime) <= since.timestamp()
+
+    def get_page_argument(self, name, default):
+        try:
+            value = int(self.get_argument(name, default))
+        except ValueError:
+            value = -1
+        if value < 0:
+            raise tornado.web.HTTPError(
+                400, reason='{} must be a non-negative integer'.format(name))
+        return value
+
+    async def list_files(self, directory):
+        """Page through the files under a directory, in order of their path"""
+        directory = secure_relative_file_path(directory)
+        if not os.path.isdir(os.path.join(self.file_path_root, directory)):
+            raise tornado.web.HTTPError(
+                404, reason='No directory {}'.format(directory))
+        offset = self.get_page_argument('offset', 0)
+        limit = min(self.get_page_argument('limit', 100),
+                    self.application.config.FILE_LIST_MAX_LIMIT)
+
+        # Walking the file root can take a while, keep it off the IOLoop
+        await IOLoop.current().run_in_executor(None, self.file_index.scan)
+        total, entries = self.file_index.list(directory,
+                                              offset=offset,
+                                              limit=limit)
+        files = [{
+            'path': e.path,
+            'size': e.size,
+            'mtime': e.mtime
+        } for e in entries]
+        return self.write(
+            json.dumps({
+                'directory': directory,
+                'total': total,
+                'offset': offset,
+                'limit': limit,
+                'files': files
+            }))
+
+    async def get(self, file_path=None):
+        """Get a file given the file path, or list files with ?list=<dir>"""
+        directory = self.get_argument('list', None)
+        if file_path is None and directory is not None:
+            return await self.list_files(directory)
 
-    def get(self, file_path=None):
-        """Get a file given the file path"""
         file_path = self.get_secure_filename(file_path)
-        if not os.path.exists(file_path):
+        entry = self.file_index.get(file_path)
+        if entry is None:
             raise tornado.web.HTTPError(
                 status_code=404,
                 log_message='Cannot find a file with the file path: {}'.format(
                     file_path))
-        with open(file_path, 'r') as f:
-            contents = f.read()
-        return self.write(contents)
+        self.set_header('Etag', '"{}"'.format(entry.digest))
+        self.set_header(
+            'Last-Modified',
+            datetime.datetime.fromtimestamp(entry.mtime,
+                                            datetime.timezone.utc))
+        if self.is_not_modified(entry):
+            self.set_status(304)
+            return
+        return self.write(self.file_index.read(file_path))
 
     def post(self, file_path=None):
         """Create a new file based on file path and content"""
@@ -54,10 +125,45 @@ class FilesHandler(tornado.web.RequestHandler):
             os.makedirs(base_dir)
         with open(file_path, 'w', encoding='utf-8') as f:
             f.write(file_content)
+        self.file_index.update(file_path, file_content.encode('utf-8'))
+        if self.endpoint_workers is not None:
+            # Reload endpoints that use the file now rather than on next poll
+            self.endpoint_workers.file_changed(file_path)
         # Send back the secure relative path
         return self.write(secure_relative_file_path(file_data['filePath']))
 
 
+class FileTreeDiffHandler(tornado.web.RequestHandler):
+    """Compare the files a client has with those under the file root
+
+    The body maps paths relative to the file root to sha256 hex digests of
+    their contents. The response lists the paths the client lacks (added),
+    has other contents of (changed) and has but the runtime does not
+    (removed). The optional `directory` argument limits the comparison to
+    the files under a directory.
+    """
+
+    def initialize(self, file_index=None):
+        self.file_index = file_index
+
+    async def post(self):
+        try:
+            hashes = tornado.escape.json_decode(self.request.body)
+        except ValueError:
+            hashes = None
+        if not isinstance(hashes, dict) or not all(
+                isinstance(v, str) for v in hashes.values()):
+            raise tornado.web.HTTPError(
+                400, reason='Body must map file paths to content hashes')
+        directory = secure_relative_file_path(
+            self.get_argument('directory', ''))
+
+        # Files are hashed the first time they are compared
+        diff = await IOLoop.current().run_in_executor(
+            None, lambda: self.file_index.diff(hashes, directory=directory))
+        return self.write(json.dumps(diff))
+
+
 class FileExecutionHandler(tornado.web.RequestHandler):
     """A request handler that takes care of executing python files."""
 
@@ -66,24 +172,50 @@ class FileExecutionHandler(tornado.web.RequestHandler):
         return os.path.join(self.file_path_root,
                             secure_relative_file_path(file_path))
 
-    def initialize(self, file_path_root=None, socketio=None):
+    def initialize(self,
+                   file_path_root=None,
+                   socketio=None,
+                   run_cache=None,
+                   zygote=None):
         """Init called by tornado"""
         self.file_path_root = file_path_root
         self.socketio = socketio
+        self.run_cache = run_cache
+        self.zygote = zygote
+
+    async def execute_python_file(self, file_path):
+        """Run a python file
 
-    def execute_python_file(self, file_path):
-        p = Popen(
-            [sys.executable, file_path],
-            env={
-                # Module discovery
-                'PYTHONPATH': self.file_path_root
-            },
-            stdout=PIPE,
-            stderr=PIPE,
-            cwd=self.file_path_root)
-        # This is blocking. TODO: Tharun use asyncio to unblock
-        stdout, stderr = p.communicate()
-        return stderr.decode('utf-8'), stdout.decode('utf-8')
+        Returns
+        -------
+        tuple
+            stderr, stdout, and whether the file exited on its own. Runs that
+            were killed or lost did not
+        """
+        with PROCESS_DURATION.time(mode='file'), \
+                self.application.drain.tracking() as on_start:
+            # Runs and starting the zygote block, so they happen off the
+            # IOLoop
+            run = functools.partial(
+                run_python_file,
+                file_path,
+                cwd=self.file_path_root,
+                env={
+                    # Module discovery
+                    'PYTHONPATH': self.file_path_root
+                },
+                zygote=self.zygote,
+                on_start=on_start)
+            try:
+                returncode, stdout, stderr = \
+                    await IOLoop.current().run_in_executor(None, run)
+            except ZygoteRunLost as e:
+                # The file may have run already, it is not run again
+                return str(e), '', False
+        if returncode < 0 and not stderr:
+            # Killed, e.g. by a drain, without a word on stderr
+            stderr = 'Killed by signal {}\n'.format(-returncode)
+        return stderr, stdout, returncode >= 0
 
     def validate_post_body(self, file_data):
         """Validate the necessary arguments"""
@@ -103,7 +235,10 @@ class FileExecutionHandler(tornado.web.RequestHandler):
             raise tornado.web.HTTPError(
                 404, 'Cannot find file at {}'.format(file_path))
 
-    def post(self):
+    def prepare(self):
+        self.application.drain.reject_if_draining()
+
+    async def post(self):
         """Run the file at the given file path"""
         file_data = tornado.escape.json_decode(self.request.body)
 
@@ -124,18 +259,42 @@ class FileExecutionHandler(tornado.web.RequestHandler):
 
         status = CellExecutionStatus.DONE
 
-        err, out = self.execute_python_file(file_path)
-        self.socketio.emit(CellEvents.RESULT, {
+        # Deterministic runs can opt in to replaying a cached result
+        cache_key = None
+        cached = None
+        if file_data.get('cache', False) and self.run_cache is not None:
+            cache_key = self.run_cache.key(file_path, self.file_path_root)
+            cached = self.run_cache.get(cache_key)
+
+        if cached is None:
+            err, out, exited = await self.execute_python_file(file_path)
+            observe_cell_text('file', out, err)
+            if err and len(err):
+                status = CellExecutionStatus.ERROR
+            # Kills and lost runs say nothing about the output of the file
+            if cache_key is not None and exited:
+                self.run_cache.put(cache_key, {
+                    'output': out,
+                    'error': err,
+                    'status': status
+                })
+        else:
+            err, out, status = cached['error'], cached['output'], cached[
+                'status']
+
+        result = {
             'id': cell_id,
             'output': out,
             'error': err.replace(self.file_path_root + '/', ''),
-        },
+        }
+        if cached is not None:
+            result['cached'] = True
+
+        self.socketio.emit(CellEvents.RESULT,
+                           result,
                            room=channel,
                            namespace=CELLS_NAMESPACE)
 
-        if err and len(err):
-            status = CellExecutionStatus.ERROR
-
         # Signal execution end
         self.socketio.emit(CellEvents.END_RUN, {
             'id': cell_id,
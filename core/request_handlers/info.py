@@ -8,6 +8,9 @@ __author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
 class InfoRequestHandler(tornado.web.RequestHandler):
     """A request handler that returns information on runtime capabilities"""
 
+    def initialize(self, capacity=None):
+        self.capacity = capacity
+
     def get(self):
         return self.write(
             json.dumps({
@@ -15,5 +18,6 @@ class InfoRequestHandler(tornado.web.RequestHandler):
                 "image": "python",
                 "tagRegex": r"^(3.[5-9]+)|latest",
                 "modes": ["interactive", "file", "endpoint"],
-                "languages": ["shell", "python"]
+                "languages": ["shell", "python"],
+                "capacity": self.capacity.report()
             }))
@@ -1,13 +1,14 @@
-import contextlib
+import functools
 from io import StringIO
 
 import tornado.web
 from tornado import gen
-from tornado.ioloop import IOLoop
 
 from core.constants import CellEvents, CellExecutionStatus, CELLS_NAMESPACE
+from core.utils.metrics import PROCESS_DURATION, observe_cell_text
 from core.utils import ProcessRegistryObject, AsyncProcess, LocalSocketIO, \
-    CellEventsSocket
+    CellEventsSocket, CellProfiler
+from core.utils.kernel import capture_output, compile_cell, is_async_cell
 
 
 class InteractiveExecutionRequestHandler(tornado.web.RequestHandler):
@@ -19,18 +20,49 @@ class InteractiveExecutionRequestHandler(tornado.web.RequestHandler):
 
     """
 
-    def initialize(self, socketio=None, console=None, process_registry=None):
+    def initialize(self,
+                   socketio=None,
+                   console=None,
+                   process_registry=None,
+                   kernel=None,
+                   scheduler=None):
         self.console = console
         self.socketio = socketio
         self.process_registry = process_registry
+        self.kernel = kernel
+        self.scheduler = scheduler
+
+    def run_cell(self, code, out, err, profiler=None):
+        """Run python code in the console namespace
+
+        Cells that await at the top level run on the kernel loop, and a future
+        resolving when they are done is returned. Other cells run right away.
+        Only synchronous cells are profiled.
+        """
+        compiled = compile_cell(code)
+        if is_async_cell(compiled):
+            return self.kernel.run_cell(self.console, compiled, out, err)
+        if profiler:
+            profiler.runcall(self.console.runcode, compiled)
+        else:
+            self.console.runcode(compiled)
 
     @gen.coroutine
-    def execute_interactive(self, code, cell_id, channel):
-        """Execute the code provided in cell with specified id"""
+    def execute_interactive(self, code, cell_id, channel, profile=False):
+        """Execute the code provided in cell with specified id
+
+        When profile is set, the cell runs under a profiler and a table of
+        hotspots is emitted as a separate cell event. Cells that failed to
+        compile or await at the top level are not profiled and get no table
+        """
         # Execute code and on receiving input/output pipe them to server using
         # callback_url
         out = StringIO()
         err = StringIO()
+        profiler = None
+        if profile:
+            profiler = CellProfiler(
+                limit=self.application.config.PROFILE_TOP_N)
 
         # Let notebook know cell is busy
         self.socketio.emit(CellEvents.START_RUN, {
@@ -41,19 +73,21 @@ class InteractiveExecutionRequestHandler(tornado.web.RequestHandler):
                            namespace=CELLS_NAMESPACE)
 
         status = CellExecutionStatus.DONE
-        try:
-            with contextlib.redirect_stdout(out), contextlib.redirect_stderr(
-                    err):
-                yield self.console.runcode(code)
-        except SyntaxError:
-            self.console.showsyntaxerror()
-            status = CellExecutionStatus.ERROR
-        except:
-            self.console.showtraceback()
-            status = CellExecutionStatus.ERROR
+        # Output is captured per coroutine, so concurrent cells may yield
+        with capture_output(out,
+                            err), PROCESS_DURATION.time(mode='interactive'):
+            try:
+                yield self.run_cell(code, out, err, profiler=profiler)
+            except SyntaxError:
+                self.console.showsyntaxerror()
+                status = CellExecutionStatus.ERROR
+            except:
+                self.console.showtraceback()
+                status = CellExecutionStatus.ERROR
 
         out = out.getvalue()
         err = err.getvalue()
+        observe_cell_text('interactive', out, err)
         res = {'id': cell_id}
         if err and len(err):
             res['error'] = err
@@ -66,6 +100,14 @@ class InteractiveExecutionRequestHandler(tornado.web.RequestHandler):
                            room=channel,
                            namespace=CELLS_NAMESPACE)
 
+        if profiler and profiler.ran:
+            self.socketio.emit(CellEvents.PROFILE, {
+                'id': cell_id,
+                'profile': profiler.hotspots()
+            },
+                               room=channel,
+                               namespace=CELLS_NAMESPACE)
+
         if err and len(err):
             status = CellExecutionStatus.ERROR
 
@@ -88,13 +130,12 @@ class InteractiveExecutionRequestHandler(tornado.web.RequestHandler):
         # Let notebook know cell is busy
         cell_socket.start()
 
-        # Create a process registry object if it does not exist
+        # Kill the process and children of an earlier run, which may belong
+        # to another worker
         pro = self.process_registry.get_process_info(cell_id)
-        if pro is None:
-            pro = ProcessRegistryObject(self.process_registry, cell_id=cell_id)
-        else:
-            # Kill process and children
+        if pro is not None:
             yield pro.kill()
+        pro = ProcessRegistryObject(self.process_registry, cell_id=cell_id)
 
         # Start process
         yield AsyncProcess(pro,
@@ -102,24 +143,76 @@ class InteractiveExecutionRequestHandler(tornado.web.RequestHandler):
                            stderr_cb=cell_socket.stderr,
                            done_cb=cell_socket.done).start('/bin/bash', code)
 
+    def cell_socket(self, cell_id, channel):
+        return CellEventsSocket(
+            LocalSocketIO(self.socketio,
+                          namespace=CELLS_NAMESPACE,
+                          channel=channel), cell_id)
+
+    @gen.coroutine
+    def schedule_shell(self, code, cell_id, channel):
+        """Queue a shell cell behind earlier cells of the same channel
+
+        A re-run replaces the queued copy of the cell, or kills its running
+        process, so that it does not wait behind the run it supersedes.
+        """
+        self.scheduler.cancel(cell_id)
+        pro = self.process_registry.get_process_info(cell_id)
+        if pro is not None:
+            yield pro.kill()
+
+        cell_socket = self.cell_socket(cell_id, channel)
+        self.scheduler.submit(channel,
+                              cell_id,
+                              functools.partial(self.execute_shell, code,
+                                                cell_id, channel),
+                              on_queued=cell_socket.queued,
+                              on_dequeued=cell_socket.dequeued)
+
     @gen.coroutine
-    def execute_code(self, language, cell_id, channel, code):
+    def execute_code(self, language, cell_id, channel, code, profile=False):
+        self.application.drain.reject_if_draining()
         if language == 'shell':
-            IOLoop.current().spawn_callback(self.execute_shell, code, cell_id,
-                                            channel)
+            yield self.schedule_shell(code, cell_id, channel)
             self.write('Ok')
         else:
             # For console, we do not have process streams and we try synchronous
             # code execution
-            yield self.execute_interactive(code, cell_id, channel)
+            yield self.execute_interactive(code,
+                                           cell_id,
+                                           channel,
+                                           profile=profile)
             self.write('Ok')
 
+    def profile_requested(self):
+        """Whether profiling was requested with the profile query argument"""
+        return self.get_query_argument('profile', 'false').lower() == 'true'
+
     def get(self):
         code = self.get_query_argument('code')
         language = self.get_query_argument('language')
         channel = self.get_query_argument('channel')
         cell_id = self.get_query_argument('cellId')
-        return self.execute_code(language, cell_id, channel, code)
+        return self.execute_code(language,
+                                 cell_id,
+                                 channel,
+                                 code,
+                                 profile=self.profile_requested())
+
+    @gen.coroutine
+    def delete(self):
+        """Cancel a queued cell, or the running process of a cell"""
+        cell_id = self.get_query_argument('cellId')
+        channel = self.scheduler.cancel(cell_id)
+        if channel is not None:
+            self.cell_socket(cell_id, channel).cancelled()
+            return self.write('Ok')
+        pro = self.process_registry.get_process_info(cell_id)
+        if pro is None:
+            raise tornado.web.HTTPError(
+                404, 'No running process for cell {}'.format(cell_id))
+        yield pro.kill()
+        self.write('Ok')
 
     def post(self):
         language = self.get_query_argument('language')
@@ -127,4 +220,9 @@ class InteractiveExecutionRequestHandler(tornado.web.RequestHandler):
         code = data['code']
         channel = data['channel']
         cell_id = data['cellId']
-        return self.execute_code(language, cell_id, channel, code)
+        profile = data.get('profile', False) or self.profile_requested()
+        return self.execute_code(language,
+                                 cell_id,
+                                 channel,
+                                 code,
+                                 profile=profile)
@@ -0,0 +1,21 @@
+# coding: utf8
+import tornado.web
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    """A request handler that exposes runtime metrics in the Prometheus text
+    format"""
+
+    def initialize(self, registry=None):
+        """
+        Parameters
+        ----------
+        registry: MetricsRegistry
+            The registry holding the metrics to render
+        """
+        self.registry = registry
+
+    def get(self):
+        self.set_header('Content-Type',
+                        'text/plain; version=0.0.4; charset=utf-8')
+        return self.write(self.registry.render())
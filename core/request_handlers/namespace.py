@@ -0,0 +1,112 @@
+# coding: utf8
+import json
+
+import tornado.web
+from tornado.ioloop import IOLoop
+
+from core.utils.snapshot import snapshot_namespace, restore_namespace, \
+    read_manifest
+
+
+class NamespaceHandler(tornado.web.RequestHandler):
+    """Summaries of the variables in the interactive python namespace
+
+    Without a path, a page of the variables is returned. Each `path` argument
+    is a name or key one level further into a container, and a page of the
+    children of the value at the path is returned.
+    """
+
+    def initialize(self, console=None, inspector=None):
+        """
+        Parameters
+        ----------
+        console: code.InteractiveConsole
+            The console whose locals are inspected
+
+        inspector: NamespaceInspector
+            Builds the summaries
+        """
+        self.console = console
+        self.inspector = inspector
+
+    def get_page_argument(self, name, default):
+        try:
+            value = int(self.get_argument(name, default))
+        except ValueError:
+            value = -1
+        if value < 0:
+            raise tornado.web.HTTPError(
+                400, reason='{} must be a non-negative integer'.format(name))
+        return value
+
+    def get(self):
+        path = self.get_arguments('path')
+        offset = self.get_page_argument('offset', 0)
+        limit = min(self.get_page_argument('limit', 100),
+                    self.application.config.INSPECTOR_MAX_LIMIT)
+
+        namespace = self.console.locals
+        if not path:
+            page = self.inspector.list(namespace, offset=offset, limit=limit)
+        else:
+            try:
+                page = self.inspector.expand(namespace,
+                                             path,
+                                             offset=offset,
+                                             limit=limit)
+            except KeyError:
+                raise tornado.web.HTTPError(
+                    404, reason='Nothing to expand at {}'.format(path))
+        page['path'] = path
+        self.set_header('Content-Type', 'application/json')
+        return self.write(json.dumps(page))
+
+
+class NamespaceSnapshotHandler(tornado.web.RequestHandler):
+    """Snapshots of the interactive python namespace
+
+    A POST writes a snapshot of the namespace, replacing the previous one, and
+    a POST to `restore` loads the snapshot back into the namespace. A GET
+    returns the manifest of the snapshot, with the size of every variable.
+    """
+
+    def initialize(self, console=None, snapshot_dir=None):
+        """
+        Parameters
+        ----------
+        console: code.InteractiveConsole
+            The console whose locals are saved and restored
+
+        snapshot_dir: str
+            The directory holding the snapshot
+        """
+        self.console = console
+        self.snapshot_dir = snapshot_dir
+
+    def write_json(self, data):
+        self.set_header('Content-Type', 'application/json')
+        return self.write(json.dumps(data))
+
+    def get(self, action=None):
+        if action is not None:
+            raise tornado.web.HTTPError(405)
+        manifest = read_manifest(self.snapshot_dir)
+        if manifest is None:
+            raise tornado.web.HTTPError(404, reason='No snapshot')
+        return self.write_json(manifest)
+
+    async def post(self, action=None):
+        # Pickling and loading large variables takes a while, and python
+        # cells keep running meanwhile
+        if action == 'restore':
+            report = await IOLoop.current().run_in_executor(
+                None, restore_namespace, self.console.locals,
+                self.snapshot_dir)
+            if report is None:
+                raise tornado.web.HTTPError(404, reason='No snapshot')
+            return self.write_json(report)
+        threshold = self.application.config.SNAPSHOT_ARRAY_THRESHOLD_BYTES
+        manifest = await IOLoop.current().run_in_executor(
+            None, snapshot_namespace, self.console.locals, self.snapshot_dir,
+            threshold)
+        return self.write_json(manifest)
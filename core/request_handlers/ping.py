@@ -1,6 +1,10 @@
 # coding: utf8
+import json
+
 import tornado.web
 
+from core.utils import startup_report
+
 __author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
 
 
@@ -8,4 +12,30 @@ class PingHandler(tornado.web.RequestHandler):
     """A request handler for health status checks"""
 
     def get(self):
+        # Load balancers stop sending work once the runtime drains
+        if self.application.drain.draining:
+            raise tornado.web.HTTPError(503, reason='Runtime is shutting down')
         return self.write('pong')
+
+    def on_finish(self):
+        # The first answered ping marks the end of startup
+        if self.get_status() == 200:
+            startup_report.mark_ready()
+
+
+class ReadyHandler(tornado.web.RequestHandler):
+    """A request handler for readiness checks
+
+    Answers 503 when the runtime is draining or past any of its load limits,
+    with the load figures in the body either way.
+    """
+
+    def initialize(self, capacity=None):
+        self.capacity = capacity
+
+    def get(self):
+        report = self.capacity.report()
+        if not report['ready']:
+            self.set_status(503)
+        self.set_header('Content-Type', 'application/json')
+        return self.write(json.dumps(report))
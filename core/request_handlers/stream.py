@@ -0,0 +1,59 @@
+# coding: utf8
+import json
+
+import tornado.websocket
+from tornado.ioloop import IOLoop
+
+
+class CellStreamHandler(tornado.websocket.WebSocketHandler):
+    """Stream cell events of channels to a websocket client
+
+    Channels are subscribed to with `channel` query arguments on connect, and
+    with `{"action": "subscribe", "channel": ...}` messages later on. Events
+    are sent as `{"event", "namespace", "room", "data"}` JSON messages, where
+    data is the payload emitted over socketio.
+    """
+
+    def initialize(self, hub=None, allowed_origins=None):
+        """
+        Parameters
+        ----------
+        hub: ChannelHub
+            The hub publishing cell events
+
+        allowed_origins: list, optional
+            Origins allowed to connect besides the runtime itself. `*` allows
+            every origin
+        """
+        self.hub = hub
+        self.allowed_origins = allowed_origins or []
+        self.loop = None
+
+    def check_origin(self, origin):
+        if '*' in self.allowed_origins or origin in self.allowed_origins:
+            return True
+        return super().check_origin(origin)
+
+    def open(self):
+        self.loop = IOLoop.current()
+        for channel in self.get_query_arguments('channel'):
+            self.hub.subscribe(channel, self)
+
+    def on_message(self, message):
+        try:
+            data = json.loads(message)
+            action = data['action']
+            channel = data['channel']
+        except (ValueError, TypeError, KeyError):
+            return self.write_message(
+                json.dumps({'error': 'Expected an action and a channel'}))
+        if action == 'subscribe':
+            self.hub.subscribe(channel, self)
+        elif action == 'unsubscribe':
+            self.hub.unsubscribe(channel, self)
+        else:
+            self.write_message(
+                json.dumps({'error': 'Unknown action {}'.format(action)}))
+
+    def on_close(self):
+        self.hub.unsubscribe_all(self)
@@ -0,0 +1,48 @@
+# coding: utf8
+import json
+
+import pytest
+from support.base_test_handler import TestHandlerBase
+
+from core.constants import CellEvents
+
+
+@pytest.mark.handlers
+@pytest.mark.integration
+class TestArtifactHandler(TestHandlerBase):
+
+    def test_large_result_is_downloaded(self):
+        threshold = self.get_app().config.ARTIFACT_THRESHOLD_BYTES
+        resp = self.fetch('/interactive?language=python',
+                          method='POST',
+                          body=json.dumps({
+                              'cellId':
+                              'acid',
+                              'channel':
+                              'artifacts',
+                              'code':
+                              'print("a" * {})'.format(threshold)
+                          }))
+        assert resp.code == 200
+
+        refs = [
+            e['args'] for e in self.socketio._queue if
+            e['event'] == CellEvents.RESULT_REF and e['args']['id'] == 'acid'
+        ]
+        assert len(refs) == 1
+        artifact = refs[0]['artifact']
+        assert refs[0]['field'] == 'output'
+        assert artifact['size'] == threshold + 1
+        assert artifact['preview'] == 'a' * len(artifact['preview'])
+        assert not any(
+            e['event'] == CellEvents.RESULT and e['args']['id'] == 'acid'
+            for e in self.socketio._queue)
+
+        resp = self.fetch('/artifacts/{}'.format(artifact['id']))
+        assert resp.code == 200
+        assert resp.headers['Content-Type'] == artifact['mimeType']
+        assert resp.body == b'a' * threshold + b'\n'
+
+    def test_missing_artifact(self):
+        assert self.fetch('/artifacts/{}'.format('0' * 32)).code == 404
+        assert self.fetch('/artifacts/abc').code == 404
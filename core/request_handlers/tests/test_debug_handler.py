@@ -0,0 +1,45 @@
+# coding: utf8
+import pytest
+import tornado.testing
+from support.base_test_handler import TestHandlerBase
+
+from core.request_handlers import ProfileHandler
+
+
+@pytest.mark.handlers
+@pytest.mark.integration
+class TestProfileHandler(TestHandlerBase):
+
+    def setUp(self):
+        super(TestProfileHandler, self).setUp()
+        app = self.get_app()
+        if not getattr(app, 'has_enabled_profiler', False):
+            app.add_handlers(r'.*', [(r'/enabled-profile/?', ProfileHandler,
+                                      dict(enabled=True, token='secret'))])
+            app.has_enabled_profiler = True
+
+    def test_profile_disabled_by_default(self):
+        resp = self.fetch('/debug/profile?seconds=1',
+                          headers={'Authorization': 'Bearer secret'})
+        assert resp.code == 404
+
+    def test_profile_requires_token(self):
+        assert self.fetch('/enabled-profile').code == 403
+        resp = self.fetch('/enabled-profile',
+                          headers={'Authorization': 'Bearer wrong'})
+        assert resp.code == 403
+        resp = self.fetch('/enabled-profile?seconds=1000',
+                          headers={'Authorization': 'Bearer secret'})
+        assert resp.code == 400
+
+    @tornado.testing.gen_test
+    def test_profile(self):
+        resp = yield self.http_client.fetch(
+            self.get_url('/enabled-profile?seconds=0.2'),
+            headers={'Authorization': 'Bearer secret'})
+        assert resp.code == 200
+        assert resp.headers['Content-Type'].startswith('text/plain')
+        lines = resp.body.decode('utf-8').splitlines()
+        assert lines
+        # The event loop thread is waiting for events while it samples
+        assert any(line.startswith('MainThread;') for line in lines)
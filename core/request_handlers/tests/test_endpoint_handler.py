@@ -2,8 +2,14 @@
 import pytest
 import json
 import os
+import time
 
+import tornado.testing
+from tornado import gen
 from support.base_test_handler import TestHandlerBase
+from support.endpoint import PARSE_ROUTE, ParseStubHandler
+from core.request_handlers import FilesHandler, EndpointExecutionHandler
+from core.utils import EndpointWorkerPool, EndpointRegistry
 
 __author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
 
@@ -174,3 +180,374 @@ class TestEndpointConfigurationHandler(TestHandlerBase):
                                         'name': 'test-endpoint'
                                     },
                                     response=resp)
+
+    def test_endpoint_config_versions(self):
+        def post(path, activate=True):
+            return self.fetch('/endpoint-configs',
+                              method='POST',
+                              body=json.dumps({
+                                  'filePath': 'modules/test.py',
+                                  'activate': activate,
+                                  'config': {
+                                      'name': 'versioned-endpoint',
+                                      'path': path
+                                  }
+                              }))
+
+        resp = post('<str:v1>')
+        assert resp.code == 200
+        first = int(resp.headers['X-Endpoint-Version'])
+        resp = post('<str:v2>', activate=False)
+        assert int(resp.headers['X-Endpoint-Version']) == first + 1
+
+        resp = self.fetch('/endpoint-configs/versioned-endpoint')
+        endpoint = json.loads(resp.body)
+        assert endpoint['activeVersion'] == first
+        assert endpoint['versions'][str(first + 1)]['path'] == '<str:v2>'
+
+        resp = self.fetch('/endpoint-configs/versioned-endpoint',
+                          method='PUT',
+                          body=json.dumps({'version': first + 1}))
+        assert resp.code == 200
+        assert json.loads(resp.body)['activeVersion'] == first + 1
+
+        resp = self.fetch('/endpoint-configs')
+        names = [e['name'] for e in json.loads(resp.body)['endpoints']]
+        assert 'versioned-endpoint' in names
+
+        resp = self.fetch('/endpoint-configs/versioned-endpoint',
+                          method='DELETE')
+        assert resp.code == 200
+        resp = self.fetch('/endpoint-configs/versioned-endpoint')
+        assert resp.code == 404
+        resp = self.fetch('/endpoint-configs/versioned-endpoint',
+                          method='DELETE')
+        assert resp.code == 404
+        resp = self.fetch('/endpoint-runs/versioned-endpoint')
+        assert resp.code == 404
+
+    def test_endpoint_config_invalid_name(self):
+        resp = self.fetch('/endpoint-configs',
+                          method='POST',
+                          body=json.dumps({
+                              'filePath': 'modules/test.py',
+                              'config': {
+                                  'name': '../outside'
+                              }
+                          }))
+        assert resp.code == 400
+
+
+@pytest.mark.handlers
+@pytest.mark.integration
+class TestEndpointExecutionHandler(TestHandlerBase):
+    def setUp(self):
+        super(TestEndpointExecutionHandler, self).setUp()
+        app = self.get_app()
+        if not getattr(app, 'has_parse_stub', False):
+            app.add_handlers(r'.*', [(PARSE_ROUTE, ParseStubHandler)])
+            app.has_parse_stub = True
+        self.server_uri = app.config.SERVER_URI
+        app.config.SERVER_URI = self.get_url('')
+
+        self.target_dir = os.path.join(app.config.FILE_ROOT_DIR,
+                                       'endpoint-tests')
+        os.makedirs(self.target_dir, exist_ok=True)
+        with open(os.path.join(self.target_dir, 'greeting.py'), 'w') as f:
+            f.write('PREFIX = "Hello "\n')
+        with open(os.path.join(self.target_dir, 'greet.py'), 'w') as f:
+            f.write('import time\n'
+                    'from greeting import PREFIX\n\n\n'
+                    'def greet(name, delay="0"):\n'
+                    '    time.sleep(float(delay))\n'
+                    '    return PREFIX + name\n')
+        with open(os.path.join(self.target_dir, 'ticker.py'), 'w') as f:
+            f.write('import sys, time\n\n\n'
+                    'def ticker(n):\n'
+                    '    for i in range(int(n)):\n'
+                    '        print("tick", i)\n'
+                    '        time.sleep(0.2)\n'
+                    '    print("warning", file=sys.stderr)\n'
+                    '    return "done"\n')
+
+    def tearDown(self):
+        self.get_app().config.SERVER_URI = self.server_uri
+        super(TestEndpointExecutionHandler, self).tearDown()
+
+    @gen.coroutine
+    def create_endpoint(self, file_path='endpoint-tests/greet.py', **config):
+        resp = yield self.http_client.fetch(
+            self.get_url('/endpoint-configs'),
+            method='POST',
+            body=json.dumps({
+                'filePath': file_path,
+                'config': {
+                    'name': 'greet-endpoint',
+                    'signature': 'greet(name, delay)',
+                    **config
+                }
+            }))
+        assert resp.code == 200
+
+    @tornado.testing.gen_test
+    def test_endpoint_run(self):
+        yield self.create_endpoint()
+        resp = yield self.http_client.fetch(
+            self.get_url('/endpoint-runs/greet-endpoint?name=World&delay=0'))
+
+        assert resp.code == 200
+        assert resp.body.decode('utf-8') == 'Hello World\n'
+
+    @tornado.testing.gen_test
+    def test_concurrent_endpoint_runs(self):
+        yield self.create_endpoint()
+        responses = yield gen.multi([
+            self.http_client.fetch(
+                self.get_url(
+                    '/endpoint-runs/greet-endpoint?name=n{}&delay=0.3'.format(
+                        i))) for i in range(4)
+        ])
+
+        assert [r.body.decode('utf-8') for r in responses
+                ] == ['Hello n{}\n'.format(i) for i in range(4)]
+        assert not [
+            name for name in os.listdir(self.target_dir)
+            if '--endpoint' in name
+        ]
+
+    @tornado.testing.gen_test
+    def test_endpoint_run_keeps_target_location(self):
+        with open(os.path.join(self.target_dir, 'data.txt'), 'w') as f:
+            f.write('from data')
+        with open(os.path.join(self.target_dir, 'reader.py'), 'w') as f:
+            f.write('import os, sys\n\n\n'
+                    'def read(name):\n'
+                    '    here = os.path.dirname(os.path.abspath(__file__))\n'
+                    '    assert sys.path[0] == here\n'
+                    '    with open(os.path.join(here, name)) as f:\n'
+                    '        return f.read()\n')
+        yield self.create_endpoint(file_path='endpoint-tests/reader.py',
+                                   signature='read(name)')
+        resp = yield self.http_client.fetch(
+            self.get_url('/endpoint-runs/greet-endpoint?name=data.txt'))
+
+        assert resp.body.decode('utf-8') == 'from data\n'
+
+    @tornado.testing.gen_test
+    def test_endpoint_run_invalid_timeout(self):
+        for timeout in ['1', 0, -1, True]:
+            yield self.create_endpoint(timeout=timeout)
+            resp = yield self.http_client.fetch(
+                self.get_url('/endpoint-runs/greet-endpoint?name=a&delay=0'),
+                raise_error=False)
+            assert resp.code == 400
+
+    @tornado.testing.gen_test
+    def test_endpoint_run_timeout(self):
+        yield self.create_endpoint(timeout=0.5)
+        start = time.time()
+        resp = yield self.http_client.fetch(
+            self.get_url('/endpoint-runs/greet-endpoint?name=slow&delay=10'),
+            raise_error=False)
+
+        assert resp.code == 504
+        assert json.loads(resp.body)['error']['code'] == 504
+        assert time.time() - start < 5
+
+    @tornado.testing.gen_test(timeout=30)
+    def test_endpoint_workers_reload_on_file_change(self):
+        app = self.get_app()
+        pool = EndpointWorkerPool(app.config.FILE_ROOT_DIR)
+        registry = EndpointRegistry(app.config.ENDPOINT_CONFIG_ROOT_DIR)
+        app.add_handlers(
+            r'.*', [(r'/pooled-files/?', FilesHandler,
+                     dict(file_path_root=app.config.FILE_ROOT_DIR,
+                          endpoint_workers=pool)),
+                    (r'/pooled-endpoint-runs/(?P<endpoint_name>[\w\-\d]+).*',
+                     EndpointExecutionHandler,
+                     dict(registry=registry,
+                          file_path_root=app.config.FILE_ROOT_DIR,
+                          endpoint_workers=pool))])
+        target = os.path.join(self.target_dir, 'greet.py')
+        url = self.get_url('/pooled-endpoint-runs/greet-endpoint?name=World'
+                           '&delay=0')
+
+        @gen.coroutine
+        def warm():
+            for _ in range(200):
+                if target in pool._generations and not pool._building:
+                    return pool._generations[target]
+                yield gen.sleep(0.05)
+
+        try:
+            yield self.create_endpoint()
+            # Served without workers while the first generation starts
+            resp = yield self.http_client.fetch(url)
+            assert resp.body.decode('utf-8') == 'Hello World\n'
+            first = yield warm()
+            assert 'greeting' in first.zygote.preload
+
+            resp = yield self.http_client.fetch(url)
+            assert resp.body.decode('utf-8') == 'Hello World\n'
+
+            resp = yield self.http_client.fetch(
+                self.get_url('/pooled-files'),
+                method='POST',
+                body=json.dumps({
+                    'filePath': 'endpoint-tests/greeting.py',
+                    'content': 'PREFIX = "Hi "\n'
+                }))
+            assert resp.code == 200
+            second = yield warm()
+            assert second is not first and first.retired
+
+            resp = yield self.http_client.fetch(url)
+            assert resp.body.decode('utf-8') == 'Hi World\n'
+        finally:
+            pool.close()
+
+    @tornado.testing.gen_test
+    def test_endpoint_batch_run(self):
+        yield self.create_endpoint(batchParallelism=2)
+        items = [{'name': 'n{}'.format(i), 'delay': 0} for i in range(5)]
+        # Missing a variable of the signature
+        items.append({'name': 'broken'})
+
+        resp = yield self.http_client.fetch(
+            self.get_url('/endpoint-batch-runs/greet-endpoint'),
+            method='POST',
+            body=json.dumps(items))
+
+        assert resp.code == 200
+        results = json.loads(resp.body)['results']
+        assert results[:5] == [{
+            'output': 'Hello n{}'.format(i)
+        } for i in range(5)]
+        assert "NameError: name 'delay' is not defined" in results[5]['error']
+
+    @tornado.testing.gen_test
+    def test_endpoint_batch_run_signature_scopes(self):
+        yield self.create_endpoint(
+            signature='[greet(n, delay) for n in name.split(",")]')
+
+        resp = yield self.http_client.fetch(
+            self.get_url('/endpoint-batch-runs/greet-endpoint'),
+            method='POST',
+            body=json.dumps([{
+                'name': 'a,b',
+                'delay': 0
+            }]))
+
+        assert json.loads(resp.body)['results'] == [{
+            'output': ['Hello a', 'Hello b']
+        }]
+
+    @tornado.testing.gen_test
+    def test_endpoint_batch_run_target_error(self):
+        yield self.create_endpoint()
+        with open(os.path.join(self.target_dir, 'greet.py'), 'a') as f:
+            f.write('raise RuntimeError("broken target")\n')
+
+        resp = yield self.http_client.fetch(
+            self.get_url('/endpoint-batch-runs/greet-endpoint'),
+            method='POST',
+            body=json.dumps([{
+                'name': 'a',
+                'delay': 0
+            }, {
+                'name': 'b',
+                'delay': 0
+            }]))
+
+        results = json.loads(resp.body)['results']
+        assert len(results) == 2
+        assert all('broken target' in r['error'] for r in results)
+
+    @tornado.testing.gen_test
+    def test_endpoint_batch_run_invalid_body(self):
+        yield self.create_endpoint()
+        resp = yield self.http_client.fetch(
+            self.get_url('/endpoint-batch-runs/greet-endpoint'),
+            method='POST',
+            body=json.dumps({'name': 'a'}),
+            raise_error=False)
+
+        assert resp.code == 400
+
+    @tornado.testing.gen_test
+    def test_endpoint_batch_run_empty(self):
+        yield self.create_endpoint(batchParallelism=2)
+        resp = yield self.http_client.fetch(
+            self.get_url('/endpoint-batch-runs/greet-endpoint'),
+            method='POST',
+            body='[]')
+
+        assert resp.code == 200
+        assert json.loads(resp.body) == {'results': []}
+
+    @tornado.testing.gen_test
+    def test_endpoint_batch_run_invalid_parallelism(self):
+        for parallelism in ['2', 0, True]:
+            yield self.create_endpoint(batchParallelism=parallelism)
+            resp = yield self.http_client.fetch(
+                self.get_url('/endpoint-batch-runs/greet-endpoint'),
+                method='POST',
+                body=json.dumps([{
+                    'name': 'a',
+                    'delay': 0
+                }]),
+                raise_error=False)
+            assert resp.code == 400
+
+    @tornado.testing.gen_test
+    def test_endpoint_run_chunked_stream(self):
+        yield self.create_endpoint(file_path='endpoint-tests/ticker.py',
+                                   signature='ticker(n)',
+                                   stream='chunked')
+        first_chunk_at = []
+
+        def on_chunk(chunk):
+            if not first_chunk_at:
+                first_chunk_at.append(time.time())
+            chunks.append(chunk)
+
+        chunks = []
+        resp = yield self.http_client.fetch(
+            self.get_url('/endpoint-runs/greet-endpoint?n=5'),
+            streaming_callback=on_chunk)
+
+        assert resp.code == 200
+        assert resp.headers['Content-Type'] == 'application/x-ndjson'
+        # Output arrives while the endpoint is still running
+        assert time.time() - first_chunk_at[0] > 0.4
+        events = [
+            json.loads(line)
+            for line in b''.join(chunks).decode('utf-8').splitlines()
+        ]
+        assert events[:-1] == [{
+            'event': 'output',
+            'data': line
+        } for line in ['tick {}'.format(i) for i in range(5)] + ['done']]
+        assert events[-1] == {
+            'event': 'status',
+            'data': {
+                'status': 'error',
+                'returncode': 0,
+                'error': 'warning\n'
+            }
+        }
+
+    @tornado.testing.gen_test
+    def test_endpoint_run_sse_stream_timeout(self):
+        yield self.create_endpoint(file_path='endpoint-tests/ticker.py',
+                                   signature='ticker(n)',
+                                   stream='sse',
+                                   timeout=0.5)
+        resp = yield self.http_client.fetch(
+            self.get_url('/endpoint-runs/greet-endpoint?n=50'))
+
+        assert resp.headers['Content-Type'] == 'text/event-stream'
+        body = resp.body.decode('utf-8')
+        assert body.startswith('event: output\ndata: "tick 0"\n\n')
+        status = body.split('event: status\ndata: ')[1]
+        assert json.loads(status)['status'] == 'timeout'
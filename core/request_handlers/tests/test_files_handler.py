@@ -1,6 +1,9 @@
+import hashlib
 import pytest
 import json
 import os
+import signal
+import uuid
 
 from support.base_test_handler import TestHandlerBase
 
@@ -10,6 +13,7 @@ from core.constants import CellEvents, CellExecutionStatus, CELLS_NAMESPACE
 @pytest.mark.handlers
 @pytest.mark.integration
 class TestFilesHandler(TestHandlerBase):
+
     def assert_file_and_remove(self,
                                file_path,
                                content=None,
@@ -168,10 +172,105 @@ class TestFilesHandler(TestHandlerBase):
 
         assert resp.code == 404
 
+    def test_conditional_file_fetch(self):
+        resp = self.fetch('/files',
+                          method='POST',
+                          body=json.dumps({
+                              'filePath': 'modules/test.py',
+                              'content': 'print("Hello")'
+                          }))
+        assert resp.code == 200
+
+        resp = self.fetch('/files/modules%2Ftest.py')
+        etag = resp.headers['Etag']
+        last_modified = resp.headers['Last-Modified']
+        assert resp.code == 200
+        assert resp.body == b'print("Hello")'
+
+        resp = self.fetch('/files/modules%2Ftest.py',
+                          headers={'If-None-Match': etag})
+        assert resp.code == 304
+        assert resp.body == b''
+        assert resp.headers['Etag'] == etag
+
+        resp = self.fetch('/files/modules%2Ftest.py',
+                          headers={'If-Modified-Since': last_modified})
+        assert resp.code == 304
+
+        # Files changed outside of the handler get a new tag
+        full_path = os.path.join(self.get_app().config.FILE_ROOT_DIR,
+                                 'modules/test.py')
+        with open(full_path, 'w') as f:
+            f.write('print("World")')
+        resp = self.fetch('/files/modules%2Ftest.py',
+                          headers={'If-None-Match': etag})
+        assert resp.code == 200
+        assert resp.body == b'print("World")'
+        assert resp.headers['Etag'] != etag
+        self.assert_file_and_remove('modules/test.py')
+
+    def create_files(self, files):
+        for path, content in files.items():
+            resp = self.fetch('/files',
+                              method='POST',
+                              body=json.dumps({
+                                  'filePath': path,
+                                  'content': content
+                              }))
+            assert resp.code == 200
+
+    def test_listing_files(self):
+        self.create_files(
+            dict(('listing-tests/{}.py'.format(i), 'print({})'.format(i))
+                 for i in range(5)))
+
+        resp = self.fetch('/files?list=listing-tests&offset=1&limit=2')
+        assert resp.code == 200
+        listing = json.loads(resp.body)
+        assert listing['total'] == 5
+        assert (listing['offset'], listing['limit']) == (1, 2)
+        assert [f['path'] for f in listing['files']
+                ] == ['listing-tests/1.py', 'listing-tests/2.py']
+        assert listing['files'][0]['size'] == len('print(1)')
+
+        assert self.fetch('/files?list=listing-tests&limit=-1').code == 400
+        assert self.fetch('/files?list=missing-dir').code == 404
+
+    def test_file_tree_diff(self):
+        self.create_files({
+            'diff-tests/same.py': 'same',
+            'diff-tests/changed.py': 'new',
+            'diff-tests/added.py': 'added'
+        })
+
+        def sha(content):
+            return hashlib.sha256(content).hexdigest()
+
+        hashes = {
+            'diff-tests/same.py': sha(b'same'),
+            'diff-tests/changed.py': sha(b'old'),
+            'diff-tests/removed.py': sha(b'removed')
+        }
+        resp = self.fetch('/file-diffs?directory=diff-tests',
+                          method='POST',
+                          body=json.dumps(hashes))
+        assert resp.code == 200
+        assert json.loads(resp.body) == {
+            'added': ['diff-tests/added.py'],
+            'changed': ['diff-tests/changed.py'],
+            'removed': ['diff-tests/removed.py']
+        }
+
+        resp = self.fetch('/file-diffs',
+                          method='POST',
+                          body=json.dumps(['diff-tests/same.py']))
+        assert resp.code == 400
+
 
 @pytest.mark.integration
 @pytest.mark.handlers
 class TestFileExecutionHandler(TestHandlerBase):
+
     def test_missing_args(self):
         resp = self.fetch('/file-runs/', method='POST', body=json.dumps({}))
         assert resp.code == 400
@@ -302,3 +401,81 @@ class TestFileExecutionHandler(TestHandlerBase):
                                         room='channel',
                                         namespace=CELLS_NAMESPACE)
         os.unlink(file_path)
+
+    def test_file_run_cache(self):
+        app = self.get_app()
+        file_path = os.path.join(app.config.FILE_ROOT_DIR,
+                                 'modules/cached_run.py')
+
+        # Unique content so entries of earlier test runs do not match
+        source = '# {}\nimport time\nprint(time.time())'.format(uuid.uuid4())
+        with open(file_path, 'w') as f:
+            f.write(source)
+
+        def run():
+            self.socketio._queue = []
+            resp = self.fetch('/file-runs/',
+                              method='POST',
+                              body=json.dumps({
+                                  'cellId': 'cid',
+                                  'channel': 'channel',
+                                  'filePath': 'modules/cached_run.py',
+                                  'cache': True
+                              }))
+            assert resp.code == 200
+            assert self.socketio.find_event(CellEvents.END_RUN, {
+                'id': 'cid',
+                'status': CellExecutionStatus.DONE
+            },
+                                            room='channel',
+                                            namespace=CELLS_NAMESPACE)
+            return [
+                e['args'] for e in self.socketio._queue
+                if e['event'] == CellEvents.RESULT
+            ][0]
+
+        first = run()
+        second = run()
+
+        assert 'cached' not in first
+        assert second['cached'] is True
+        assert second['output'] == first['output']
+
+        # Changing the file invalidates the entry
+        with open(file_path, 'w') as f:
+            f.write(source + ' or 1')
+
+        third = run()
+        assert 'cached' not in third
+        assert third['output'] != first['output']
+        os.unlink(file_path)
+
+    def test_file_run_cache_skips_killed_runs(self):
+        app = self.get_app()
+        file_path = os.path.join(app.config.FILE_ROOT_DIR,
+                                 'modules/killed_run.py')
+
+        # Unique content so entries of earlier test runs do not match
+        source = '# {}\nimport os, signal\nos.kill(os.getpid(), {})'.format(
+            uuid.uuid4(), int(signal.SIGKILL))
+        with open(file_path, 'w') as f:
+            f.write(source)
+        body = json.dumps({
+            'cellId': 'cid',
+            'channel': 'channel',
+            'filePath': 'modules/killed_run.py',
+            'cache': True
+        })
+
+        for _ in range(2):
+            self.socketio._queue = []
+            resp = self.fetch('/file-runs/', method='POST', body=body)
+            assert resp.code == 200
+            result = [
+                e['args'] for e in self.socketio._queue
+                if e['event'] == CellEvents.RESULT
+            ][0]
+            assert 'cached' not in result
+            assert result['error'] == 'Killed by signal {}\n'.format(
+                int(signal.SIGKILL))
+        os.unlink(file_path)
@@ -13,13 +13,15 @@ class TestInfoHandler(TestHandlerBase):
     def test_info(self):
         resp = self.fetch('/info')
         assert resp.code == 200
-        assert resp.body.decode('utf-8') == json.dumps({
-            "name":
-            "python-runtime",
-            "image":
-            "python",
-            "tagRegex":
-            "^(3.[5-9]+)|latest",
+        info = json.loads(resp.body.decode('utf-8'))
+        capacity = info.pop('capacity')
+        assert info == {
+            "name": "python-runtime",
+            "image": "python",
+            "tagRegex": "^(3.[5-9]+)|latest",
             "modes": ["interactive", "file", "endpoint"],
             "languages": ["shell", "python"]
-        })
+        }
+        assert capacity['processes'] == 0
+        assert capacity['queueDepth'] == 0
+        assert 'loopLag' in capacity and 'memoryAvailable' in capacity
@@ -1,15 +1,26 @@
 import pytest
 import json
+import os
+import signal
+import subprocess
+import tempfile
+import time
 
 import tornado.testing
+from tornado import gen
 from support.base_test_handler import TestHandlerBase
 
+from core.app import make_app
 from core.constants import CellEvents, CellExecutionStatus, CELLS_NAMESPACE
+from core.utils import LoopLagMonitor, LoopWatchdog, ProcessRegistryObject, \
+    SharedProcessRegistry
+from core.utils.kernel import _cell_streams, TOP_LEVEL_AWAIT
 
 
 @pytest.mark.handlers
 @pytest.mark.integration
 class TestInteractiveRequestHandler(TestHandlerBase):
+
     @tornado.testing.gen_test
     def test_interactive_shell_run(self):
         resp = yield self.http_client.fetch(
@@ -156,3 +167,389 @@ class TestInteractiveRequestHandler(TestHandlerBase):
         },
                                         room='channel',
                                         namespace=CELLS_NAMESPACE)
+
+    def test_interactive_cell_run_profile(self):
+        resp = self.fetch('/interactive?language=python&profile=true',
+                          method='POST',
+                          body=json.dumps({
+                              'cellId':
+                              'pcid',
+                              'channel':
+                              'channel',
+                              'code':
+                              'sum(i * i for i in range(1000))'
+                          }),
+                          follow_redirects=False)
+
+        assert resp.code == 200
+        assert self.socketio.has_event(CellEvents.PROFILE)
+        event = [
+            e for e in self.socketio._queue if e['event'] == CellEvents.PROFILE
+        ][0]
+        assert event['args']['id'] == 'pcid'
+        assert event['kwargs'] == {
+            'room': 'channel',
+            'namespace': CELLS_NAMESPACE
+        }
+        profile = event['args']['profile']
+        assert len(profile['cumulative']) > 0
+        assert any(row['function'].endswith('(<genexpr>)')
+                   for row in profile['cumulative'])
+        assert self.socketio.find_event(CellEvents.END_RUN, {
+            'id': 'pcid',
+            'status': CellExecutionStatus.DONE
+        },
+                                        room='channel',
+                                        namespace=CELLS_NAMESPACE)
+
+    def profiled_cell(self, cell_id, code):
+        body = json.dumps({
+            'cellId': cell_id,
+            'channel': 'channel',
+            'code': code
+        })
+        return self.fetch('/interactive?language=python&profile=true',
+                          method='POST',
+                          body=body)
+
+    def test_interactive_cell_profile_syntax_error(self):
+        resp = self.profiled_cell('psyntax', 'x = (')
+
+        assert resp.code == 200
+        assert not self.socketio.has_event(CellEvents.PROFILE)
+        assert self.socketio.find_event(CellEvents.END_RUN, {
+            'id': 'psyntax',
+            'status': CellExecutionStatus.ERROR
+        },
+                                        room='channel',
+                                        namespace=CELLS_NAMESPACE)
+
+    @pytest.mark.skipif(not TOP_LEVEL_AWAIT, reason='Needs Python 3.8')
+    def test_interactive_cell_profile_await(self):
+        resp = self.profiled_cell('pawait',
+                                  'import asyncio\nawait asyncio.sleep(0)')
+
+        assert resp.code == 200
+        assert not self.socketio.has_event(CellEvents.PROFILE)
+        assert self.socketio.find_event(CellEvents.END_RUN, {
+            'id': 'pawait',
+            'status': CellExecutionStatus.DONE
+        },
+                                        room='channel',
+                                        namespace=CELLS_NAMESPACE)
+
+    def test_interactive_cell_run_without_profile(self):
+        resp = self.fetch('/interactive?language=python',
+                          method='POST',
+                          body=json.dumps({
+                              'cellId': 'cellId',
+                              'channel': 'channel',
+                              'code': 'x = 1'
+                          }),
+                          follow_redirects=False)
+
+        assert resp.code == 200
+        assert not self.socketio.has_event(CellEvents.PROFILE)
+
+    @tornado.testing.gen_test
+    def test_concurrent_interactive_cells_restore_stdout(self):
+        responses = yield gen.multi([
+            self.http_client.fetch(
+                self.get_url('/interactive?language=python'),
+                method='POST',
+                body=json.dumps({
+                    'cellId': 'cid{}'.format(i),
+                    'channel': 'channel',
+                    'code': 'print({})'.format(i)
+                })) for i in range(4)
+        ])
+
+        assert all(r.code == 200 for r in responses)
+        # Output of the cells is not captured outside of them
+        assert _cell_streams.get() is None
+        for i in range(4):
+            assert self.socketio.find_event(CellEvents.RESULT, {
+                'id': 'cid{}'.format(i),
+                'output': '{}\n'.format(i)
+            },
+                                            room='channel',
+                                            namespace=CELLS_NAMESPACE)
+
+    @tornado.testing.gen_test
+    def test_interactive_shell_cancel(self):
+        resp = yield self.http_client.fetch(
+            self.get_url('/interactive?language=shell'),
+            method='POST',
+            body=json.dumps({
+                'cellId': 'cancelcid',
+                'channel': 'channel',
+                'code': 'sleep 10'
+            }))
+        assert resp.code == 200
+
+        # Wait for the process to be registered
+        yield gen.sleep(0.2)
+
+        resp = yield self.http_client.fetch(
+            self.get_url('/interactive?cellId=cancelcid'), method='DELETE')
+        assert resp.code == 200
+
+        r = yield self.socketio.find_event_async(
+            CellEvents.END_RUN, {
+                'id': 'cancelcid',
+                'status': CellExecutionStatus.ERROR
+            },
+            room='channel',
+            namespace=CELLS_NAMESPACE)
+        assert r is True
+
+    @tornado.testing.gen_test
+    def test_interactive_shell_cells_run_in_order(self):
+        responses = yield gen.multi([
+            self.http_client.fetch(self.get_url('/interactive?language=shell'),
+                                   method='POST',
+                                   body=json.dumps({
+                                       'cellId':
+                                       'ocid{}'.format(i),
+                                       'channel':
+                                       'ordered',
+                                       'code':
+                                       'sleep 0.1; echo {}'.format(i)
+                                   })) for i in range(3)
+        ])
+        assert all(r.code == 200 for r in responses)
+
+        r = yield self.socketio.find_event_async(
+            CellEvents.END_RUN, {
+                'id': 'ocid2',
+                'status': CellExecutionStatus.DONE
+            },
+            room='ordered',
+            namespace=CELLS_NAMESPACE)
+        assert r is True
+
+        events = [(e['event'], e['args']['id']) for e in self.socketio._queue
+                  if e['kwargs']['room'] == 'ordered']
+        assert [cid for event, cid in events
+                if event == CellEvents.END_RUN] == ['ocid0', 'ocid1', 'ocid2']
+        assert (CellEvents.QUEUED, 'ocid2') in events
+        assert events.index((CellEvents.DEQUEUED, 'ocid1')) > events.index(
+            (CellEvents.END_RUN, 'ocid0'))
+
+    def shell_cell(self, cell_id, channel, code):
+        return self.http_client.fetch(
+            self.get_url('/interactive?language=shell'),
+            method='POST',
+            body=json.dumps({
+                'cellId': cell_id,
+                'channel': channel,
+                'code': code
+            }))
+
+    def channel_events(self, channel):
+        return [(e['event'], e['args']['id'], e['args'].get('status'))
+                for e in self.socketio._queue
+                if e['kwargs']['room'] == channel]
+
+    @tornado.testing.gen_test
+    def test_interactive_shell_rerun_kills_running_copy(self):
+        resp = yield self.shell_cell('rerun', 'rerun', 'sleep 10')
+        assert resp.code == 200
+        # Wait for the process to be registered
+        yield gen.sleep(0.2)
+
+        start = time.time()
+        resp = yield self.shell_cell('rerun', 'rerun', 'echo again')
+        assert resp.code == 200
+        r = yield self.socketio.find_event_async(
+            CellEvents.END_RUN, {
+                'id': 'rerun',
+                'status': CellExecutionStatus.DONE
+            },
+            room='rerun',
+            namespace=CELLS_NAMESPACE)
+        assert r is True
+        assert time.time() - start < 5
+
+        ends = [
+            e for e in self.channel_events('rerun')
+            if e[0] == CellEvents.END_RUN
+        ]
+        assert ends == [
+            (CellEvents.END_RUN, 'rerun', CellExecutionStatus.ERROR),
+            (CellEvents.END_RUN, 'rerun', CellExecutionStatus.DONE)
+        ]
+
+    @tornado.testing.gen_test
+    def test_interactive_cancel_queued_cell(self):
+        yield self.shell_cell('running', 'queue-cancel', 'sleep 10')
+        yield self.shell_cell('waiting', 'queue-cancel', 'echo never')
+
+        resp = yield self.http_client.fetch(
+            self.get_url('/interactive?cellId=waiting'), method='DELETE')
+        assert resp.code == 200
+        events = self.channel_events('queue-cancel')
+        assert [e for e in events if e[1] == 'waiting'] == [
+            (CellEvents.QUEUED, 'waiting', None),
+            (CellEvents.START_RUN, 'waiting', CellExecutionStatus.BUSY),
+            (CellEvents.END_RUN, 'waiting', CellExecutionStatus.ERROR)
+        ]
+
+        # Wait for the process to be registered, then stop it
+        yield gen.sleep(0.2)
+        yield self.http_client.fetch(
+            self.get_url('/interactive?cellId=running'), method='DELETE')
+
+    def test_interactive_cancel_unknown_cell(self):
+        resp = self.fetch('/interactive?cellId=unknown', method='DELETE')
+        assert resp.code == 404
+
+    @pytest.mark.skipif(not TOP_LEVEL_AWAIT, reason='Needs Python 3.8')
+    def test_interactive_cell_top_level_await(self):
+        resp = self.fetch('/interactive?language=python',
+                          method='POST',
+                          body=json.dumps({
+                              'cellId':
+                              'acid',
+                              'channel':
+                              'channel',
+                              'code':
+                              'import asyncio\n'
+                              'await asyncio.sleep(0.01)\n'
+                              'awaited = True\n'
+                              'print("done")'
+                          }),
+                          follow_redirects=False)
+
+        assert resp.code == 200
+        assert self.socketio.find_event(CellEvents.RESULT, {
+            'id': 'acid',
+            'output': 'done\n'
+        },
+                                        room='channel',
+                                        namespace=CELLS_NAMESPACE)
+        assert self.socketio.find_event(CellEvents.END_RUN, {
+            'id': 'acid',
+            'status': CellExecutionStatus.DONE
+        },
+                                        room='channel',
+                                        namespace=CELLS_NAMESPACE)
+
+    @pytest.mark.skipif(not TOP_LEVEL_AWAIT, reason='Needs Python 3.8')
+    def test_interactive_cell_top_level_await_error(self):
+        resp = self.fetch('/interactive?language=python',
+                          method='POST',
+                          body=json.dumps({
+                              'cellId':
+                              'aecid',
+                              'channel':
+                              'channel',
+                              'code':
+                              'import asyncio\n'
+                              'await asyncio.sleep(0)\n'
+                              'raise ValueError("async boom")'
+                          }),
+                          follow_redirects=False)
+
+        assert resp.code == 200
+        event = [
+            e for e in self.socketio._queue if e['event'] == CellEvents.RESULT
+        ][0]
+        assert event['args']['error'].endswith('ValueError: async boom\n')
+        assert self.socketio.find_event(CellEvents.END_RUN, {
+            'id': 'aecid',
+            'status': CellExecutionStatus.ERROR
+        },
+                                        room='channel',
+                                        namespace=CELLS_NAMESPACE)
+
+    @pytest.mark.skipif(not TOP_LEVEL_AWAIT, reason='Needs Python 3.8')
+    @tornado.testing.gen_test
+    def test_async_cells_run_concurrently(self):
+        start = time.time()
+        responses = yield gen.multi([
+            self.http_client.fetch(
+                self.get_url('/interactive?language=python'),
+                method='POST',
+                body=json.dumps({
+                    'cellId':
+                    'ccid{}'.format(i),
+                    'channel':
+                    'channel',
+                    'code':
+                    'import asyncio\n'
+                    'await asyncio.sleep(0.5)\n'
+                    'print({})'.format(i)
+                })) for i in range(4)
+        ])
+
+        assert all(r.code == 200 for r in responses)
+        assert time.time() - start < 1.5
+        for i in range(4):
+            assert self.socketio.find_event(CellEvents.RESULT, {
+                'id': 'ccid{}'.format(i),
+                'output': '{}\n'.format(i)
+            },
+                                            room='channel',
+                                            namespace=CELLS_NAMESPACE)
+
+    def test_blocking_cell_detected_by_watchdog(self):
+        monitor = LoopLagMonitor(interval=0.02)
+        watchdog = LoopWatchdog(monitor, threshold=0.1)
+        body = json.dumps({
+            'cellId': 'blocking',
+            'channel': 'watchdog',
+            'code': 'import time; time.sleep(0.5)'
+        })
+        monitor.start()
+        watchdog.start()
+        try:
+            resp = self.fetch('/interactive?language=python',
+                              method='POST',
+                              body=body)
+            assert resp.code == 200
+        finally:
+            watchdog.stop()
+            monitor.stop()
+
+        stall = watchdog.last_stall
+        assert stall['handler'] == 'InteractiveExecutionRequestHandler'
+        assert stall['route'] == 'POST /interactive'
+        assert stall['cellId'] == 'blocking'
+        assert 'execute_interactive' in stall['stack']
+
+
+@pytest.mark.handlers
+@pytest.mark.integration
+class TestInteractiveSharedRegistry(TestHandlerBase):
+    """Shell cells of a worker sharing its process registry with another"""
+
+    def get_app(self):
+        path = os.path.join(tempfile.mkdtemp(), 'registry.db')
+        self.other_worker = SharedProcessRegistry(path, worker_id=0)
+        registry = SharedProcessRegistry(path, worker_id=1)
+        return make_app(process_registry=registry)
+
+    @tornado.testing.gen_test
+    def test_interactive_shell_rerun_kills_other_worker_copy(self):
+        process = subprocess.Popen(['sleep', '10'])
+        ProcessRegistryObject(self.other_worker, 'shared').register(process)
+
+        resp = yield self.http_client.fetch(
+            self.get_url('/interactive?language=shell'),
+            method='POST',
+            body=json.dumps({
+                'cellId': 'shared',
+                'channel': 'shared',
+                'code': 'echo again'
+            }))
+        assert resp.code == 200
+        r = yield self.socketio.find_event_async(
+            CellEvents.END_RUN, {
+                'id': 'shared',
+                'status': CellExecutionStatus.DONE
+            },
+            room='shared',
+            namespace=CELLS_NAMESPACE)
+        assert r is True
+        assert process.wait(timeout=5) == -signal.SIGKILL
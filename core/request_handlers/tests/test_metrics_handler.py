@@ -0,0 +1,20 @@
+# coding: utf8
+import pytest
+
+from support.base_test_handler import TestHandlerBase
+
+
+@pytest.mark.handlers
+@pytest.mark.integration
+class TestMetricsHandler(TestHandlerBase):
+
+    def test_metrics(self):
+        self.fetch('/ping')
+        resp = self.fetch('/metrics')
+        assert resp.code == 200
+        assert resp.headers['Content-Type'].startswith('text/plain')
+
+        body = resp.body.decode('utf-8')
+        assert 'runtime_process_registry_size 0' in body
+        assert 'runtime_request_duration_seconds_count{route="PingHandler",' \
+               'method="GET",code="200"}' in body
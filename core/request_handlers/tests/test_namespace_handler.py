@@ -0,0 +1,42 @@
+# coding: utf8
+import json
+
+import pytest
+from support.base_test_handler import TestHandlerBase
+
+
+@pytest.mark.handlers
+@pytest.mark.integration
+class TestNamespaceHandler(TestHandlerBase):
+
+    def test_namespace_inspection(self):
+        resp = self.fetch('/interactive?language=python',
+                          method='POST',
+                          body=json.dumps({
+                              'cellId':
+                              'ncid',
+                              'channel':
+                              'namespace',
+                              'code':
+                              'inspected = {"rows": list(range(500))}'
+                          }))
+        assert resp.code == 200
+
+        resp = self.fetch('/namespace?limit=500')
+        assert resp.code == 200
+        page = json.loads(resp.body)
+        assert page['path'] == []
+        variable = next(v for v in page['items'] if v['name'] == 'inspected')
+        assert variable['type'] == 'dict'
+        assert variable['length'] == 1
+        assert variable['expandable']
+
+        resp = self.fetch(
+            '/namespace?path=inspected&path=rows&offset=100&limit=2')
+        assert resp.code == 200
+        page = json.loads(resp.body)
+        assert page['total'] == 500
+        assert [v['preview'] for v in page['items']] == ['100', '101']
+
+        assert self.fetch('/namespace?path=inspected&path=missing').code == 404
+        assert self.fetch('/namespace?offset=x').code == 400
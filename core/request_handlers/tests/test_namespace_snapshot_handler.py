@@ -0,0 +1,41 @@
+# coding: utf8
+import json
+import shutil
+
+import pytest
+from support.base_test_handler import TestHandlerBase
+
+
+@pytest.mark.handlers
+@pytest.mark.integration
+class TestNamespaceSnapshotHandler(TestHandlerBase):
+
+    def test_namespace_snapshot_and_restore(self):
+        shutil.rmtree(self.get_app().snapshot_dir, ignore_errors=True)
+        assert self.fetch('/namespace/snapshot').code == 404
+        assert self.fetch('/namespace/snapshot/restore',
+                          method='POST',
+                          body='').code == 404
+
+        console = self.get_app().console
+        console.locals['snapshotted'] = {'rows': [1, 2, 3]}
+        console.locals['unpicklable'] = lambda: None
+
+        resp = self.fetch('/namespace/snapshot', method='POST', body='')
+        assert resp.code == 200
+        manifest = json.loads(resp.body)
+        names = [v['name'] for v in manifest['variables']]
+        assert 'snapshotted' in names
+        assert 'unpicklable' in [w['name'] for w in manifest['warnings']]
+        assert json.loads(
+            self.fetch('/namespace/snapshot').body)['variables'] == \
+            manifest['variables']
+
+        del console.locals['snapshotted']
+        resp = self.fetch('/namespace/snapshot/restore',
+                          method='POST',
+                          body='')
+        assert resp.code == 200
+        assert 'snapshotted' in json.loads(resp.body)['restored']
+        assert console.locals['snapshotted'] == {'rows': [1, 2, 3]}
+        del console.locals['unpicklable']
@@ -1,15 +1,49 @@
 # coding: utf8
+import json
+
 import pytest
 
 from support.base_test_handler import TestHandlerBase
 
+from core.utils import startup_report
+
 __author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
 
 
 @pytest.mark.handlers
 @pytest.mark.integration
 class TestPingHandler(TestHandlerBase):
+
     def test_ping(self):
         resp = self.fetch('/ping')
         assert resp.code == 200
         assert resp.body == b'pong'
+
+    def test_ping_marks_startup_ready(self):
+        resp = self.fetch('/ping')
+        assert resp.code == 200
+        assert startup_report.ready_at is not None
+
+    def test_ready(self):
+        resp = self.fetch('/ready')
+        report = json.loads(resp.body)
+        assert resp.code == (200 if report['ready'] else 503)
+        assert 'draining' not in report['reasons']
+        assert report['processes'] == 0
+
+    def test_ping_while_draining(self):
+        self.get_app().drain.draining = True
+        try:
+            assert self.fetch('/ping').code == 503
+            resp = self.fetch('/ready')
+            assert resp.code == 503
+            assert 'draining' in json.loads(resp.body)['reasons']
+            resp = self.fetch('/interactive?language=python',
+                              method='POST',
+                              body='{"cellId": "d", "channel": "d", '
+                              '"code": "1"}')
+            assert resp.code == 503
+            assert self.fetch('/file-runs', method='POST',
+                              body='{}').code == 503
+        finally:
+            self.get_app().drain.draining = False
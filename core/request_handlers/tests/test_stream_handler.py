@@ -0,0 +1,82 @@
+import json
+
+import pytest
+import tornado.testing
+from tornado.websocket import websocket_connect
+from support.base_test_handler import TestHandlerBase
+
+from core.constants import CellEvents, CellExecutionStatus, CELLS_NAMESPACE
+
+
+@pytest.mark.handlers
+@pytest.mark.integration
+class TestCellStreamHandler(TestHandlerBase):
+
+    def get_ws_url(self, path):
+        return self.get_url(path).replace('http://', 'ws://')
+
+    @tornado.testing.gen_test
+    def test_stream_receives_cell_events(self):
+        conn = yield websocket_connect(
+            self.get_ws_url('/cell-stream?channel=streamed'))
+
+        resp = yield self.http_client.fetch(
+            self.get_url('/interactive?language=python'),
+            method='POST',
+            body=json.dumps({
+                'cellId': 'scid',
+                'channel': 'streamed',
+                'code': 'print("streamed")'
+            }))
+        assert resp.code == 200
+
+        messages = []
+        while not messages or messages[-1]['event'] != CellEvents.END_RUN:
+            messages.append(json.loads((yield conn.read_message())))
+
+        assert [m['event'] for m in messages] == [
+            CellEvents.START_RUN, CellEvents.RESULT, CellEvents.END_RUN
+        ]
+        assert messages[1] == {
+            'event': CellEvents.RESULT,
+            'namespace': CELLS_NAMESPACE,
+            'room': 'streamed',
+            'data': {
+                'id': 'scid',
+                'output': 'streamed\n'
+            }
+        }
+        assert messages[2]['data']['status'] == CellExecutionStatus.DONE
+        # Events are still relayed over socketio
+        assert self.socketio.find_event(CellEvents.RESULT, {
+            'id': 'scid',
+            'output': 'streamed\n'
+        },
+                                        room='streamed',
+                                        namespace=CELLS_NAMESPACE)
+        conn.close()
+
+    @tornado.testing.gen_test
+    def test_stream_subscribe_message(self):
+        conn = yield websocket_connect(self.get_ws_url('/cell-stream'))
+        yield conn.write_message(
+            json.dumps({
+                'action': 'subscribe',
+                'channel': 'later'
+            }))
+        yield conn.write_message('not json')
+        error = json.loads((yield conn.read_message()))
+        assert 'error' in error
+
+        yield self.http_client.fetch(
+            self.get_url('/interactive?language=python'),
+            method='POST',
+            body=json.dumps({
+                'cellId': 'lcid',
+                'channel': 'later',
+                'code': 'x = 1'
+            }))
+        message = json.loads((yield conn.read_message()))
+        assert message['event'] == CellEvents.START_RUN
+        assert message['data']['id'] == 'lcid'
+        conn.close()
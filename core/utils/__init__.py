@@ -1,4 +1,25 @@
-from .file_utils import create_temporary_shell_file, secure_relative_file_path
+from .file_utils import create_temporary_shell_file, secure_relative_file_path, \
+    find_local_imports, find_external_imports
 from .process import AsyncProcess
-from .process_registry import ProcessRegistry, ProcessRegistryObject
-from .socket import LocalSocketIO, CellEventsSocket
+from .process_registry import ProcessRegistry, ProcessRegistryObject, \
+    SharedProcessRegistry
+from .socket import LocalSocketIO, CellEventsSocket, InstrumentedSocketIO, \
+    LazySocketIO
+from .metrics import metrics
+from .profiling import CellProfiler
+from .startup import startup_report
+from .run_cache import RunCache
+from .zygote import Zygote, ZygoteError, ZygoteRunLost, run_python_file
+from .kernel import KernelLoop
+from .scheduler import CellScheduler
+from .stream import ChannelHub, StreamingSocketIO
+from .endpoint_registry import EndpointRegistry
+from .endpoint_workers import EndpointWorkerPool
+from .file_index import FileIndex, FileEntry
+from .artifacts import ArtifactStore, OffloadingSocketIO
+from .inspector import NamespaceInspector
+from .snapshot import snapshot_namespace, restore_namespace
+from .drain import Drain
+from .capacity import Capacity, LoopLagMonitor
+from .watchdog import LoopWatchdog
+from .sampler import sample_stacks
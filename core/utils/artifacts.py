@@ -0,0 +1,189 @@
+# coding: utf8
+"""
+Storage for large cell results, which are sent to clients as references.
+
+Results above a size threshold are written to the artifact store instead of
+being emitted inline over the message queue. Clients receive a small event
+with the id, size, MIME type and a preview of the result, and download the
+content from the runtime when they need it.
+"""
+import base64
+import binascii
+import json
+import os
+import re
+import threading
+import uuid
+
+from core.constants import CellEvents
+from core.utils.metrics import ARTIFACTS_OFFLOADED
+
+# Artifact ids, as they appear in download routes
+ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+# Results that are images encoded as data URIs
+DATA_URI_PATTERN = re.compile(r'^data:([\w.+\-]+/[\w.+\-]+);base64,')
+
+
+class ArtifactStore:
+    """Files holding large results, with their metadata.
+
+    Each artifact is a content file named by its id and a `<id>.json` file
+    with its metadata. The oldest artifacts are removed once the total size
+    exceeds the limit.
+    """
+
+    def __init__(self, root, max_bytes=1024 * 1024 * 1024):
+        """
+        Parameters
+        ----------
+        root: str
+            The directory artifacts are stored in
+
+        max_bytes: int
+            The maximum total size of all artifacts
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def _path(self, artifact_id):
+        return os.path.join(self.root, artifact_id)
+
+    def put(self, content, mime_type):
+        """Store content as a new artifact
+
+        Parameters
+        ----------
+        content: bytes
+            The content of the artifact
+
+        mime_type: str
+            The MIME type the artifact is served with
+
+        Returns
+        -------
+        dict
+            The metadata of the artifact: id, size and mimeType
+        """
+        os.makedirs(self.root, exist_ok=True)
+        meta = {
+            'id': uuid.uuid4().hex,
+            'size': len(content),
+            'mimeType': mime_type
+        }
+        path = self._path(meta['id'])
+        with open(path, 'wb') as f:
+            f.write(content)
+        # Written last, an artifact exists once its metadata does
+        with open(path + '.json', 'w') as f:
+            f.write(json.dumps(meta))
+        self._evict()
+        return meta
+
+    def get(self, artifact_id):
+        """The metadata of an artifact, or None"""
+        if not ID_PATTERN.match(artifact_id):
+            return None
+        try:
+            with open(self._path(artifact_id) + '.json', 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def open(self, artifact_id):
+        """Open the content of an artifact for reading in binary mode"""
+        return open(self._path(artifact_id), 'rb')
+
+    def _evict(self):
+        with self._lock:
+            artifacts = []
+            for name in os.listdir(self.root):
+                if ID_PATTERN.match(name):
+                    try:
+                        st = os.stat(self._path(name))
+                    except OSError:
+                        continue
+                    artifacts.append((st.st_mtime_ns, st.st_size, name))
+            total = sum(size for _, size, _ in artifacts)
+            for _, size, name in sorted(artifacts):
+                if total <= self.max_bytes:
+                    break
+                for path in [self._path(name) + '.json', self._path(name)]:
+                    try:
+                        os.unlink(path)
+                    except OSError:
+                        pass
+                total -= size
+
+
+def _encode(text):
+    """The content and MIME type to store a result as"""
+    match = DATA_URI_PATTERN.match(text)
+    if match is not None:
+        try:
+            return base64.b64decode(text[match.end():],
+                                    validate=True), match.group(1)
+        except (binascii.Error, ValueError):
+            pass
+    return text.encode('utf-8'), 'text/plain; charset=utf-8'
+
+
+class OffloadingSocketIO:
+    """Moves large cell results to the artifact store.
+
+    Outputs and errors of `CellEvents.RESULT` events above the threshold are
+    stored as artifacts and emitted as `CellEvents.RESULT_REF` events instead.
+    Other events, and the small fields of a result, are emitted as they are.
+    """
+
+    def __init__(self, socketio, store, threshold, preview_chars=1000):
+        """
+        Parameters
+        ----------
+        socketio: object
+            The socketio emitter events are relayed to
+
+        store: ArtifactStore
+            Where large results are stored
+
+        threshold: int
+            Results larger than this many bytes are offloaded. None disables
+            offloading
+
+        preview_chars: int
+            The number of characters of a text result sent with its reference
+        """
+        self.socketio = socketio
+        self.store = store
+        self.threshold = threshold
+        self.preview_chars = preview_chars
+
+    def emit(self, event, args, **kwargs):
+        if event != CellEvents.RESULT or self.threshold is None:
+            return self.socketio.emit(event, args, **kwargs)
+
+        inline = dict(args)
+        offloaded = False
+        for field in ('output', 'error'):
+            text = inline.get(field)
+            # Texts with more characters than the threshold are over it in
+            # bytes too, without encoding them
+            if not text or len(text) <= self.threshold and len(
+                    text.encode('utf-8')) <= self.threshold:
+                continue
+            content, mime_type = _encode(text)
+            del inline[field]
+            offloaded = True
+            artifact = self.store.put(content, mime_type)
+            artifact['preview'] = text[:self.preview_chars] \
+                if mime_type.startswith('text/') else None
+            ARTIFACTS_OFFLOADED.inc(field=field)
+            self.socketio.emit(CellEvents.RESULT_REF, {
+                'id': args.get('id'),
+                'field': field,
+                'artifact': artifact
+            }, **kwargs)
+
+        if not offloaded or set(inline) - {'id'}:
+            return self.socketio.emit(event, inline, **kwargs)
@@ -0,0 +1,146 @@
+# coding: utf8
+"""
+Live capacity of the runtime, used to decide whether it is ready for work.
+
+The runtime reports itself as not ready while it drains, or when any of the
+running processes, queued cells, event loop lag, CPU usage or available
+memory is past its threshold. Load balancers can then route notebooks to
+runtimes that have room.
+"""
+import time
+
+from tornado.ioloop import PeriodicCallback
+
+from core.utils.metrics import LOOP_LAG
+
+
+class LoopLagMonitor:
+    """Measures how late a periodic timer on the event loop fires"""
+
+    def __init__(self, interval=0.5):
+        """
+        Parameters
+        ----------
+        interval: float
+            Seconds between timer ticks
+        """
+        self.interval = interval
+        self._lag = 0.0
+        self._last_tick = None
+        self._callback = PeriodicCallback(self._tick, interval * 1000)
+
+    def start(self):
+        """Start the timer. Must be called on the IOLoop thread"""
+        self._last_tick = time.monotonic()
+        self._callback.start()
+
+    def stop(self):
+        self._callback.stop()
+
+    def _tick(self):
+        now = time.monotonic()
+        self._lag = max(0.0, now - self._last_tick - self.interval)
+        self._last_tick = now
+        LOOP_LAG.set(self._lag)
+
+    @property
+    def last_tick(self):
+        """Monotonic time of the last tick, None until started"""
+        return self._last_tick
+
+    @property
+    def lag(self):
+        """Seconds the last tick was late, or is late by while stalled"""
+        if self._last_tick is None:
+            return 0.0
+        overdue = time.monotonic() - self._last_tick - self.interval
+        return max(self._lag, overdue, 0.0)
+
+
+def _system_usage():
+    """CPU usage in percent since the last call, and virtual memory stats"""
+    # psutil is imported on first use to keep startup fast
+    import psutil
+    return psutil.cpu_percent(interval=None), psutil.virtual_memory()
+
+
+class Capacity:
+    """Reports the load of the runtime against readiness thresholds"""
+
+    def __init__(self,
+                 process_registry,
+                 scheduler,
+                 lag_monitor,
+                 drain,
+                 max_processes=None,
+                 max_queue_depth=None,
+                 max_loop_lag=None,
+                 max_cpu_percent=None,
+                 min_memory_available=None):
+        """
+        Parameters
+        ----------
+        process_registry: ProcessRegistry
+            The registry of running processes
+
+        scheduler: CellScheduler
+            The scheduler of shell cells
+
+        lag_monitor: LoopLagMonitor
+            Measures the event loop lag
+
+        drain: Drain
+            Whether the runtime is shutting down
+
+        max_processes, max_queue_depth, max_loop_lag, max_cpu_percent: number
+            Limits above which the runtime is not ready. None disables a limit
+
+        min_memory_available: int
+            Bytes of available memory below which the runtime is not ready
+        """
+        self.process_registry = process_registry
+        self.scheduler = scheduler
+        self.lag_monitor = lag_monitor
+        self.drain = drain
+        self.max_processes = max_processes
+        self.max_queue_depth = max_queue_depth
+        self.max_loop_lag = max_loop_lag
+        self.max_cpu_percent = max_cpu_percent
+        self.min_memory_available = min_memory_available
+
+    def report(self):
+        """The current load, and whether the runtime is ready
+
+        Returns
+        -------
+        dict
+            The load figures, `ready`, and the `reasons` the runtime is not
+        """
+        cpu_percent, memory = _system_usage()
+        report = {
+            'processes': len(self.process_registry),
+            'queueDepth': len(self.scheduler),
+            'runningCells': self.scheduler.running,
+            'loopLag': self.lag_monitor.lag,
+            'cpuPercent': cpu_percent,
+            'memoryAvailable': memory.available,
+            'memoryTotal': memory.total
+        }
+
+        reasons = []
+        if self.drain.draining:
+            reasons.append('draining')
+        limits = [('processes', self.max_processes),
+                  ('queueDepth', self.max_queue_depth),
+                  ('loopLag', self.max_loop_lag),
+                  ('cpuPercent', self.max_cpu_percent)]
+        for key, limit in limits:
+            if limit is not None and report[key] > limit:
+                reasons.append(key)
+        if self.min_memory_available is not None and \
+                memory.available < self.min_memory_available:
+            reasons.append('memoryAvailable')
+
+        report['ready'] = not reasons
+        report['reasons'] = reasons
+        return report
@@ -0,0 +1,133 @@
+# coding: utf8
+"""
+Draining of in-flight cells before the runtime shuts down.
+
+Once a drain starts, new executions are refused and the runtime reports
+itself as not ready, so that load balancers stop routing notebooks to it.
+Cells waiting in the scheduler are cancelled. Running processes get until a
+deadline to finish, after which their process trees are killed. Killed cells
+end with an error status like any other failed run.
+
+Shell cells are found in the process registry. File and endpoint runs are not
+registered there, their handlers track them with `Drain.tracking` instead.
+"""
+import asyncio
+import os
+import signal
+import time
+from contextlib import contextmanager
+
+import tornado.web
+from tornado.log import app_log
+
+from core.constants import CELLS_NAMESPACE
+from core.utils.socket import LocalSocketIO, CellEventsSocket
+
+
+class Drain:
+    """Tracks whether the runtime is shutting down, and drains it"""
+
+    def __init__(self, process_registry, scheduler, socketio):
+        """
+        Parameters
+        ----------
+        process_registry: ProcessRegistry
+            The registry of running processes
+
+        scheduler: CellScheduler
+            The scheduler of shell cells
+
+        socketio: object
+            The socketio emitter cell events are sent with
+        """
+        self.process_registry = process_registry
+        self.scheduler = scheduler
+        self.socketio = socketio
+        self.draining = False
+        # Process group of each file and endpoint run in flight, None until
+        # the run reports its pid
+        self._runs = {}
+
+    def __len__(self):
+        """The number of file and endpoint runs in flight"""
+        return len(self._runs)
+
+    @contextmanager
+    def tracking(self):
+        """Track a file or endpoint run for as long as the block runs.
+
+        Yields a callback to call with the pid of the run once it started.
+        The run must lead its own process group. The callback may be called
+        from another thread.
+        """
+        token = object()
+        self._runs[token] = None
+
+        def on_start(pid):
+            if token in self._runs:
+                self._runs[token] = pid
+
+        try:
+            yield on_start
+        finally:
+            del self._runs[token]
+
+    def reject_if_draining(self):
+        """Raise a 503 for new executions once the drain has started"""
+        if self.draining:
+            raise tornado.web.HTTPError(503, reason='Runtime is shutting down')
+
+    def _idle(self):
+        return len(self.process_registry) == 0 and \
+            self.scheduler.running == 0 and not self._runs
+
+    async def _wait_idle(self, deadline, interval):
+        while not self._idle() and time.monotonic() < deadline:
+            await asyncio.sleep(interval)
+
+    async def run(self, timeout, kill_timeout=5, interval=0.1):
+        """Drain the runtime. Must be called on the IOLoop thread.
+
+        Parameters
+        ----------
+        timeout: float
+            Seconds running processes get to finish before they are killed
+
+        kill_timeout: float
+            Seconds waited for killed cells to report their end
+
+        Returns
+        -------
+        int
+            The number of processes and process groups that were killed
+        """
+        self.draining = True
+
+        for cell_id, channel in self.scheduler.cancel_all():
+            CellEventsSocket(
+                LocalSocketIO(self.socketio,
+                              namespace=CELLS_NAMESPACE,
+                              channel=channel), cell_id).cancelled()
+
+        await self._wait_idle(time.monotonic() + timeout, interval)
+
+        # Only processes owned by this worker, other workers drain their own
+        remaining = list(self.process_registry)
+        for pro in remaining:
+            app_log.warning('Killing cell %s after the drain deadline',
+                            pro.cell_id)
+            try:
+                await pro.kill()
+            except ProcessLookupError:
+                pass
+        groups = [pid for pid in list(self._runs.values()) if pid is not None]
+        for pid in groups:
+            app_log.warning('Killing run %s after the drain deadline', pid)
+            try:
+                os.killpg(pid, signal.SIGKILL)
+            except OSError:
+                pass
+        # The runs of killed processes emit their END_RUN error, and their
+        # requests are answered
+        await self._wait_idle(time.monotonic() + kill_timeout, interval)
+        return len(remaining) + len(groups)
@@ -0,0 +1,57 @@
+# coding: utf8
+"""
+Runs an endpoint for a batch of argument sets in a single process.
+
+The target file is executed once. Its signature expression is then evaluated
+for every argument set, with the arguments bound as global variables. Results are
+written as JSON to a file, so output printed by the target can not corrupt
+them.
+
+Usage: python endpoint_batch.py <target> <signature> <items.json> <results.json>
+
+Only depends on the standard library, as it runs in the interpreter of the
+endpoint rather than the runtime.
+"""
+import json
+import os
+import runpy
+import sys
+import traceback
+
+
+def _jsonable(value):
+    """The value if it can be sent as JSON, else its string form"""
+    try:
+        json.dumps(value)
+        return value
+    except (TypeError, ValueError):
+        return str(value)
+
+
+def main(target, signature, items_path, results_path):
+    # Resolve imports next to the target, not next to this script
+    sys.path[0] = os.path.dirname(os.path.abspath(target))
+
+    with open(items_path, 'r') as f:
+        items = json.load(f)
+
+    namespace = runpy.run_path(target, run_name='__main__')
+    code = compile(signature, '<signature>', 'eval')
+
+    results = []
+    for args in items:
+        # Arguments are globals, as in single runs, so that comprehensions
+        # and lambdas of the signature see them
+        scope = dict(namespace)
+        scope.update(args)
+        try:
+            results.append({'output': _jsonable(eval(code, scope))})
+        except Exception:
+            results.append({'error': traceback.format_exc()})
+
+    with open(results_path, 'w') as f:
+        json.dump(results, f)
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:5])
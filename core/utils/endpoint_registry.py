@@ -0,0 +1,220 @@
+# coding: utf8
+"""
+Versioned endpoint configurations, stored in an append-only log.
+
+Every change to an endpoint is a JSON line appended to the log: a new version
+of its config, the activation of a version, or its deletion. The log is
+replayed into an in-memory index, so finding the active config of an endpoint
+is a dictionary lookup. Workers sharing the log pick up each other's changes
+by reading the lines appended since they last looked.
+
+The active config of each endpoint is also written to `<name>.config`, where
+endpoint configurations were stored before the registry existed.
+"""
+import fcntl
+import glob
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+# Endpoint names, as they appear in endpoint routes
+NAME_PATTERN = re.compile(r'^[\w\-]+$')
+
+
+class EndpointRegistry:
+    """Index of endpoint configurations and their versions"""
+
+    def __init__(self, root, log_name='endpoints.log', refresh_interval=1.0):
+        """
+        Parameters
+        ----------
+        root: str
+            The directory holding the log and the `<name>.config` files
+
+        log_name: str
+            The file name of the log within root
+
+        refresh_interval: float
+            Seconds between checks for changes made by other processes
+        """
+        self.root = root
+        self.log_path = os.path.join(root, log_name)
+        self.refresh_interval = refresh_interval
+
+        # name -> {version: config}
+        self._versions = {}
+        # name -> active version
+        self._active_versions = {}
+        # name -> active config
+        self._active = {}
+        self._offset = 0
+        self._checked_at = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(root, exist_ok=True)
+        with self._locked_log():
+            if self._offset == 0 and os.path.getsize(self.log_path) == 0:
+                self._import_config_files()
+
+    @contextmanager
+    def _locked_log(self):
+        """Hold the log exclusively, with the index brought up to date"""
+        with self._lock, open(self.log_path, 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                self._read_log()
+                yield f
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _import_config_files(self):
+        """Register endpoints stored as loose config files before the log"""
+        for path in sorted(glob.glob(os.path.join(self.root, '*.config'))):
+            name = os.path.basename(path)[:-len('.config')]
+            try:
+                with open(path, 'r') as f:
+                    config = json.load(f)
+            except ValueError:
+                continue
+            self._append({'op': 'put', 'name': name, 'config': config})
+            self._append({'op': 'activate', 'name': name, 'version': 1})
+
+    def _read_log(self):
+        """Apply the complete lines appended to the log since the last read"""
+        with open(self.log_path, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read()
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            if line.strip():
+                self._apply(json.loads(line.decode('utf-8')))
+        self._offset += end
+        self._checked_at = time.monotonic()
+
+    def _append(self, record):
+        """Append a record to the log and apply it. The log must be held"""
+        line = (json.dumps(record, sort_keys=True) + '\n').encode('utf-8')
+        with open(self.log_path, 'ab') as f:
+            f.write(line)
+        self._apply(record)
+        self._offset += len(line)
+
+    def _apply(self, record):
+        name = record['name']
+        op = record['op']
+        if op == 'put':
+            versions = self._versions.setdefault(name, {})
+            versions[len(versions) + 1] = record['config']
+        elif op == 'activate':
+            self._active_versions[name] = record['version']
+            self._active[name] = self._versions[name][record['version']]
+        elif op == 'delete':
+            self._versions.pop(name, None)
+            self._active_versions.pop(name, None)
+            self._active.pop(name, None)
+
+    def _refresh(self, force=False):
+        if not force and \
+                time.monotonic() - self._checked_at < self.refresh_interval:
+            return
+        with self._lock:
+            if os.path.getsize(self.log_path) != self._offset:
+                self._read_log()
+            self._checked_at = time.monotonic()
+
+    def _write_config_file(self, name):
+        config = self._active.get(name)
+        path = os.path.join(self.root, '{}.config'.format(name))
+        if config is None:
+            if os.path.exists(path):
+                os.unlink(path)
+            return
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            f.write(json.dumps(config, sort_keys=True))
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def validate_name(name):
+        if not isinstance(name, str) or not NAME_PATTERN.match(name):
+            raise ValueError(
+                'Endpoint names may only contain letters, digits, _ and -')
+
+    def get(self, name):
+        """The active config of an endpoint, or None.
+
+        The returned config is shared and must not be modified.
+        """
+        self._refresh()
+        config = self._active.get(name)
+        if config is None:
+            # Created by another worker since the last refresh
+            self._refresh(force=True)
+            config = self._active.get(name)
+        return config
+
+    def put(self, config, activate=True):
+        """Add a new version of an endpoint config.
+
+        Returns
+        -------
+        int
+            The new version
+        """
+        name = config['name']
+        self.validate_name(name)
+        with self._locked_log():
+            self._append({'op': 'put', 'name': name, 'config': config})
+            version = len(self._versions[name])
+            if activate:
+                self._append({
+                    'op': 'activate',
+                    'name': name,
+                    'version': version
+                })
+                self._write_config_file(name)
+        return version
+
+    def activate(self, name, version):
+        """Make a version of an endpoint the one that serves requests"""
+        with self._locked_log():
+            if version not in self._versions.get(name, {}):
+                raise KeyError('{} has no version {}'.format(name, version))
+            self._append({'op': 'activate', 'name': name, 'version': version})
+            self._write_config_file(name)
+
+    def delete(self, name):
+        """Remove an endpoint and all its versions"""
+        with self._locked_log():
+            if name not in self._versions:
+                raise KeyError(name)
+            self._append({'op': 'delete', 'name': name})
+            self._write_config_file(name)
+
+    def describe(self, name):
+        """The versions of an endpoint and which one is active, or None"""
+        self._refresh(force=True)
+        versions = self._versions.get(name)
+        if versions is None:
+            return None
+        return {
+            'name': name,
+            'activeVersion': self._active_versions.get(name),
+            'versions': {
+                str(v): c
+                for v, c in versions.items()
+            }
+        }
+
+    def list(self):
+        """Summaries of all endpoints, sorted by name"""
+        self._refresh(force=True)
+        return [{
+            'name': name,
+            'activeVersion': self._active_versions.get(name),
+            'versions': len(versions),
+            'filePath': (self._active.get(name) or {}).get('filePath')
+        } for name, versions in sorted(self._versions.items())]
@@ -0,0 +1,226 @@
+# coding: utf8
+"""
+Zygotes dedicated to endpoint targets, reloaded when their sources change.
+
+Each endpoint target is served by a generation of workers: a zygote that has
+preloaded the modules the target imports, installed packages as well as local
+modules. Runs of the endpoint fork from it and skip those imports. As local
+modules are preloaded, a generation is stale once one of its files changes.
+
+Files are polled for changes of their modification time and size, confirmed
+by comparing their contents. A change starts a new generation in the
+background. Runs keep forking from the old generation until the new one has
+preloaded its modules, then new runs switch over at once. The old zygote is
+stopped when the last run it took has finished.
+"""
+import hashlib
+import importlib.util
+import os
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from tornado.ioloop import IOLoop
+from tornado.log import app_log
+
+from .file_utils import find_local_imports, find_external_imports
+from .metrics import ENDPOINT_WORKER_RELOADS
+from .zygote import Zygote
+
+
+def _stat(files):
+    """Modification times and sizes of files, None for missing files"""
+    stats = []
+    for path in files:
+        try:
+            st = os.stat(path)
+            stats.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            stats.append(None)
+    return stats
+
+
+def _digest(files):
+    """A hash of the contents of files"""
+    h = hashlib.sha256()
+    for path in files:
+        try:
+            with open(path, 'rb') as f:
+                h.update(hashlib.sha256(f.read()).digest())
+        except OSError:
+            h.update(b'missing')
+    return h.hexdigest()
+
+
+def _remove_bytecode(files):
+    """Remove cached bytecode of files.
+
+    Bytecode is only checked against the modification time in seconds and
+    the size of its source, which quick edits can leave unchanged.
+    """
+    for path in files:
+        try:
+            os.unlink(importlib.util.cache_from_source(path))
+        except OSError:
+            pass
+
+
+def _module_name(path, search_paths):
+    """The name a local file is imported by"""
+    for base in search_paths:
+        rel = os.path.relpath(path, base)
+        if not rel.startswith(os.pardir):
+            parts = os.path.splitext(rel)[0].split(os.sep)
+            if parts[-1] == '__init__':
+                parts.pop()
+            return '.'.join(parts)
+
+
+class _Generation:
+    """A zygote for a target, with the state of the files it preloaded"""
+
+    def __init__(self, zygote, files, stats, digest):
+        self.zygote = zygote
+        self.files = files
+        self.stats = stats
+        self.digest = digest
+        # Number of runs currently handed this generation
+        self.leases = 0
+        self.retired = False
+
+
+class EndpointWorkerPool:
+    """Warm zygotes per endpoint target, swapped when their sources change.
+
+    The pool is only used from the IOLoop thread. Zygotes are started and
+    stopped on the default executor.
+    """
+
+    def __init__(self, root, preload=None, max_targets=16):
+        """
+        Parameters
+        ----------
+        root: str
+            The root directory of local modules
+
+        preload: list, optional
+            Modules preloaded for every target, on top of those it imports
+
+        max_targets: int
+            Number of targets with a zygote. The least recently used target
+            loses its zygote when another one is added
+        """
+        self.root = root
+        self.preload = list(preload or [])
+        self.max_targets = max_targets
+        # target -> _Generation, least recently used first
+        self._generations = OrderedDict()
+        # Targets a generation is being started for
+        self._building = set()
+
+    def __len__(self):
+        return len(self._generations)
+
+    @contextmanager
+    def lease(self, target):
+        """The zygote of the current generation of a target.
+
+        The generation is kept alive until the block exits, even if a newer
+        one replaces it meanwhile. Yields None while the first generation of
+        the target is starting.
+        """
+        target = os.path.abspath(target)
+        generation = self._generations.get(target)
+        if generation is None:
+            self.reload(target)
+            yield None
+            return
+        self._generations.move_to_end(target)
+        generation.leases += 1
+        try:
+            yield generation.zygote
+        finally:
+            generation.leases -= 1
+            if generation.retired and not generation.leases:
+                self._stop(generation)
+
+    def reload(self, target):
+        """Start a new generation for a target in the background"""
+        target = os.path.abspath(target)
+        if target in self._building:
+            return
+        self._building.add(target)
+        IOLoop.current().spawn_callback(self._build, target)
+
+    def check(self):
+        """Reload the targets whose files changed"""
+        for target, generation in list(self._generations.items()):
+            self._check(target, generation)
+
+    def file_changed(self, path):
+        """Reload the targets that depend on a file, if it changed"""
+        path = os.path.abspath(path)
+        for target, generation in list(self._generations.items()):
+            if path in generation.files:
+                self._check(target, generation)
+
+    def _check(self, target, generation):
+        if target in self._building:
+            return
+        stats = _stat(generation.files)
+        if stats == generation.stats:
+            return
+        if _digest(generation.files) == generation.digest:
+            # Touched or rewritten with the same contents
+            generation.stats = stats
+            return
+        self.reload(target)
+
+    async def _build(self, target):
+        try:
+            if not os.path.isfile(target):
+                self._retire(self._generations.pop(target, None))
+                return
+            local_files = find_local_imports(target, self.root)
+            files = [target] + local_files
+            stats = _stat(files)
+            digest = _digest(files)
+            _remove_bytecode(local_files)
+
+            search_paths = [os.path.dirname(target), self.root]
+            preload = self.preload + [
+                m for m in find_external_imports(target, self.root)
+                if m not in self.preload
+            ] + [_module_name(f, search_paths) for f in local_files]
+            zygote = Zygote(preload, path=search_paths)
+            await IOLoop.current().run_in_executor(None, zygote.ensure_started)
+        except Exception:
+            ENDPOINT_WORKER_RELOADS.inc(status='error')
+            app_log.exception('Could not start endpoint workers for %s',
+                              target)
+            return
+        finally:
+            self._building.discard(target)
+
+        ENDPOINT_WORKER_RELOADS.inc(status='ok')
+        self._retire(self._generations.pop(target, None))
+        self._generations[target] = _Generation(zygote, files, stats, digest)
+        while len(self._generations) > self.max_targets:
+            _, evicted = self._generations.popitem(last=False)
+            self._retire(evicted)
+
+    def _retire(self, generation):
+        if generation is None:
+            return
+        generation.retired = True
+        if not generation.leases:
+            self._stop(generation)
+
+    def _stop(self, generation):
+        IOLoop.current().run_in_executor(None, generation.zygote.stop)
+
+    def close(self):
+        """Stop the zygotes of all targets"""
+        for generation in self._generations.values():
+            generation.retired = True
+            generation.zygote.stop()
+        self._generations.clear()
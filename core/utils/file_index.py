@@ -0,0 +1,365 @@
+# coding: utf8
+"""
+An in-memory index of the files under the file root.
+
+The index keeps the size, modification time and content hash of each file it
+has seen. Entries are validated with a `stat` call, so files changed by runs
+are picked up, but the contents of a file are only read again when its size or
+modification time changed. Writes through the runtime update the index
+directly. The contents of small files are kept in a bounded LRU cache.
+
+Listings and tree diffs need every file under the root. The root is walked at
+most once per scan interval to add and drop entries, and their hashes are
+computed on first use.
+"""
+import bisect
+import hashlib
+import os
+import stat
+import threading
+import time
+from collections import OrderedDict
+
+from core.utils.metrics import FILE_CACHE_REQUESTS
+
+
+class FileEntry:
+    """Metadata of a file in the index"""
+
+    __slots__ = ('path', 'size', 'mtime_ns', 'digest')
+
+    def __init__(self, path, size, mtime_ns, digest=None):
+        """
+        Parameters
+        ----------
+        path: str
+            The path of the file relative to the root
+
+        size: int
+            The size of the file in bytes
+
+        mtime_ns: int
+            The modification time of the file in nanoseconds
+
+        digest: str, optional
+            The sha256 hex digest of the contents, computed when needed
+        """
+        self.path = path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.digest = digest
+
+    @property
+    def mtime(self):
+        """The modification time in seconds"""
+        return self.mtime_ns / 1e9
+
+    def matches(self, st):
+        return self.size == st.st_size and self.mtime_ns == st.st_mtime_ns
+
+
+class FileIndex:
+    """Metadata and cached contents of the files under a root directory"""
+
+    def __init__(self,
+                 root,
+                 cache_max_bytes=32 * 1024 * 1024,
+                 cache_max_file_bytes=256 * 1024,
+                 scan_interval=5.0,
+                 ignore=()):
+        """
+        Parameters
+        ----------
+        root: str
+            The directory files are indexed under
+
+        cache_max_bytes: int
+            The maximum total size of cached file contents
+
+        cache_max_file_bytes: int
+            Files larger than this are never cached
+
+        scan_interval: float
+            Seconds a walk of the root is reused for by listings and diffs
+
+        ignore: list
+            Names of directories in the root left out of listings and diffs
+        """
+        self.root = root
+        self.cache_max_bytes = cache_max_bytes
+        self.cache_max_file_bytes = cache_max_file_bytes
+        self.scan_interval = scan_interval
+        self.ignore = set(ignore)
+
+        # relative path -> FileEntry
+        self._entries = {}
+        # Sorted relative paths, None when files were added or removed
+        self._paths = None
+        self._scanned_at = None
+        # relative path -> contents, least recently used first
+        self._contents = OrderedDict()
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+
+    def _relative(self, path):
+        return os.path.relpath(os.path.join(self.root, path), self.root)
+
+    def _stat(self, rel):
+        """Stat a file, None if it is missing or not a regular file"""
+        try:
+            st = os.stat(os.path.join(self.root, rel))
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        return st if stat.S_ISREG(st.st_mode) else None
+
+    def _cache(self, rel, content):
+        self._uncache(rel)
+        if len(content) > self.cache_max_file_bytes:
+            return
+        self._contents[rel] = content
+        self._cache_bytes += len(content)
+        while self._cache_bytes > self.cache_max_bytes:
+            _, evicted = self._contents.popitem(last=False)
+            self._cache_bytes -= len(evicted)
+
+    def _uncache(self, rel):
+        content = self._contents.pop(rel, None)
+        if content is not None:
+            self._cache_bytes -= len(content)
+
+    def _load(self, rel, entry):
+        """Read a file, hash it and cache its contents"""
+        with open(os.path.join(self.root, rel), 'rb') as f:
+            content = f.read()
+        entry.digest = hashlib.sha256(content).hexdigest()
+        self._cache(rel, content)
+        return content
+
+    def _read_digest(self, rel, size):
+        """Hash a file, reading files too large to cache in chunks.
+
+        Needs no lock. Returns the digest, and the contents if they are small
+        enough to cache
+        """
+        path = os.path.join(self.root, rel)
+        if size <= self.cache_max_file_bytes:
+            with open(path, 'rb') as f:
+                content = f.read()
+            return hashlib.sha256(content).hexdigest(), content
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest(), None
+
+    def _hash(self, rel, entry):
+        entry.digest, content = self._read_digest(rel, entry.size)
+        if content is not None:
+            self._cache(rel, content)
+
+    def _set(self, rel, entry):
+        if rel not in self._entries:
+            self._paths = None
+        self._entries[rel] = entry
+        self._uncache(rel)
+
+    def _remove(self, rel):
+        if self._entries.pop(rel, None) is not None:
+            self._paths = None
+        self._uncache(rel)
+
+    def _refresh(self, rel, st):
+        """The entry of a file, replaced if the file changed"""
+        if st is None:
+            self._remove(rel)
+            return None
+        entry = self._entries.get(rel)
+        if entry is None or not entry.matches(st):
+            entry = FileEntry(rel, st.st_size, st.st_mtime_ns)
+            self._set(rel, entry)
+        return entry
+
+    def get(self, path):
+        """The up to date entry of a file
+
+        Parameters
+        ----------
+        path: str
+            The path of the file, absolute or relative to the root
+
+        Returns
+        -------
+        FileEntry
+            The entry, or None if there is no such file
+        """
+        rel = self._relative(path)
+        st = self._stat(rel)
+        with self._lock:
+            entry = self._refresh(rel, st)
+            if entry is not None and entry.digest is None:
+                self._hash(rel, entry)
+            return entry
+
+    def read(self, path):
+        """The contents of a file, from the cache when they are unchanged
+
+        Returns
+        -------
+        bytes
+            The contents, or None if there is no such file
+        """
+        rel = self._relative(path)
+        st = self._stat(rel)
+        with self._lock:
+            entry = self._refresh(rel, st)
+            if entry is None:
+                return None
+            content = self._contents.get(rel)
+            if content is not None:
+                self._contents.move_to_end(rel)
+                FILE_CACHE_REQUESTS.inc(result='hit')
+                return content
+            FILE_CACHE_REQUESTS.inc(result='miss')
+            return self._load(rel, entry)
+
+    def update(self, path, content):
+        """Record the contents just written to a file
+
+        Parameters
+        ----------
+        path: str
+            The path of the file, absolute or relative to the root
+
+        content: bytes
+            The contents of the file
+        """
+        rel = self._relative(path)
+        st = self._stat(rel)
+        if st is None:
+            return
+        with self._lock:
+            self._set(
+                rel,
+                FileEntry(rel, st.st_size, st.st_mtime_ns,
+                          hashlib.sha256(content).hexdigest()))
+            self._cache(rel, content)
+
+    def scan(self, force=False):
+        """Walk the root to add new files and drop removed ones.
+
+        Skipped if the root was walked less than the scan interval ago.
+        """
+        if not force and self._scanned_at is not None and \
+                time.monotonic() - self._scanned_at < self.scan_interval:
+            return
+        found = {}
+        for dir_path, dir_names, file_names in os.walk(self.root):
+            if dir_path == self.root:
+                dir_names[:] = [d for d in dir_names if d not in self.ignore]
+            for name in file_names:
+                path = os.path.join(dir_path, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if stat.S_ISREG(st.st_mode):
+                    found[os.path.relpath(path, self.root)] = st
+        with self._lock:
+            for rel in set(self._entries) - set(found):
+                self._remove(rel)
+            for rel, st in found.items():
+                self._refresh(rel, st)
+            self._scanned_at = time.monotonic()
+
+    def _prefix(self, directory):
+        """The prefix of paths under a directory, empty for the root"""
+        rel = self._relative(directory)
+        return '' if rel == '.' else rel + os.sep
+
+    def _under(self, prefix):
+        """Sorted paths of the indexed files starting with prefix"""
+        if self._paths is None:
+            self._paths = sorted(self._entries)
+        if not prefix:
+            return self._paths
+        # Paths with the prefix sort before the prefix with its separator
+        # replaced by the next character
+        start = bisect.bisect_left(self._paths, prefix)
+        end = bisect.bisect_left(self._paths,
+                                 prefix[:-1] + chr(ord(os.sep) + 1))
+        return self._paths[start:end]
+
+    def list(self, directory='', offset=0, limit=None):
+        """Files under a directory, in order of their paths
+
+        Parameters
+        ----------
+        directory: str
+            The directory, relative to the root. Defaults to the root
+
+        offset: int
+            The number of files to skip
+
+        limit: int, optional
+            The maximum number of files to return
+
+        Returns
+        -------
+        tuple
+            The total number of files under the directory, and the entries of
+            the requested page
+        """
+        self.scan()
+        with self._lock:
+            paths = self._under(self._prefix(directory))
+            end = None if limit is None else offset + limit
+            return len(paths), [self._entries[p] for p in paths[offset:end]]
+
+    def diff(self, hashes, directory=''):
+        """Compare files under a directory with the hashes a client has
+
+        Parameters
+        ----------
+        hashes: dict
+            Paths relative to the root, mapped to sha256 hex digests
+
+        directory: str
+            The directory, relative to the root, the client mirrors
+
+        Returns
+        -------
+        dict
+            Sorted lists of the paths the client lacks (added), has different
+            contents of (changed) and has but the root does not (removed)
+        """
+        prefix = self._prefix(directory)
+        self.scan()
+        with self._lock:
+            paths = self._under(prefix)
+            entries = {rel: self._entries[rel] for rel in paths}
+
+        # Hashing a tree takes long, so it happens without the lock, which
+        # requests for single files take on the IOLoop
+        read = {}
+        for rel, entry in entries.items():
+            if entry.digest is None:
+                try:
+                    read[rel] = self._read_digest(rel, entry.size)
+                except OSError:
+                    continue
+        with self._lock:
+            for rel, (digest, content) in read.items():
+                entry = entries[rel]
+                entry.digest = digest
+                # Unless the file changed meanwhile
+                if content is not None and self._entries.get(rel) is entry:
+                    self._cache(rel, content)
+
+        added = [p for p in paths if p not in hashes]
+        changed = [
+            p for p in paths if p in hashes and hashes[p] != entries[p].digest
+        ]
+        present = set(paths)
+        removed = sorted(p for p in hashes
+                         if p.startswith(prefix) and p not in present)
+        return {'added': added, 'changed': changed, 'removed': removed}
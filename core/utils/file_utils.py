@@ -1,3 +1,4 @@
+import ast
 import os
 import re
 from contextlib import contextmanager
@@ -46,3 +47,135 @@ def secure_relative_file_path(file_path):
     file_path = file_path.replace('..', '')
     file_path = re.sub(r"{}+".format(os.sep), os.sep, file_path).lstrip(os.sep)
     return file_path.replace('~', '').lstrip(os.sep)
+
+
+def _module_files(module, search_paths):
+    """Return the files of a module and its parent packages in search paths"""
+    parts = module.split('.')
+    for base in search_paths:
+        candidates = []
+        for i in range(1, len(parts) + 1):
+            path = os.path.join(base, *parts[:i])
+            if i < len(parts):
+                candidates.append([os.path.join(path, '__init__.py')])
+            else:
+                candidates.append(
+                    [path + '.py',
+                     os.path.join(path, '__init__.py')])
+        found = []
+        for options in candidates:
+            match = next((p for p in options if os.path.isfile(p)), None)
+            if match is None:
+                break
+            found.append(match)
+        if found:
+            return found
+    return []
+
+
+def _imported_modules(tree, package):
+    """Yield the absolute names of modules imported in an ast"""
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                yield alias.name
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                # Relative imports resolve against the importing package
+                base = package.split('.') if package else []
+                base = base[:len(base) - node.level + 1]
+                module = '.'.join(base +
+                                  ([node.module] if node.module else []))
+            else:
+                module = node.module
+            if not module:
+                continue
+            yield module
+            # from package import submodule
+            for alias in node.names:
+                yield '{}.{}'.format(module, alias.name)
+
+
+def find_local_imports(file_path, root):
+    """Find the local python files a file imports, directly or indirectly
+
+    Imports are resolved the way the interpreter would when running the file
+    as a script with root on PYTHONPATH: first against the directory of the
+    file, then against root. Modules outside these directories are ignored.
+
+    Parameters
+    ----------
+    file_path: str
+        The absolute path of the python file
+
+    root: str
+        The root directory of local modules
+
+    Returns
+    -------
+    list
+        Sorted absolute paths of the imported local files, excluding file_path
+    """
+    search_paths = [os.path.dirname(file_path), root]
+    seen = {file_path}
+    pending = [(file_path, '')]
+    while pending:
+        path, package = pending.pop()
+        try:
+            with open(path, 'rb') as f:
+                tree = ast.parse(f.read(), filename=path)
+        except (SyntaxError, ValueError, OSError):
+            continue
+        for module in _imported_modules(tree, package):
+            for found in _module_files(module, search_paths):
+                if found in seen:
+                    continue
+                seen.add(found)
+                # The package a found module belongs to
+                rel = os.path.relpath(os.path.dirname(found), root)
+                pending.append((found, '' if rel.startswith('..') or rel == '.'
+                                else rel.replace(os.sep, '.')))
+    seen.discard(file_path)
+    return sorted(seen)
+
+
+def find_external_imports(file_path, root):
+    """Find the modules a file and its local imports use from elsewhere
+
+    These are the standard library and installed packages the file needs when
+    run as a script with root on PYTHONPATH.
+
+    Parameters
+    ----------
+    file_path: str
+        The absolute path of the python file
+
+    root: str
+        The root directory of local modules
+
+    Returns
+    -------
+    list
+        Sorted names of the modules, as written in the import statements
+    """
+    search_paths = [os.path.dirname(file_path), root]
+    modules = set()
+    for path in [file_path] + find_local_imports(file_path, root):
+        try:
+            with open(path, 'rb') as f:
+                tree = ast.parse(f.read(), filename=path)
+        except (SyntaxError, ValueError, OSError):
+            continue
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and not node.level:
+                # Imported names may be attributes rather than modules
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                if name != '__future__' and not _module_files(
+                        name, search_paths):
+                    modules.add(name)
+    return sorted(modules)
@@ -0,0 +1,292 @@
+# coding: utf8
+"""
+Summaries of the variables in an interactive namespace.
+
+Variables can be arbitrarily large, so nothing here materialises a full repr
+or walks a whole container. Sizes of containers are estimated from a sample of
+their items, previews are built with `reprlib`, which stops after a bounded
+number of items and characters, and arrays and data frames are summarised
+from their shape and buffers. Summaries are computed until a time budget is
+used up. The remaining variables of a page only get their type. Containers
+changed by a running cell while a page is built give a truncated page.
+"""
+import itertools
+import reprlib
+import sys
+import time
+
+# Items sampled to estimate the size of a container
+SAMPLE_SIZE = 100
+
+# Types whose length is cheap to get
+SIZED_TYPES = (str, bytes, bytearray, list, tuple, dict, set, frozenset, range)
+
+
+def _type_name(value):
+    cls = type(value)
+    if cls.__module__ == 'builtins':
+        return cls.__qualname__
+    return '{}.{}'.format(cls.__module__, cls.__qualname__)
+
+
+def _is_pandas(value):
+    return type(value).__module__.startswith('pandas.') and hasattr(
+        value, 'memory_usage')
+
+
+def _is_array(value):
+    # Arrays only exist once numpy was imported. Memmaps are arrays too
+    numpy = sys.modules.get('numpy')
+    return numpy is not None and isinstance(value, numpy.ndarray)
+
+
+def _shape(value):
+    shape = getattr(value, 'shape', None)
+    if isinstance(shape, tuple) and all(isinstance(d, int) for d in shape):
+        return list(shape)
+    return None
+
+
+def _length(value):
+    if isinstance(value, SIZED_TYPES):
+        return len(value)
+    return None
+
+
+def _has_attributes(value):
+    return isinstance(getattr(value, '__dict__', None), dict) and \
+        not isinstance(value, type) and not callable(value)
+
+
+def _children(value):
+    """An iterator of (key, child) pairs of a container, or None.
+
+    Containers are iterated in place, so a container changed meanwhile by a
+    running cell raises RuntimeError.
+    """
+    if isinstance(value, (str, bytes, bytearray)):
+        return None
+    if isinstance(value, dict):
+        return iter(value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return enumerate(value)
+    if _is_pandas(value) and hasattr(value, 'columns'):
+        return ((c, value[c]) for c in value.columns)
+    if _has_attributes(value):
+        return iter(vars(value).items())
+    return None
+
+
+def _count(value):
+    """The number of children of a container"""
+    if _is_pandas(value) and hasattr(value, 'columns'):
+        return len(value.columns)
+    if _has_attributes(value) and _length(value) is None:
+        return len(vars(value))
+    return _length(value)
+
+
+def _estimate_bytes(value):
+    """An estimate of the memory used by a value, and whether it is exact.
+
+    Containers are measured one level deep, from a sample of their items.
+    """
+    if _is_array(value):
+        return int(value.nbytes), True
+    if _is_pandas(value):
+        usage = value.memory_usage(deep=False)
+        return int(getattr(usage, 'sum', lambda: usage)()), False
+    size = sys.getsizeof(value)
+    children = _children(value)
+    if children is None:
+        return size, True
+    sample = list(itertools.islice(children, SAMPLE_SIZE))
+    if not sample:
+        return size, True
+    keyed = not isinstance(value, (list, tuple, set, frozenset))
+    sampled = sum(
+        sys.getsizeof(v) + (sys.getsizeof(k) if keyed else 0)
+        for k, v in sample)
+    return size + sampled * _count(value) // len(sample), False
+
+
+class _BoundedRepr(reprlib.Repr):
+    """A `reprlib.Repr` that stays bounded for any dict, list or set.
+
+    `reprlib` only bounds the exact builtin types, and falls back to the full
+    `repr` of subclasses such as `defaultdict` or `Counter`. It also sorts
+    whole dicts and sets before taking their first items.
+    """
+
+    def repr1(self, x, level):
+        for base in (dict, list, set, frozenset):
+            if isinstance(x, base) and type(x) is not base:
+                bounded = getattr(self, 'repr_' + base.__name__)(x, level)
+                return '{}({})'.format(type(x).__name__, bounded)
+        return super().repr1(x, level)
+
+    def repr_dict(self, x, level):
+        if not x:
+            return '{}'
+        if level <= 0:
+            return '{' + self.fillvalue + '}'
+        pieces = [
+            '{}: {}'.format(self.repr1(k, level - 1), self.repr1(v, level - 1))
+            for k, v in itertools.islice(x.items(), self.maxdict)
+        ]
+        if len(x) > self.maxdict:
+            pieces.append(self.fillvalue)
+        return '{' + ', '.join(pieces) + '}'
+
+    def repr_set(self, x, level):
+        if not x:
+            return 'set()'
+        return self._repr_iterable(x, level, '{', '}', self.maxset)
+
+    def repr_frozenset(self, x, level):
+        if not x:
+            return 'frozenset()'
+        return self._repr_iterable(x, level, 'frozenset({', '})',
+                                   self.maxfrozenset)
+
+
+class NamespaceInspector:
+    """Builds bounded summaries of variables and containers"""
+
+    def __init__(self, time_budget=0.2, preview_chars=200):
+        """
+        Parameters
+        ----------
+        time_budget: float
+            Seconds spent summarising the variables of a page
+
+        preview_chars: int
+            The maximum length of a preview
+        """
+        self.time_budget = time_budget
+        self.preview_chars = preview_chars
+
+        self._repr = _BoundedRepr()
+        self._repr.maxstring = preview_chars
+        self._repr.maxother = preview_chars
+        self._repr.maxlong = preview_chars
+        for attr in ('maxlist', 'maxtuple', 'maxdict', 'maxset',
+                     'maxfrozenset', 'maxdeque', 'maxarray'):
+            setattr(self._repr, attr, 10)
+
+    def preview(self, value):
+        if _is_array(value) or _is_pandas(value):
+            # Both summarise large values in their repr
+            text = repr(value)
+        else:
+            text = self._repr.repr(value)
+        if len(text) > self.preview_chars:
+            text = text[:self.preview_chars - 3] + '...'
+        return text
+
+    def summarize(self, name, value, detailed=True):
+        """Describe a value
+
+        Parameters
+        ----------
+        name: str
+            The name or key of the value
+
+        value: object
+            The value to describe
+
+        detailed: bool
+            Whether to estimate the size and build a preview, or only give
+            the type
+
+        Returns
+        -------
+        dict
+        """
+        summary = {'name': name, 'type': _type_name(value)}
+        if not detailed:
+            summary['partial'] = True
+            return summary
+        shape = _shape(value)
+        if shape is not None:
+            summary['shape'] = shape
+        length = _length(value)
+        if length is not None:
+            summary['length'] = length
+        try:
+            summary['bytes'], summary['bytesExact'] = _estimate_bytes(value)
+            summary['preview'] = self.preview(value)
+        except Exception as e:
+            summary['error'] = '{}: {}'.format(type(e).__name__, e)
+        summary['expandable'] = _children(value) is not None
+        return summary
+
+    def _page(self, items, total, offset, limit):
+        deadline = time.monotonic() + self.time_budget
+        summaries = []
+        truncated = False
+        try:
+            for name, value in itertools.islice(items, offset, offset + limit):
+                detailed = time.monotonic() < deadline
+                summaries.append(self.summarize(name, value, detailed))
+        except RuntimeError:
+            # The container changed size while it was iterated
+            truncated = True
+        return {
+            'total': total,
+            'offset': offset,
+            'limit': limit,
+            'items': summaries,
+            'truncated': truncated
+        }
+
+    def list(self, namespace, offset=0, limit=100):
+        """Summarise a page of the variables of a namespace, sorted by name
+
+        Names starting with two underscores are left out.
+        """
+        names = sorted(n for n in list(namespace) if not n.startswith('__'))
+        items = ((n, namespace[n]) for n in names if n in namespace)
+        return self._page(items, len(names), offset, limit)
+
+    def resolve(self, namespace, path):
+        """The value at a path of names and keys into a namespace
+
+        Raises KeyError if there is no such value
+        """
+        if not path or path[0] not in namespace:
+            raise KeyError(path[:1])
+        value = namespace[path[0]]
+        for i, key in enumerate(path[1:]):
+            value = self._child(value, key, path[:i + 2])
+        return value
+
+    def _child(self, value, key, path):
+        # Look up string keys and list indexes directly, before scanning
+        if isinstance(value, dict) and key in value:
+            return value[key]
+        if isinstance(value, (list, tuple)) and key.isdigit():
+            if int(key) < len(value):
+                return value[int(key)]
+            raise KeyError(path)
+        children = _children(value)
+        if children is not None:
+            try:
+                for child_key, child in children:
+                    if str(child_key) == key:
+                        return child
+            except RuntimeError:
+                # Changed while scanned, the key may not be there anymore
+                pass
+        raise KeyError(path)
+
+    def expand(self, namespace, path, offset=0, limit=100):
+        """Summarise a page of the children of the value at path"""
+        value = self.resolve(namespace, path)
+        children = _children(value)
+        if children is None:
+            raise KeyError(path)
+        items = ((str(k), v) for k, v in children)
+        page = self._page(items, _count(value), offset, limit)
+        page['value'] = self.summarize(path[-1], value)
+        return page
@@ -0,0 +1,185 @@
+# coding: utf8
+"""
+Execution of interactive python cells that await at the top level.
+
+Cells are compiled with top level await allowed. A cell that awaits compiles
+to a coroutine, which runs on a kernel event loop owned by a dedicated thread.
+The runtime IOLoop is never blocked by user code, and cells started while
+another is awaiting run concurrently with it.
+
+Output is captured per cell with a context variable rather than by swapping
+`sys.stdout`. This keeps output of concurrently running cells apart.
+
+Top level await needs Python 3.8. On older versions every cell runs
+synchronously, and awaiting at the top level is a syntax error.
+"""
+import asyncio
+import ast
+import inspect
+import sys
+import threading
+from contextlib import contextmanager
+
+try:
+    import contextvars
+except ImportError:
+    # Python 3.5 and 3.6
+    contextvars = None
+
+# Whether cells may await at the top level
+TOP_LEVEL_AWAIT = hasattr(ast, 'PyCF_ALLOW_TOP_LEVEL_AWAIT')
+
+
+class _GlobalVar:
+    """A stand-in for a context variable, shared by every context.
+
+    Used without `contextvars`, where cells can not await either and so never
+    run interleaved.
+    """
+
+    def __init__(self, default=None):
+        self._value = default
+
+    def get(self):
+        return self._value
+
+    def set(self, value):
+        token = self._value
+        self._value = value
+        return token
+
+    def reset(self, token):
+        self._value = token
+
+
+# The (stdout, stderr) streams of the cell running in the current context
+if contextvars is not None:
+    _cell_streams = contextvars.ContextVar('cell_streams', default=None)
+else:
+    _cell_streams = _GlobalVar(default=None)
+
+
+class _StreamProxy:
+    """Writes to the stream of the current cell, or to the original stream"""
+
+    def __init__(self, index, stream):
+        self._index = index
+        self._stream = stream
+
+    def _target(self):
+        streams = _cell_streams.get()
+        if streams is None:
+            return self._stream
+        return streams[self._index]
+
+    def write(self, s):
+        return self._target().write(s)
+
+    def flush(self):
+        return self._target().flush()
+
+    def __getattr__(self, name):
+        return getattr(self._target(), name)
+
+
+def _install_proxies():
+    if not isinstance(sys.stdout, _StreamProxy):
+        sys.stdout = _StreamProxy(0, sys.stdout)
+    if not isinstance(sys.stderr, _StreamProxy):
+        sys.stderr = _StreamProxy(1, sys.stderr)
+
+
+@contextmanager
+def capture_output(out, err):
+    """Send stdout and stderr of the current context to out and err
+
+    Unlike `contextlib.redirect_stdout`, the wrapped block may yield to the
+    event loop. Output of other coroutines and threads is not captured.
+    """
+    _install_proxies()
+    token = _cell_streams.set((out, err))
+    try:
+        yield
+    finally:
+        _cell_streams.reset(token)
+
+
+def compile_cell(source, filename='<string>'):
+    """Compile the source of a cell, allowing await at the top level where
+    the python version supports it"""
+    flags = ast.PyCF_ALLOW_TOP_LEVEL_AWAIT if TOP_LEVEL_AWAIT else 0
+    return compile(source, filename, 'exec', flags=flags, dont_inherit=True)
+
+
+def is_async_cell(code):
+    """Whether the compiled cell has to be awaited"""
+    return bool(code.co_flags & inspect.CO_COROUTINE)
+
+
+class KernelLoop:
+    """An asyncio event loop running on its own thread for async cells"""
+
+    def __init__(self):
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self):
+        """The kernel event loop, started on first use"""
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever,
+                                                name='kernel-loop',
+                                                daemon=True)
+                self._thread.start()
+            return self._loop
+
+    def run_cell(self, console, code, out, err):
+        """Run a compiled async cell in the namespace of the console.
+
+        Exceptions raised by the cell are printed to err like
+        `InteractiveConsole.runcode` does.
+
+        Parameters
+        ----------
+        console: code.InteractiveConsole
+            The console holding the namespace of the cell
+
+        code: code
+            The cell compiled with `compile_cell`
+
+        out: io.StringIO
+            Receives the stdout of the cell
+
+        err: io.StringIO
+            Receives the stderr of the cell
+
+        Returns
+        -------
+        concurrent.futures.Future
+            Resolves when the cell is complete
+        """
+
+        async def run():
+            with capture_output(out, err):
+                try:
+                    await eval(code, console.locals)
+                except SystemExit:
+                    raise
+                except BaseException:
+                    console.showtraceback()
+
+        return asyncio.run_coroutine_threadsafe(run(), self.loop)
+
+    def stop(self):
+        """Stop the loop. Pending cells are abandoned"""
+        with self._lock:
+            if self._loop is None:
+                return
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            self._loop = None
+            self._thread = None
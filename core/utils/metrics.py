@@ -0,0 +1,353 @@
+# coding: utf8
+"""
+Lightweight in-process metrics exposed in the Prometheus text format.
+
+Metrics are plain python objects guarded by a lock, so recording a sample is a
+dictionary lookup and a few additions. This keeps instrumentation cheap enough
+to be left on in production.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+from tornado.log import access_log
+
+# Latency buckets in seconds
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                   5.0, 10.0, 30.0, 60.0)
+
+# Buckets used for counting emitted lines
+LINE_BUCKETS = (1, 10, 100, 1000, 10000, 100000, 1000000)
+
+# Buckets used for counting emitted bytes
+BYTE_BUCKETS = (64, 1024, 16384, 262144, 4194304, 67108864)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n',
+                                                   r'\n').replace('"', r'\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, _escape(v))
+                          for k, v in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """Base class for a named metric with an optional set of labels"""
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        """
+        Parameters
+        ----------
+        name: str
+            The metric name
+
+        documentation: str
+            The help text rendered with the metric
+
+        labelnames: iterable
+            The names of the labels that samples are partitioned by
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def samples(self):
+        """Yield (suffix, label values, extra label, value) tuples"""
+        raise NotImplementedError
+
+    def render(self):
+        lines = [
+            '# HELP {} {}'.format(self.name, self.documentation),
+            '# TYPE {} {}'.format(self.name, self.kind)
+        ]
+        for suffix, key, extra, value in self.samples():
+            lines.append('{}{}{} {}'.format(
+                self.name, suffix, _format_labels(self.labelnames, key, extra),
+                _format_value(value)))
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    """A monotonically increasing counter"""
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield '_total', key, None, value
+
+
+class Gauge(Metric):
+    """A value that can go up and down, or be computed when scraped"""
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._function = None
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def get(self, **labels):
+        if self._function is not None:
+            return self._function()
+        return self._values.get(self._key(labels), 0)
+
+    def set_function(self, fn):
+        """Compute the (unlabelled) gauge value by calling fn on every scrape"""
+        self._function = fn
+
+    def samples(self):
+        if self._function is not None:
+            yield '', (), None, self._function()
+            return
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield '', key, None, value
+
+
+class Histogram(Metric):
+    """Cumulative histogram of observed values"""
+    kind = 'histogram'
+
+    def __init__(self,
+                 name,
+                 documentation,
+                 labelnames=(),
+                 buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Bucket counts, followed by sum and count
+                state = self._values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall clock duration of the wrapped block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def get(self, **labels):
+        """Return (count, sum) for the given labels"""
+        state = self._values.get(self._key(labels))
+        if state is None:
+            return 0, 0
+        return state[-1], state[-2]
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(state)) for key, state in self._values.items()]
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                yield '_bucket', key, ('le', _format_value(bound)), cumulative
+            yield '_bucket', key, ('le', '+Inf'), state[-1]
+            yield '_sum', key, None, state[-2]
+            yield '_count', key, None, state[-1]
+
+
+class MetricsRegistry:
+    """A collection of metrics that can be rendered together"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self,
+                  name,
+                  documentation,
+                  labelnames=(),
+                  buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram,
+                                   name,
+                                   documentation,
+                                   labelnames,
+                                   buckets=buckets)
+
+    def render(self):
+        """Render all metrics in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(m.render() for m in metrics) + '\n'
+
+
+# The registry used by the runtime
+metrics = MetricsRegistry()
+
+REQUEST_DURATION = metrics.histogram('runtime_request_duration_seconds',
+                                     'HTTP request latency by route',
+                                     ['route', 'method', 'code'])
+
+PROCESS_FIRST_BYTE = metrics.histogram(
+    'runtime_process_first_byte_seconds',
+    'Time from spawning a process to its first line of output', ['mode'])
+
+PROCESS_DURATION = metrics.histogram('runtime_process_duration_seconds',
+                                     'Total run time of cell executions',
+                                     ['mode'])
+
+CELL_OUTPUT_LINES = metrics.histogram('runtime_cell_output_lines',
+                                      'Lines emitted per cell run', ['mode'],
+                                      buckets=LINE_BUCKETS)
+
+CELL_OUTPUT_BYTES = metrics.histogram('runtime_cell_output_bytes',
+                                      'Bytes emitted per cell run', ['mode'],
+                                      buckets=BYTE_BUCKETS)
+
+SOCKET_EMIT_DURATION = metrics.histogram('runtime_socket_emit_seconds',
+                                         'Latency of socket emits', ['event'])
+
+PROCESS_REGISTRY_SIZE = metrics.gauge(
+    'runtime_process_registry_size',
+    'Number of processes currently held in the process registry')
+
+CELL_QUEUE_DEPTH = metrics.gauge(
+    'runtime_cell_queue_depth',
+    'Number of cells waiting for their turn to run')
+
+STREAM_SUBSCRIBERS = metrics.gauge(
+    'runtime_stream_subscribers',
+    'Number of websocket subscriptions to cell event channels')
+
+ENDPOINT_CONFIG_LOAD_DURATION = metrics.histogram(
+    'runtime_endpoint_config_load_seconds',
+    'Time taken to load an endpoint configuration')
+
+ENDPOINT_PARSE_DURATION = metrics.histogram(
+    'runtime_endpoint_parse_seconds',
+    'Latency of endpoint variable parse calls to the server', ['status'])
+
+ARTIFACTS_OFFLOADED = metrics.counter(
+    'runtime_artifacts_offloaded',
+    'Cell results sent as references to stored artifacts', ['field'])
+
+FILE_CACHE_REQUESTS = metrics.counter(
+    'runtime_file_cache_requests',
+    'File content reads served from memory or disk', ['result'])
+
+ENDPOINT_WORKER_TARGETS = metrics.gauge(
+    'runtime_endpoint_worker_targets',
+    'Number of endpoint targets with a warm generation of workers')
+
+ENDPOINT_WORKER_RELOADS = metrics.counter(
+    'runtime_endpoint_worker_reloads',
+    'Generations of endpoint workers started, by outcome', ['status'])
+
+LOOP_LAG = metrics.gauge('runtime_event_loop_lag_seconds',
+                         'Seconds the last event loop timer tick was late')
+
+LOOP_STALLS = metrics.counter(
+    'runtime_event_loop_stalls',
+    'Times the event loop did not tick within the stall threshold',
+    ['handler'])
+
+
+def observe_cell_output(mode, lines, nbytes):
+    """Record the amount of output a cell run produced
+
+    Parameters
+    ----------
+    mode: str
+        The execution mode, one of interactive, file, endpoint, shell
+
+    lines: int
+        The number of lines emitted
+
+    nbytes: int
+        The number of bytes emitted
+    """
+    CELL_OUTPUT_LINES.observe(lines, mode=mode)
+    CELL_OUTPUT_BYTES.observe(nbytes, mode=mode)
+
+
+def observe_cell_text(mode, *texts):
+    """Record cell output given as strings"""
+    lines = 0
+    nbytes = 0
+    for text in texts:
+        if text:
+            lines += text.count('\n') + (0 if text.endswith('\n') else 1)
+            nbytes += len(text.encode('utf-8'))
+    observe_cell_output(mode, lines, nbytes)
+
+
+def log_request(handler):
+    """Tornado `log_function` that records request latency per route.
+
+    Mirrors the default tornado access log so logging behaviour is unchanged.
+    """
+    status = handler.get_status()
+    request_time = handler.request.request_time()
+    REQUEST_DURATION.observe(request_time,
+                             route=type(handler).__name__,
+                             method=handler.request.method,
+                             code=status)
+
+    if status < 400:
+        log_method = access_log.info
+    elif status < 500:
+        log_method = access_log.warning
+    else:
+        log_method = access_log.error
+    log_method('%d %s %.2fms', status, handler._request_summary(),
+               1000.0 * request_time)
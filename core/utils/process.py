@@ -3,9 +3,9 @@ import os
 import shlex
 import asyncio
 import signal
-import psutil
 from asyncio.subprocess import PIPE
-from psutil import NoSuchProcess
+
+from core.utils.metrics import PROCESS_FIRST_BYTE, PROCESS_DURATION
 
 
 class AsyncProcess:
@@ -22,7 +22,8 @@ class AsyncProcess:
                  stdout_cb=None,
                  stderr_cb=None,
                  done_cb=None,
-                 formatters=None):
+                 formatters=None,
+                 mode='shell'):
         """"
         Parameters
         ----------
@@ -51,12 +52,26 @@ class AsyncProcess:
                 # Replace temporary shell filename references
                 'stdout': lambda x: x.replace('.sh', '')
                 }
+
+        mode: str, optional
+            The execution mode the process runs in. Used to label metrics
         """
         self.registry_object = registry_object
         self.stdout = stdout_cb
         self.stderr = stderr_cb
         self.done = done_cb
         self.formatters = formatters or {}
+        self.mode = mode
+
+        # Timestamps used for instrumentation
+        self._started_at = None
+        self._first_byte_at = None
+
+    def _mark_first_byte(self):
+        self._first_byte_at = time.time()
+        if self._started_at is not None:
+            PROCESS_FIRST_BYTE.observe(self._first_byte_at - self._started_at,
+                                       mode=self.mode)
 
     async def read(self, stream, display, formatter=None, logging_interval=0):
         """Read from stream line by line until EOF, capture lines and call
@@ -90,6 +105,8 @@ class AsyncProcess:
         # Read and wait for next lien
         while True:
             line = await stream.readline()
+            if line and self._first_byte_at is None:
+                self._mark_first_byte()
             # If no logging interval is defined, immediately callback
             if logging_interval == 0:
                 # EOF or end of stream
@@ -130,12 +147,14 @@ class AsyncProcess:
     @staticmethod
     def kill_child_processes(process):
         # The process is asnycio.process. Using psutil we can get children
+        # psutil is imported on first use to keep startup fast
+        import psutil
         try:
             parent = psutil.Process(process.pid)
             children = parent.children(recursive=True)
             for p in children:
                 p.send_signal(signal.SIGTERM)
-        except NoSuchProcess:
+        except psutil.NoSuchProcess:
             pass
 
     @staticmethod
@@ -157,6 +176,9 @@ class AsyncProcess:
             The input into the command. If not present stdin is not enabled
 
         """
+        self._started_at = time.time()
+        self._first_byte_at = None
+
         # start process using Subprocess command
         process = await asyncio.create_subprocess_exec(
             *cmd_with_args,
@@ -186,6 +208,8 @@ class AsyncProcess:
         finally:
             # wait for the process to exit
             rc = await process.wait()
+            PROCESS_DURATION.observe(time.time() - self._started_at,
+                                     mode=self.mode)
             self.done(rc)
             self.registry_object.deregister()
 
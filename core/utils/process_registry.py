@@ -1,4 +1,9 @@
 # coding: utf8
+import asyncio
+import os
+import signal
+
+from core.utils.process import AsyncProcess
 
 __author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
 
@@ -21,6 +26,58 @@ class ProcessRegistryObject:
     def get_process(self):
         return self._process
 
+    async def kill(self):
+        """Kill the registered process and its children"""
+        if self._process is not None:
+            return await AsyncProcess.kill(self._process)
+
+
+def _is_alive(process):
+    import psutil
+    try:
+        return process.status() != psutil.STATUS_ZOMBIE
+    except psutil.NoSuchProcess:
+        return False
+
+
+class RemoteProcessRegistryObject:
+    """A process owned by another worker of a shared process registry.
+
+    The process can not be awaited from this worker, so it is killed by pid.
+    The owning worker deregisters it once it notices the process exited.
+    """
+
+    def __init__(self, registry, cell_id, pid, worker_id):
+        self._registry = registry
+        self.cell_id = cell_id
+        self.pid = pid
+        self.worker_id = worker_id
+
+    def get_process(self):
+        return None
+
+    async def kill(self, timeout=5):
+        """Kill the process tree with the recorded pid"""
+        import psutil
+        try:
+            parent = psutil.Process(self.pid)
+            processes = parent.children(recursive=True)
+            for p in processes:
+                p.send_signal(signal.SIGTERM)
+            parent.kill()
+            processes.append(parent)
+        except psutil.NoSuchProcess:
+            # The owner is gone without deregistering the process
+            self._registry.forget(self.cell_id, self.pid)
+            return None
+
+        # Poll instead of psutil.wait_procs to not block the event loop
+        for _ in range(int(timeout / 0.05)):
+            if not any(_is_alive(p) for p in processes):
+                break
+            await asyncio.sleep(0.05)
+        return -signal.SIGKILL
+
 
 class ProcessRegistry:
     """A class that maps a notebook cell run to a process"""
@@ -33,7 +90,89 @@ class ProcessRegistry:
         self.registry[pro.cell_id] = pro
 
     def remove(self, pro):
-        self.registry.pop(pro.cell_id, None)
+        # A re-run of the cell may have registered a new object already
+        if self.registry.get(pro.cell_id) is pro:
+            self.registry.pop(pro.cell_id, None)
+
+    def __len__(self):
+        return len(self.registry)
+
+    def __iter__(self):
+        """The registry objects of the processes started by this worker"""
+        return iter(list(self.registry.values()))
 
     def get_process_info(self, cell_id):
         return self.registry.get(cell_id, None)
+
+
+class SharedProcessRegistry(ProcessRegistry):
+    """A process registry shared by the workers of a pre-forked server.
+
+    Registry objects stay in memory in the worker that spawned the process.
+    The cell id, pid and owning worker are also written to a SQLite table, so
+    that a request landing on any worker can find and kill the process.
+    """
+
+    def __init__(self, path, worker_id=0):
+        """
+        Parameters
+        ----------
+        path: str
+            Path to the SQLite database shared by the workers
+
+        worker_id: int
+            The id of the worker that owns this registry
+        """
+        import sqlite3
+
+        super().__init__()
+        self.path = path
+        self.worker_id = worker_id
+
+        base_dir = os.path.dirname(path)
+        if base_dir and not os.path.exists(base_dir):
+            os.makedirs(base_dir)
+
+        # Autocommit mode. Each statement is its own transaction
+        self._db = sqlite3.connect(path, timeout=5, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS processes ('
+                         'cell_id TEXT PRIMARY KEY, '
+                         'pid INTEGER NOT NULL, '
+                         'worker_id INTEGER NOT NULL)')
+
+        # Rows left behind by a previous incarnation of this worker
+        self._db.execute('DELETE FROM processes WHERE worker_id = ?',
+                         (worker_id, ))
+
+    def add(self, pro):
+        super().add(pro)
+        self._db.execute(
+            'INSERT OR REPLACE INTO processes (cell_id, pid, worker_id) '
+            'VALUES (?, ?, ?)',
+            (pro.cell_id, pro.get_process().pid, self.worker_id))
+
+    def remove(self, pro):
+        super().remove(pro)
+        process = pro.get_process()
+        if process is not None:
+            self.forget(pro.cell_id, process.pid)
+
+    def forget(self, cell_id, pid):
+        """Delete the row of a process, unless the cell has been re-run"""
+        self._db.execute('DELETE FROM processes WHERE cell_id = ? AND pid = ?',
+                         (cell_id, pid))
+
+    def get_process_info(self, cell_id):
+        pro = super().get_process_info(cell_id)
+        if pro is not None:
+            return pro
+        row = self._db.execute(
+            'SELECT pid, worker_id FROM processes WHERE cell_id = ?',
+            (cell_id, )).fetchone()
+        if row is None:
+            return None
+        return RemoteProcessRegistryObject(self, cell_id, *row)
+
+    def close(self):
+        self._db.close()
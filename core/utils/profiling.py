@@ -0,0 +1,66 @@
+# coding: utf8
+import code
+import cProfile
+import pstats
+
+# Frames that belong to the runtime rather than the profiled cell
+_RUNTIME_FILES = (code.__file__, __file__)
+
+
+class CellProfiler:
+    """Run a cell under cProfile and summarise the hotspots"""
+
+    def __init__(self, limit=15):
+        """
+        Parameters
+        ----------
+        limit: int
+            The number of rows to report in each hotspot table
+        """
+        self.limit = limit
+        self.profiler = cProfile.Profile()
+        # Whether anything ran under the profiler
+        self.ran = False
+
+    def runcall(self, fn, *args, **kwargs):
+        """Call fn with arguments while the profiler is enabled"""
+        self.ran = True
+        return self.profiler.runcall(fn, *args, **kwargs)
+
+    @staticmethod
+    def _rows(stats):
+        for func, (cc, nc, tt, ct, _) in stats.stats.items():
+            filename, _, name = func
+            if filename in _RUNTIME_FILES or name.startswith(
+                    "<method 'disable' of '_lsprof"):
+                continue
+            yield {
+                'function': pstats.func_std_string(func),
+                'calls': nc,
+                'primitiveCalls': cc,
+                'selfTime': round(tt, 6),
+                'cumulativeTime': round(ct, 6)
+            }
+
+    def hotspots(self):
+        """Return the top functions ranked by cumulative and by self time
+
+        Returns
+        -------
+        dict
+            A dictionary with the total profiled time and two tables, each
+            holding at most `limit` rows. The tables are empty if nothing ran
+        """
+        if not self.ran:
+            return {'totalTime': 0, 'cumulative': [], 'self': []}
+        stats = pstats.Stats(self.profiler)
+        rows = list(self._rows(stats))
+        by_cumulative = sorted(rows,
+                               key=lambda r: r['cumulativeTime'],
+                               reverse=True)
+        by_self = sorted(rows, key=lambda r: r['selfTime'], reverse=True)
+        return {
+            'totalTime': round(stats.total_tt, 6),
+            'cumulative': by_cumulative[:self.limit],
+            'self': by_self[:self.limit]
+        }
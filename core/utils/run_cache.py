@@ -0,0 +1,135 @@
+# coding: utf8
+import hashlib
+import json
+import os
+import sys
+import tempfile
+
+from core.utils.file_utils import find_local_imports
+from core.utils.metrics import metrics
+
+RUN_CACHE_REQUESTS = metrics.counter('runtime_run_cache_requests',
+                                     'File run cache lookups by result',
+                                     ['result'])
+
+
+class RunCache:
+    """An on-disk cache of file run results.
+
+    Entries are keyed on the content of the file that is run, the local modules
+    it imports and the interpreter version. Each entry is a JSON file in the
+    cache directory. Reading an entry bumps its modification time, which is
+    used to evict the least recently used entries once the size limits are
+    exceeded.
+    """
+
+    def __init__(self, root, max_bytes=64 * 1024 * 1024, max_entries=512):
+        """
+        Parameters
+        ----------
+        root: str
+            The directory to store cache entries in
+
+        max_bytes: int
+            The maximum total size of all entries
+
+        max_entries: int
+            The maximum number of entries
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+
+    def key(self, file_path, file_path_root):
+        """Compute the cache key of running a file
+
+        Parameters
+        ----------
+        file_path: str
+            The absolute path of the file to run
+
+        file_path_root: str
+            The root directory that local modules are imported from
+
+        Returns
+        -------
+        str
+            A hex digest identifying the file, its local imports and the
+            interpreter
+        """
+        digest = hashlib.sha256()
+        digest.update(sys.version.encode('utf-8'))
+        for path in [file_path] + find_local_imports(file_path,
+                                                     file_path_root):
+            digest.update(
+                b'\0' + os.path.relpath(path, file_path_root).encode('utf-8') +
+                b'\0')
+            with open(path, 'rb') as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.root, '{}.json'.format(key))
+
+    def get(self, key):
+        """Return the stored result for key, or None on a miss"""
+        path = self._path(key)
+        try:
+            with open(path, 'r') as f:
+                result = json.loads(f.read())
+            # Mark as recently used
+            os.utime(path, None)
+        except (OSError, ValueError):
+            RUN_CACHE_REQUESTS.inc(result='miss')
+            return None
+        RUN_CACHE_REQUESTS.inc(result='hit')
+        return result
+
+    def put(self, key, result):
+        """Store a result and evict old entries if limits are exceeded
+
+        Parameters
+        ----------
+        key: str
+            The cache key
+
+        result: dict
+            A JSON serializable run result
+        """
+        data = json.dumps(result).encode('utf-8')
+        if len(data) > self.max_bytes:
+            return
+
+        if not os.path.exists(self.root):
+            os.makedirs(self.root)
+
+        # Write to a temporary file first so readers never see partial entries
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(key))
+
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until within limits"""
+        entries = []
+        for name in os.listdir(self.root):
+            if not name.endswith('.json'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.root, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        while entries and (total > self.max_bytes
+                           or len(entries) > self.max_entries):
+            _, size, name = entries.pop(0)
+            try:
+                os.unlink(os.path.join(self.root, name))
+            except OSError:
+                pass
+            total -= size
@@ -0,0 +1,69 @@
+# coding: utf8
+"""
+A statistical profiler of the threads of the runtime server process.
+
+The stacks of all threads are sampled at a fixed interval with
+`sys._current_frames`, without tracing calls, so the overhead on the sampled
+threads is limited to holding the GIL while a sample is taken. Samples are
+aggregated as collapsed stacks: one line per distinct stack, frames from the
+thread name down separated by semicolons, followed by the number of samples.
+This is the input format of flame graph tools.
+"""
+import collections
+import os
+import sys
+import threading
+import time
+
+
+def _frame_label(code):
+    return '{} ({}:{})'.format(code.co_name,
+                               os.path.basename(code.co_filename),
+                               code.co_firstlineno)
+
+
+def _collapse(thread_name, frame):
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    labels.append(thread_name)
+    return ';'.join(reversed(labels))
+
+
+def sample_stacks(seconds, interval=0.005):
+    """Sample the stacks of all other threads for a while
+
+    Parameters
+    ----------
+    seconds: float
+        How long to sample for
+
+    interval: float
+        Seconds between samples
+
+    Returns
+    -------
+    collections.Counter
+        The number of samples of each collapsed stack
+    """
+    own_id = threading.get_ident()
+    stacks = collections.Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        frames = sys._current_frames()
+        frames.pop(own_id, None)
+        for thread_id, frame in frames.items():
+            name = names.get(thread_id, 'thread-{}'.format(thread_id))
+            stacks[_collapse(name, frame)] += 1
+        # Frames keep their locals alive
+        frames = frame = None
+        time.sleep(interval)
+    return stacks
+
+
+def format_collapsed(stacks):
+    """Lines of collapsed stacks, most sampled first"""
+    return ''.join('{} {}\n'.format(stack, count)
+                   for stack, count in stacks.most_common())
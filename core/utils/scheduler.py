@@ -0,0 +1,176 @@
+# coding: utf8
+"""
+Ordered, fair scheduling of cell runs.
+
+Cells of one channel (a notebook) run one at a time, in the order they were
+submitted. Channels with pending cells take turns, and at most a fixed number
+of cells run at once across all channels. A notebook submitting many cells
+therefore can not starve other notebooks.
+"""
+import collections
+
+from tornado.concurrent import Future, future_set_result_unless_cancelled
+from tornado.ioloop import IOLoop
+from tornado.log import app_log
+
+
+class _Job:
+    """A cell waiting to run"""
+
+    def __init__(self, channel, cell_id, run, on_queued, on_dequeued):
+        self.channel = channel
+        self.cell_id = cell_id
+        self.run = run
+        self.on_queued = on_queued
+        self.on_dequeued = on_dequeued
+        self.queued = False
+        self.future = Future()
+
+
+class CellScheduler:
+    """Runs cells FIFO per channel and round robin across channels"""
+
+    def __init__(self, max_concurrent=8):
+        """
+        Parameters
+        ----------
+        max_concurrent: int
+            The maximum number of cells running at once across all channels
+        """
+        self.max_concurrent = max_concurrent
+        # Pending jobs per channel
+        self._queues = {}
+        # Channels with pending jobs, in the order they get their next turn
+        self._rotation = collections.deque()
+        # Channels with a running job
+        self._busy = set()
+        self._running = 0
+
+    def __len__(self):
+        """The number of cells waiting to run"""
+        return sum(len(queue) for queue in self._queues.values())
+
+    @property
+    def running(self):
+        """The number of cells currently running"""
+        return self._running
+
+    def submit(self, channel, cell_id, run, on_queued=None, on_dequeued=None):
+        """Schedule a cell run. Must be called on the IOLoop thread.
+
+        Parameters
+        ----------
+        channel: str
+            The channel the cell belongs to
+
+        cell_id: str
+            The id of the cell
+
+        run: method
+            Called without arguments when it is the turn of the cell. Returns
+            an awaitable that resolves once the cell is done
+
+        on_queued: method, optional
+            Called with the 1-based position of the cell in its channel when
+            the cell can not run right away
+
+        on_dequeued: method, optional
+            Called when a cell that was queued starts to run
+
+        Returns
+        -------
+        Future
+            Resolves when the cell is done
+        """
+        job = _Job(channel, cell_id, run, on_queued, on_dequeued)
+        queue = self._queues.get(channel)
+        if queue is None:
+            queue = self._queues[channel] = collections.deque()
+            self._rotation.append(channel)
+        queue.append(job)
+
+        self._dispatch()
+
+        if channel in self._queues and job in self._queues[channel]:
+            job.queued = True
+            if on_queued is not None:
+                on_queued(self._queues[channel].index(job) + 1)
+        return job.future
+
+    def cancel(self, cell_id):
+        """Remove a queued cell.
+
+        Returns
+        -------
+        str
+            The channel of the cell, or None if the cell was not queued
+        """
+        for channel, queue in list(self._queues.items()):
+            for job in queue:
+                if job.cell_id == cell_id:
+                    queue.remove(job)
+                    if not queue:
+                        self._remove_channel(channel)
+                    future_set_result_unless_cancelled(job.future, None)
+                    return channel
+        return None
+
+    def cancel_all(self):
+        """Remove all queued cells.
+
+        Returns
+        -------
+        list
+            The (cell id, channel) of the cancelled cells
+        """
+        cancelled = []
+        for channel, queue in list(self._queues.items()):
+            for job in queue:
+                cancelled.append((job.cell_id, channel))
+                future_set_result_unless_cancelled(job.future, None)
+            self._remove_channel(channel)
+        return cancelled
+
+    def _remove_channel(self, channel):
+        del self._queues[channel]
+        self._rotation.remove(channel)
+
+    def _next_job(self):
+        """Pop the next job of the first channel in turn that is not busy"""
+        for _ in range(len(self._rotation)):
+            channel = self._rotation[0]
+            self._rotation.rotate(-1)
+            if channel in self._busy:
+                continue
+            queue = self._queues[channel]
+            job = queue.popleft()
+            if not queue:
+                self._remove_channel(channel)
+            return job
+        return None
+
+    def _dispatch(self):
+        while self._running < self.max_concurrent:
+            job = self._next_job()
+            if job is None:
+                return
+            self._running += 1
+            self._busy.add(job.channel)
+            if job.queued and job.on_dequeued is not None:
+                job.on_dequeued()
+            IOLoop.current().spawn_callback(self._run, job)
+
+    async def _run(self, job):
+        try:
+            await job.run()
+        except Exception:
+            app_log.exception('Cell %s failed to run', job.cell_id)
+        finally:
+            self._running -= 1
+            self._busy.discard(job.channel)
+            # Channels that waited while this cell ran get their turn first
+            if job.channel in self._queues:
+                self._rotation.remove(job.channel)
+                self._rotation.append(job.channel)
+            future_set_result_unless_cancelled(job.future, None)
+            self._dispatch()
@@ -0,0 +1,181 @@
+# coding: utf8
+"""
+Snapshots of the interactive namespace, restored after a restart.
+
+Every variable is written to a file of its own, so one that can not be
+serialised is skipped with a warning instead of failing the snapshot:
+
+- Modules are recorded by name and imported again on restore.
+- Numpy arrays of at least `array_threshold` bytes are saved in the `.npy`
+  format and memory mapped on restore, so their data is only read from disk
+  when it is used.
+- Everything else is pickled.
+
+A manifest lists the files along with the size of every variable. Variables
+referring to the same object are restored as separate copies.
+"""
+import json
+import os
+import pickle
+import shutil
+import sys
+import time
+import types
+
+# The manifest of a snapshot, in the snapshot directory
+MANIFEST_NAME = 'manifest.json'
+
+
+def _is_array(value):
+    """Whether a value is a numpy array, including memmaps and subclasses"""
+    # Arrays only exist once numpy was imported
+    numpy = sys.modules.get('numpy')
+    return numpy is not None and isinstance(value, numpy.ndarray)
+
+
+def _write_variable(name, value, directory, index, array_threshold):
+    """Write a variable to a file. Returns its manifest entry"""
+    if isinstance(value, types.ModuleType):
+        return {'name': name, 'format': 'module', 'module': value.__name__}
+
+    if _is_array(value) and value.nbytes >= array_threshold and \
+            not value.dtype.hasobject:
+        import numpy
+        file_name = '{}.npy'.format(index)
+        numpy.save(os.path.join(directory, file_name),
+                   value,
+                   allow_pickle=False)
+        return {
+            'name': name,
+            'format': 'npy',
+            'file': file_name,
+            'bytes': int(value.nbytes)
+        }
+
+    data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    file_name = '{}.pkl'.format(index)
+    with open(os.path.join(directory, file_name), 'wb') as f:
+        f.write(data)
+    return {
+        'name': name,
+        'format': 'pickle',
+        'file': file_name,
+        'bytes': len(data)
+    }
+
+
+def snapshot_namespace(namespace, directory, array_threshold=1024 * 1024):
+    """Write the variables of a namespace to a snapshot directory.
+
+    The snapshot is written next to the directory and swapped in when
+    complete, so an interrupted snapshot leaves the previous one intact.
+
+    Parameters
+    ----------
+    namespace: dict
+        The namespace to snapshot. Names starting with two underscores are
+        left out
+
+    directory: str
+        The directory holding the snapshot
+
+    array_threshold: int
+        Numpy arrays of at least this many bytes are saved as `.npy` files
+
+    Returns
+    -------
+    dict
+        The manifest: the variables written, with their format and size, and
+        warnings for the variables that were skipped
+    """
+    directory = os.path.abspath(directory)
+    tmp_dir = '{}.tmp-{}'.format(directory, os.getpid())
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    start = time.perf_counter()
+    variables = []
+    warnings = []
+    items = sorted(
+        (n, v) for n, v in list(namespace.items()) if not n.startswith('__'))
+    for index, (name, value) in enumerate(items):
+        try:
+            variables.append(
+                _write_variable(name, value, tmp_dir, index, array_threshold))
+        except Exception as e:
+            warnings.append({
+                'name': name,
+                'error': '{}: {}'.format(type(e).__name__, e)
+            })
+
+    manifest = {
+        'createdAt': time.time(),
+        'python': '{}.{}'.format(*sys.version_info[:2]),
+        'duration': time.perf_counter() - start,
+        'variables': variables,
+        'warnings': warnings
+    }
+    with open(os.path.join(tmp_dir, MANIFEST_NAME), 'w') as f:
+        f.write(json.dumps(manifest))
+
+    old_dir = '{}.old-{}'.format(directory, os.getpid())
+    if os.path.exists(directory):
+        os.rename(directory, old_dir)
+    os.rename(tmp_dir, directory)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return manifest
+
+
+def read_manifest(directory):
+    """The manifest of the snapshot in a directory, or None"""
+    try:
+        with open(os.path.join(directory, MANIFEST_NAME), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _read_variable(entry, directory):
+    if entry['format'] == 'module':
+        import importlib
+        return importlib.import_module(entry['module'])
+    path = os.path.join(directory, entry['file'])
+    if entry['format'] == 'npy':
+        import numpy
+        # Copy on write, so restored arrays can still be modified in place
+        return numpy.load(path, mmap_mode='c', allow_pickle=False)
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def restore_namespace(namespace, directory):
+    """Load the variables of a snapshot into a namespace.
+
+    Snapshots are trusted: pickled variables can run code when loaded.
+
+    Returns
+    -------
+    dict
+        The names restored, and errors for the variables that failed to load.
+        None if there is no snapshot
+    """
+    manifest = read_manifest(directory)
+    if manifest is None:
+        return None
+    start = time.perf_counter()
+    restored = []
+    errors = []
+    for entry in manifest['variables']:
+        try:
+            namespace[entry['name']] = _read_variable(entry, directory)
+            restored.append(entry['name'])
+        except Exception as e:
+            errors.append({
+                'name': entry['name'],
+                'error': '{}: {}'.format(type(e).__name__, e)
+            })
+    return {
+        'restored': restored,
+        'errors': errors,
+        'duration': time.perf_counter() - start
+    }
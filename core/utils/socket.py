@@ -1,6 +1,9 @@
 # coding: utf8
+import threading
+import time
 
 from core.constants import CellEvents, CellExecutionStatus, CELLS_NAMESPACE
+from core.utils.metrics import SOCKET_EMIT_DURATION, observe_cell_output
 
 __author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
 
@@ -24,10 +27,56 @@ class LocalSocketIO:
                            namespace=self.namespace)
 
 
+class LazySocketIO:
+    """A socketio emitter that is created on first use.
+
+    Importing flask_socketio and connecting to the message queue is slow, so it
+    is deferred until the first emit, or until `connect` is called after the
+    server started listening.
+    """
+
+    def __init__(self, **kwargs):
+        """
+        Parameters
+        ----------
+        kwargs: dict
+            Keyword arguments passed on to flask_socketio.SocketIO
+        """
+        self.kwargs = kwargs
+        self._socketio = None
+        self._lock = threading.Lock()
+
+    def connect(self):
+        """Create the underlying SocketIO object if it does not exist yet"""
+        with self._lock:
+            if self._socketio is None:
+                from flask_socketio import SocketIO
+                self._socketio = SocketIO(**self.kwargs)
+        return self._socketio
+
+    def emit(self, event, args, **kwargs):
+        return self.connect().emit(event, args, **kwargs)
+
+
+class InstrumentedSocketIO:
+    """Wraps the global socketio object and records emit latency"""
+
+    def __init__(self, socketio):
+        self.socketio = socketio
+
+    def emit(self, event, args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self.socketio.emit(event, args, **kwargs)
+        finally:
+            SOCKET_EMIT_DURATION.observe(time.perf_counter() - start,
+                                         event=event)
+
+
 class CellEventsSocket:
     """A socket emitter that emits events specific to a notebook cell"""
 
-    def __init__(self, socketio, cell_id):
+    def __init__(self, socketio, cell_id, mode='shell'):
         """
         Parameters
         -----------
@@ -36,9 +85,21 @@ class CellEventsSocket:
 
         cell_id: str
             The id of the cell
+
+        mode: str, optional
+            The execution mode of the cell. Used to label output metrics
         """
         self.socketio = socketio
         self.cell_id = cell_id
+        self.mode = mode
+
+        # Output emitted so far, recorded when the run is done
+        self.lines_emitted = 0
+        self.bytes_emitted = 0
+
+    def _count(self, lines):
+        self.lines_emitted += len(lines)
+        self.bytes_emitted += sum(len(line.encode('utf-8')) for line in lines)
 
     def start(self):
         self.socketio.emit(CellEvents.START_RUN, {
@@ -46,19 +107,39 @@ class CellEventsSocket:
             'status': CellExecutionStatus.BUSY
         })
 
+    def queued(self, position):
+        self.socketio.emit(CellEvents.QUEUED, {
+            'id': self.cell_id,
+            'position': position
+        })
+
+    def dequeued(self):
+        self.socketio.emit(CellEvents.DEQUEUED, {'id': self.cell_id})
+
+    def cancelled(self):
+        """End a cell cancelled before it ran, with a start to match"""
+        self.start()
+        self.socketio.emit(CellEvents.END_RUN, {
+            'id': self.cell_id,
+            'status': CellExecutionStatus.ERROR
+        })
+
     def stdout(self, lines):
+        self._count(lines)
         self.socketio.emit(CellEvents.RESULT, {
             'id': self.cell_id,
             'output': '\n'.join(lines)
         })
 
     def stderr(self, lines):
+        self._count(lines)
         self.socketio.emit(CellEvents.RESULT, {
             'id': self.cell_id,
             'error': '\n'.join(lines)
         })
 
     def done(self, rc):
+        observe_cell_output(self.mode, self.lines_emitted, self.bytes_emitted)
         if rc != 0:
             status = CellExecutionStatus.ERROR
         else:
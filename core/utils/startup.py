@@ -0,0 +1,73 @@
+# coding: utf8
+import json
+import time
+from contextlib import contextmanager
+
+from tornado.log import app_log
+
+from core.utils.metrics import metrics
+
+STARTUP_PHASE_DURATION = metrics.gauge('runtime_startup_phase_seconds',
+                                       'Time taken by each startup phase',
+                                       ['phase'])
+
+TIME_TO_FIRST_PING = metrics.gauge(
+    'runtime_time_to_first_ping_seconds',
+    'Time from process start to the first successful ping')
+
+
+class StartupReport:
+    """Records how long each phase of runtime startup takes.
+
+    The report is logged when the first ping is answered, which is when the
+    runtime is considered ready.
+    """
+
+    def __init__(self):
+        self.phases = []
+        self.ready_at = None
+        self.time_to_ready = None
+
+    def record(self, name, seconds):
+        """Record the duration of a startup phase"""
+        self.phases.append((name, seconds))
+        STARTUP_PHASE_DURATION.set(seconds, phase=name)
+
+    @contextmanager
+    def phase(self, name):
+        """Record the duration of the wrapped block as a startup phase"""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.record(name, time.time() - start)
+
+    @staticmethod
+    def process_start_time():
+        """The time the runtime process was started"""
+        import psutil
+        return psutil.Process().create_time()
+
+    def mark_ready(self):
+        """Mark the runtime as ready. Only the first call is recorded"""
+        if self.ready_at is not None:
+            return
+        self.ready_at = time.time()
+        self.time_to_ready = self.ready_at - self.process_start_time()
+        TIME_TO_FIRST_PING.set(self.time_to_ready)
+        app_log.info('Startup report: %s', json.dumps(self.as_dict()))
+
+    def as_dict(self):
+        return {
+            'phases': [{
+                'name': name,
+                'seconds': round(seconds, 6)
+            } for name, seconds in self.phases],
+            'timeToFirstPing':
+            round(self.time_to_ready, 6)
+            if self.time_to_ready is not None else None
+        }
+
+
+# Report for the current process
+startup_report = StartupReport()
@@ -0,0 +1,117 @@
+# coding: utf8
+"""
+Direct delivery of cell events to clients connected to the runtime.
+
+Clients subscribe to channels over a websocket. Events emitted on a channel are
+sent straight to its subscribers, skipping the hops through the message queue
+and the socket.io server.
+"""
+import json
+
+from tornado.ioloop import IOLoop
+from tornado.websocket import WebSocketClosedError
+
+
+class ChannelHub:
+    """Keeps the subscribers of every channel and publishes events to them"""
+
+    def __init__(self):
+        self._subscribers = {}
+
+    def __len__(self):
+        """The number of subscriptions across all channels"""
+        return sum(len(s) for s in self._subscribers.values())
+
+    def subscribe(self, channel, subscriber):
+        """Subscribe to a channel
+
+        Parameters
+        ----------
+        channel: str
+            The channel (room) to receive events of
+
+        subscriber: tornado.websocket.WebSocketHandler
+            The connection events are written to
+        """
+        self._subscribers.setdefault(channel, set()).add(subscriber)
+
+    def unsubscribe(self, channel, subscriber):
+        subscribers = self._subscribers.get(channel)
+        if subscribers is None:
+            return
+        subscribers.discard(subscriber)
+        if not subscribers:
+            del self._subscribers[channel]
+
+    def unsubscribe_all(self, subscriber):
+        for channel in list(self._subscribers):
+            self.unsubscribe(channel, subscriber)
+
+    def has_subscribers(self, channel):
+        return bool(self._subscribers.get(channel))
+
+    def publish(self, event, args, room=None, namespace=None):
+        """Send an event to the subscribers of a room
+
+        Returns
+        -------
+        bool
+            Whether the event was handed to any subscriber
+        """
+        subscribers = self._subscribers.get(room)
+        if not subscribers:
+            return False
+        message = json.dumps({
+            'event': event,
+            'namespace': namespace,
+            'room': room,
+            'data': args
+        })
+        for subscriber in list(subscribers):
+            loop = subscriber.loop
+            if IOLoop.current(instance=False) is loop:
+                self._send(subscriber, message)
+            else:
+                # Websockets can only be written to from their own IOLoop
+                loop.add_callback(self._send, subscriber, message)
+        return True
+
+    def _send(self, subscriber, message):
+        try:
+            subscriber.write_message(message)
+        except WebSocketClosedError:
+            self.unsubscribe_all(subscriber)
+
+
+class StreamingSocketIO:
+    """Publishes emitted events to websocket subscribers of the room.
+
+    Events are still emitted over socketio, unless bypassing the message queue
+    is enabled and the room has websocket subscribers.
+    """
+
+    def __init__(self, socketio, hub, bypass_broker=False):
+        """
+        Parameters
+        ----------
+        socketio: object
+            The socketio emitter events are relayed to
+
+        hub: ChannelHub
+            The websocket subscribers
+
+        bypass_broker: bool
+            Skip socketio for rooms that have websocket subscribers
+        """
+        self.socketio = socketio
+        self.hub = hub
+        self.bypass_broker = bypass_broker
+
+    def emit(self, event, args, **kwargs):
+        delivered = self.hub.publish(event,
+                                     args,
+                                     room=kwargs.get('room'),
+                                     namespace=kwargs.get('namespace'))
+        if delivered and self.bypass_broker:
+            return
+        return self.socketio.emit(event, args, **kwargs)
@@ -0,0 +1,96 @@
+# coding: utf8
+import base64
+import os
+
+import pytest
+
+from core.constants import CellEvents
+from ..artifacts import ArtifactStore, OffloadingSocketIO
+
+
+class RecordingSocketIO:
+
+    def __init__(self):
+        self.events = []
+
+    def emit(self, event, args, **kwargs):
+        self.events.append((event, args, kwargs))
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_artifact_store(tmpdir):
+    store = ArtifactStore(str(tmpdir.join('artifacts')), max_bytes=10)
+
+    first = store.put(b'12345', 'text/plain')
+    assert store.get(first['id']) == {
+        'id': first['id'],
+        'size': 5,
+        'mimeType': 'text/plain'
+    }
+    with store.open(first['id']) as f:
+        assert f.read() == b'12345'
+    assert store.get('../../etc/passwd') is None
+    assert store.get('0' * 32) is None
+
+    # The oldest artifacts are removed beyond the size limit
+    os.utime(str(tmpdir.join('artifacts', first['id'])), (0, 0))
+    second = store.put(b'123456', 'text/plain')
+    assert store.get(first['id']) is None
+    assert store.get(second['id'])['size'] == 6
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_offloading_large_results(tmpdir):
+    store = ArtifactStore(str(tmpdir))
+    recorder = RecordingSocketIO()
+    socketio = OffloadingSocketIO(recorder, store, 10, preview_chars=4)
+    large = {'id': 'c', 'output': 'line\n' * 4, 'error': 'failed'}
+
+    socketio.emit(CellEvents.RESULT, {'id': 'c', 'output': 'small'})
+    socketio.emit(CellEvents.START_RUN, {'id': 'c', 'output': 'x' * 20})
+    socketio.emit(CellEvents.RESULT, large, room='r')
+
+    events = [event for event, _, _ in recorder.events]
+    assert events == [
+        CellEvents.RESULT, CellEvents.START_RUN, CellEvents.RESULT_REF,
+        CellEvents.RESULT
+    ]
+    assert recorder.events[1][1]['output'] == 'x' * 20
+
+    _, ref, kwargs = recorder.events[2]
+    assert (ref['id'], ref['field'], kwargs) == ('c', 'output', {'room': 'r'})
+    artifact = ref['artifact']
+    assert artifact['size'] == 20
+    assert artifact['mimeType'] == 'text/plain; charset=utf-8'
+    assert artifact['preview'] == 'line'
+    with store.open(artifact['id']) as f:
+        assert f.read() == b'line\n' * 4
+
+    # Small fields stay inline
+    assert recorder.events[3][1] == {'id': 'c', 'error': 'failed'}
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_offloading_data_uri(tmpdir):
+    store = ArtifactStore(str(tmpdir))
+    recorder = RecordingSocketIO()
+    socketio = OffloadingSocketIO(recorder, store, 10)
+    image = b'\x89PNG' + bytes(range(32))
+
+    socketio.emit(
+        CellEvents.RESULT, {
+            'id':
+            'c',
+            'output':
+            'data:image/png;base64,' + base64.b64encode(image).decode('ascii')
+        })
+
+    assert len(recorder.events) == 1
+    artifact = recorder.events[0][1]['artifact']
+    assert artifact['mimeType'] == 'image/png'
+    assert artifact['preview'] is None
+    with store.open(artifact['id']) as f:
+        assert f.read() == image
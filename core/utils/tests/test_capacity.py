@@ -0,0 +1,72 @@
+# coding: utf8
+import time
+
+import pytest
+from tornado import gen
+from tornado.ioloop import IOLoop
+
+from ..capacity import Capacity, LoopLagMonitor
+from ..drain import Drain
+from ..process_registry import ProcessRegistry
+from ..scheduler import CellScheduler
+
+
+class FakeLagMonitor:
+
+    def __init__(self, lag):
+        self.lag = lag
+
+
+class FakePRO:
+
+    def __init__(self, cell_id):
+        self.cell_id = cell_id
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_capacity_thresholds():
+    registry = ProcessRegistry()
+    scheduler = CellScheduler()
+    drain = Drain(registry, scheduler, None)
+    monitor = FakeLagMonitor(0.01)
+    capacity = Capacity(registry,
+                        scheduler,
+                        monitor,
+                        drain,
+                        max_processes=1,
+                        max_loop_lag=0.5)
+
+    report = capacity.report()
+    assert report['ready'] and report['reasons'] == []
+    assert report['processes'] == 0 and report['loopLag'] == 0.01
+    assert report['memoryTotal'] > 0
+
+    registry.add(FakePRO('a'))
+    registry.add(FakePRO('b'))
+    monitor.lag = 2
+    drain.draining = True
+    report = capacity.report()
+    assert not report['ready']
+    assert report['reasons'] == ['draining', 'processes', 'loopLag']
+
+    capacity.min_memory_available = report['memoryTotal'] + 1
+    assert 'memoryAvailable' in capacity.report()['reasons']
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_loop_lag_monitor():
+    monitor = LoopLagMonitor(interval=0.02)
+    assert monitor.lag == 0
+
+    @gen.coroutine
+    def main():
+        monitor.start()
+        yield gen.sleep(0.05)
+        # Block the loop, so the next tick is late
+        time.sleep(0.2)
+        assert monitor.lag >= 0.1
+        monitor.stop()
+
+    IOLoop.current().run_sync(main)
@@ -0,0 +1,113 @@
+# coding: utf8
+import asyncio
+import signal
+import time
+
+import pytest
+import tornado.web
+from tornado import gen
+from tornado.ioloop import IOLoop
+
+from core.constants import CellEvents, CellExecutionStatus
+from ..drain import Drain
+from ..process import AsyncProcess
+from ..process_registry import ProcessRegistry, ProcessRegistryObject
+from ..scheduler import CellScheduler
+
+
+class RecordingSocketIO:
+
+    def __init__(self):
+        self.events = []
+
+    def emit(self, event, args, **kwargs):
+        self.events.append((event, args))
+
+
+def run_sleep(registry, cell_id, seconds, done):
+    pro = ProcessRegistryObject(registry, cell_id=cell_id)
+    return AsyncProcess(pro,
+                        stdout_cb=lambda lines: None,
+                        stderr_cb=lambda lines: None,
+                        done_cb=done.append).run(['sleep',
+                                                  str(seconds)])
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_drain_waits_for_processes():
+    registry = ProcessRegistry()
+    drain = Drain(registry, CellScheduler(), RecordingSocketIO())
+    done = []
+
+    @gen.coroutine
+    def main():
+        IOLoop.current().spawn_callback(run_sleep, registry, 'c', 0.2, done)
+        yield gen.sleep(0.05)
+        killed = yield drain.run(timeout=5, interval=0.01)
+        assert killed == 0
+
+    IOLoop.current().run_sync(main)
+
+    assert done == [0]
+    with pytest.raises(tornado.web.HTTPError) as e:
+        drain.reject_if_draining()
+    assert e.value.status_code == 503
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_drain_kills_processes_after_deadline():
+    registry = ProcessRegistry()
+    scheduler = CellScheduler(max_concurrent=1)
+    socketio = RecordingSocketIO()
+    drain = Drain(registry, scheduler, socketio)
+    done = []
+
+    @gen.coroutine
+    def main():
+        scheduler.submit('a', 'running',
+                         lambda: run_sleep(registry, 'running', 30, done))
+        scheduler.submit('a', 'queued', lambda: gen.sleep(0))
+        yield gen.sleep(0.05)
+        started = time.monotonic()
+        killed = yield drain.run(timeout=0.1, interval=0.01)
+        assert killed == 1
+        assert time.monotonic() - started < 5
+
+    IOLoop.current().run_sync(main)
+
+    assert len(done) == 1 and done[0] != 0
+    assert len(registry) == 0 and scheduler.running == 0
+    start_event = {'id': 'queued', 'status': CellExecutionStatus.BUSY}
+    end_event = {'id': 'queued', 'status': CellExecutionStatus.ERROR}
+    assert socketio.events == [(CellEvents.START_RUN, start_event),
+                               (CellEvents.END_RUN, end_event)]
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_drain_kills_tracked_runs():
+    drain = Drain(ProcessRegistry(), CellScheduler(), RecordingSocketIO())
+    returncodes = []
+
+    async def endpoint_run():
+        with drain.tracking() as on_start:
+            p = await asyncio.create_subprocess_exec('sleep',
+                                                     '30',
+                                                     start_new_session=True)
+            on_start(p.pid)
+            returncodes.append(await p.wait())
+
+    @gen.coroutine
+    def main():
+        IOLoop.current().spawn_callback(endpoint_run)
+        yield gen.sleep(0.05)
+        assert len(drain) == 1
+        killed = yield drain.run(timeout=0.1, interval=0.01)
+        assert killed == 1
+
+    IOLoop.current().run_sync(main)
+
+    assert returncodes == [-signal.SIGKILL]
+    assert len(drain) == 0
@@ -0,0 +1,84 @@
+# coding: utf8
+import json
+
+import pytest
+
+from ..endpoint_registry import EndpointRegistry
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_registry_versions_and_activation(tmpdir):
+    registry = EndpointRegistry(str(tmpdir))
+
+    assert registry.put({'name': 'score', 'signature': 'v1()'}) == 1
+    assert registry.put({
+        'name': 'score',
+        'signature': 'v2()'
+    }, activate=False) == 2
+    # Staged versions do not serve requests
+    assert registry.get('score')['signature'] == 'v1()'
+    assert json.loads(tmpdir.join('score.config').read()) == {
+        'name': 'score',
+        'signature': 'v1()'
+    }
+
+    registry.activate('score', 2)
+    assert registry.get('score')['signature'] == 'v2()'
+    assert registry.describe('score')['activeVersion'] == 2
+    assert json.loads(
+        tmpdir.join('score.config').read())['signature'] == 'v2()'
+
+    with pytest.raises(KeyError):
+        registry.activate('score', 3)
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_registry_delete(tmpdir):
+    registry = EndpointRegistry(str(tmpdir))
+    registry.put({'name': 'score', 'filePath': 'score.py'})
+    assert registry.list() == [{
+        'name': 'score',
+        'activeVersion': 1,
+        'versions': 1,
+        'filePath': 'score.py'
+    }]
+
+    registry.delete('score')
+    assert registry.get('score') is None
+    assert registry.list() == []
+    assert not tmpdir.join('score.config').exists()
+    with pytest.raises(KeyError):
+        registry.delete('score')
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_registry_shares_log_between_instances(tmpdir):
+    first = EndpointRegistry(str(tmpdir))
+    second = EndpointRegistry(str(tmpdir), refresh_interval=60)
+
+    first.put({'name': 'score', 'signature': 'v1()'})
+    # Unknown names are looked up in the log right away
+    assert second.get('score')['signature'] == 'v1()'
+
+    second.put({'name': 'score', 'signature': 'v2()'})
+    assert first.describe('score')['activeVersion'] == 2
+
+    # A partially written line is not applied
+    with open(first.log_path, 'a') as f:
+        f.write('{"op": "delete"')
+    assert EndpointRegistry(str(tmpdir)).get('score')['signature'] == 'v2()'
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_registry_imports_config_files(tmpdir):
+    tmpdir.join('legacy.config').write(json.dumps({'name': 'legacy'}))
+
+    registry = EndpointRegistry(str(tmpdir))
+    assert registry.get('legacy') == {'name': 'legacy'}
+
+    with pytest.raises(ValueError):
+        registry.put({'name': '../escape'})
@@ -0,0 +1,105 @@
+# coding: utf8
+import os
+
+import pytest
+from tornado import gen
+from tornado.ioloop import IOLoop
+
+from ..endpoint_workers import EndpointWorkerPool
+
+
+@gen.coroutine
+def warm(pool, target):
+    """Wait until the pool has a generation for target that is not stale"""
+    if target not in pool._generations:
+        pool.reload(target)
+    for _ in range(200):
+        pool.check()
+        if target in pool._generations and target not in pool._building:
+            return pool._generations[target]
+        yield gen.sleep(0.05)
+    raise AssertionError('Workers for {} did not start'.format(target))
+
+
+def run(zygote, target, root):
+    return zygote.run(target, root, {'PYTHONPATH': os.pathsep.join([root])})[1]
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_worker_pool_preloads_and_reloads_on_change(tmpdir):
+    root = str(tmpdir)
+    tmpdir.join('helper.py').write('import json\nVALUE = 1\n')
+    target = str(tmpdir.join('target.py'))
+    tmpdir.join('target.py').write('import helper\nprint(helper.VALUE)\n')
+    pool = EndpointWorkerPool(root)
+
+    @gen.coroutine
+    def main():
+        with pool.lease(target) as zygote:
+            # Nothing is warm yet, callers fall back
+            assert zygote is None
+        first = yield warm(pool, target)
+        assert 'helper' in first.zygote.preload
+        assert 'json' in first.zygote.preload
+
+        with pool.lease(target) as zygote:
+            assert run(zygote, target, root) == '1\n'
+
+            # Rewriting with the same contents keeps the generation
+            tmpdir.join('helper.py').write('import json\nVALUE = 1\n')
+            os.utime(str(tmpdir.join('helper.py')), ns=(0, 0))
+            pool.file_changed(str(tmpdir.join('helper.py')))
+            assert target not in pool._building
+
+            tmpdir.join('helper.py').write('import json\nVALUE = 2\n')
+            pool.file_changed(str(tmpdir.join('helper.py')))
+            second = yield warm(pool, target)
+            assert second is not first
+
+            # The old generation serves the run it was leased for
+            assert first.retired and first.zygote.is_running()
+            assert run(zygote, target, root) == '1\n'
+
+        yield gen.sleep(0.2)
+        assert not first.zygote.is_running()
+        with pool.lease(target) as zygote:
+            assert zygote is second.zygote
+            assert run(zygote, target, root) == '2\n'
+
+    try:
+        IOLoop.current().run_sync(main, timeout=30)
+    finally:
+        pool.close()
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_worker_pool_evicts_least_recently_used(tmpdir):
+    root = str(tmpdir)
+    targets = []
+    for name in 'abc':
+        tmpdir.join('{}.py'.format(name)).write('print("{}")\n'.format(name))
+        targets.append(str(tmpdir.join('{}.py'.format(name))))
+    pool = EndpointWorkerPool(root, max_targets=2)
+
+    @gen.coroutine
+    def main():
+        first = yield warm(pool, targets[0])
+        yield warm(pool, targets[1])
+        yield warm(pool, targets[2])
+        assert list(pool._generations) == targets[1:]
+        assert first.retired
+        yield gen.sleep(0.2)
+        assert not first.zygote.is_running()
+
+        # Removed targets lose their workers
+        os.unlink(targets[2])
+        pool.check()
+        yield gen.sleep(0.2)
+        assert list(pool._generations) == targets[1:2]
+
+    try:
+        IOLoop.current().run_sync(main, timeout=30)
+    finally:
+        pool.close()
@@ -0,0 +1,143 @@
+# coding: utf8
+import hashlib
+import os
+
+import pytest
+
+from ..file_index import FileIndex
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_file_index_tracks_changes(tmpdir):
+    f = tmpdir.join('a.py')
+    f.write('one')
+    index = FileIndex(str(tmpdir))
+
+    entry = index.get('a.py')
+    assert entry.path == 'a.py'
+    assert entry.size == 3
+    assert entry.digest == hashlib.sha256(b'one').hexdigest()
+    assert index.read(str(f)) == b'one'
+    # Unchanged files keep their entry
+    assert index.get(str(f)) is entry
+
+    f.write('three')
+    assert index.get('a.py').digest == hashlib.sha256(b'three').hexdigest()
+    assert index.read('a.py') == b'three'
+
+    f.remove()
+    assert index.get('a.py') is None
+    assert index.read('a.py') is None
+    assert index.get('missing.py') is None
+    assert index.get('.') is None
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_file_index_serves_cached_contents(tmpdir):
+    f = tmpdir.join('a.py')
+    f.write('cached')
+    index = FileIndex(str(tmpdir))
+    index.update('a.py', b'cached')
+
+    # Contents come from memory while the size and mtime are unchanged
+    st = os.stat(str(f))
+    f.write('CACHED')
+    os.utime(str(f), ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert index.read('a.py') == b'cached'
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_file_index_bounds_cache(tmpdir):
+    index = FileIndex(str(tmpdir), cache_max_bytes=10, cache_max_file_bytes=6)
+    for name, content in [('a', b'12345'), ('b', b'12345'), ('c', b'1234567')]:
+        tmpdir.join(name).write_binary(content)
+        index.read(name)
+
+    assert list(index._contents) == ['a', 'b']
+    index.read('a')
+    tmpdir.join('d').write_binary(b'12345')
+    index.read('d')
+    # The least recently used file is evicted
+    assert list(index._contents) == ['a', 'd']
+    assert index._cache_bytes == 10
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_file_index_lists_directories(tmpdir):
+    for path in ['a.py', 'pkg/b.py', 'pkg/sub/c.py', 'pkg0.py', 'pkga/d.py']:
+        tmpdir.join(path).write('x', ensure=True)
+    index = FileIndex(str(tmpdir), scan_interval=60)
+
+    total, entries = index.list()
+    assert total == 5
+    assert [e.path for e in entries
+            ] == ['a.py', 'pkg/b.py', 'pkg/sub/c.py', 'pkg0.py', 'pkga/d.py']
+    assert all(e.digest is None for e in entries)
+
+    total, entries = index.list('pkg', offset=1, limit=5)
+    assert total == 2
+    assert [e.path for e in entries] == ['pkg/sub/c.py']
+
+    # Scans are reused within the interval, writes are seen at once
+    tmpdir.join('pkg/new.py').write('x')
+    assert index.list('pkg')[0] == 2
+    index.update('pkg/new.py', b'x')
+    assert index.list('pkg')[0] == 3
+    index.scan(force=True)
+    tmpdir.join('pkg/b.py').remove()
+    index.scan(force=True)
+    assert [e.path
+            for e in index.list('pkg')[1]] == ['pkg/new.py', 'pkg/sub/c.py']
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_file_index_diff(tmpdir):
+    for path, content in [('same.py', 'same'), ('changed.py', 'new'),
+                          ('added.py', 'added'), ('other/x.py', 'x')]:
+        tmpdir.join(path).write(content, ensure=True)
+    index = FileIndex(str(tmpdir))
+
+    def sha(content):
+        return hashlib.sha256(content).hexdigest()
+
+    diff = index.diff({
+        'same.py': sha(b'same'),
+        'changed.py': sha(b'old'),
+        'removed.py': sha(b'removed')
+    })
+    assert diff == {
+        'added': ['added.py', 'other/x.py'],
+        'changed': ['changed.py'],
+        'removed': ['removed.py']
+    }
+
+    diff = index.diff({'same.py': sha(b'same')}, directory='other')
+    assert diff == {'added': ['other/x.py'], 'changed': [], 'removed': []}
+
+
+class LockCheckingIndex(FileIndex):
+
+    def _read_digest(self, rel, size):
+        assert not self._lock.locked()
+        return super()._read_digest(rel, size)
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_file_index_diff_hashes_without_lock(tmpdir):
+    tmpdir.join('a.py').write('a')
+    tmpdir.join('large.py').write('x' * 100)
+    index = LockCheckingIndex(str(tmpdir), cache_max_file_bytes=10)
+
+    diff = index.diff({})
+
+    assert diff['added'] == ['a.py', 'large.py']
+    assert index.get('large.py').digest == hashlib.sha256(b'x' *
+                                                          100).hexdigest()
+    # Small files hashed by the diff are cached
+    assert index._contents['a.py'] == b'a'
@@ -1,7 +1,8 @@
 import pytest
 import os
 
-from ..file_utils import create_temporary_shell_file, secure_relative_file_path
+from ..file_utils import create_temporary_shell_file, secure_relative_file_path, \
+    find_local_imports, find_external_imports
 
 
 @pytest.mark.unit
@@ -22,3 +23,50 @@ def test_secure_absolute_path():
     assert secure_relative_file_path('../../../.ssh/config') == '.ssh/config'
     assert secure_relative_file_path('~/config') == 'config'
     assert secure_relative_file_path('../../~/config') == 'config'
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_find_local_imports(tmpdir):
+    root = tmpdir.mkdir('root')
+    pkg = root.mkdir('pkg')
+    pkg.join('__init__.py').write('')
+    pkg.join('models.py').write('from . import helpers\n')
+    pkg.join('helpers.py').write('import json\n')
+    root.join('util.py').write('import os\n')
+    scripts = root.mkdir('scripts')
+    scripts.join('sibling.py').write('')
+    main = scripts.join('main.py')
+    main.write('import numpy\nimport util\nimport sibling\n'
+               'from pkg.models import Model\n')
+
+    found = find_local_imports(str(main), str(root))
+
+    assert found == sorted([
+        str(pkg.join('__init__.py')),
+        str(pkg.join('models.py')),
+        str(pkg.join('helpers.py')),
+        str(root.join('util.py')),
+        str(scripts.join('sibling.py'))
+    ])
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_find_local_imports_syntax_error(tmpdir):
+    main = tmpdir.join('main.py')
+    main.write('import (')
+    assert find_local_imports(str(main), str(tmpdir)) == []
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_find_external_imports(tmpdir):
+    root = tmpdir.mkdir('root')
+    root.join('util.py').write('import json\nfrom collections import deque\n')
+    main = root.join('main.py')
+    main.write('from __future__ import annotations\nimport os.path, util\n'
+               'from . import sibling\nfrom util import helper\n')
+
+    assert find_external_imports(
+        str(main), str(root)) == ['collections', 'json', 'os.path']
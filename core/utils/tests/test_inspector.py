@@ -0,0 +1,167 @@
+# coding: utf8
+import collections
+import sys
+
+import pytest
+
+from ..inspector import NamespaceInspector
+
+
+class Point:
+
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_inspector_lists_variables():
+    namespace = {
+        '__builtins__': {},
+        'count': 3,
+        'text': 'x' * 1000,
+        'items': list(range(10000)),
+        'point': Point(1, [2, 3]),
+        'mapping': {
+            'a': 1
+        }
+    }
+    inspector = NamespaceInspector(preview_chars=20)
+
+    page = inspector.list(namespace, offset=1, limit=3)
+
+    assert page['total'] == 5
+    assert [v['name'] for v in page['items']] == ['items', 'mapping', 'point']
+    items, mapping, point = page['items']
+    assert items['type'] == 'list'
+    assert items['length'] == 10000
+    assert items['expandable']
+    assert not items['bytesExact']
+    assert items['bytes'] >= sys.getsizeof(namespace['items'])
+    assert len(items['preview']) <= 20
+    assert mapping['preview'] == "{'a': 1}"
+    assert point['type'].endswith('Point')
+    assert point['expandable']
+
+    text = inspector.list(namespace, offset=4, limit=1)['items'][0]
+    assert text['name'] == 'text'
+    assert text['bytesExact'] and not text['expandable']
+    assert len(text['preview']) == 20
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_inspector_time_budget():
+    namespace = {'a': 1, 'b': 2}
+    inspector = NamespaceInspector(time_budget=0)
+
+    items = inspector.list(namespace)['items']
+
+    assert items == [{
+        'name': 'a',
+        'type': 'int',
+        'partial': True
+    }, {
+        'name': 'b',
+        'type': 'int',
+        'partial': True
+    }]
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_inspector_expands_containers():
+    namespace = {
+        'data': {
+            'rows': [{
+                'id': i
+            } for i in range(50)],
+            1: 'one'
+        },
+        'point': Point(1, [2, 3])
+    }
+    inspector = NamespaceInspector()
+
+    page = inspector.expand(namespace, ['data', 'rows'], offset=10, limit=2)
+    assert page['total'] == 50
+    assert page['value']['length'] == 50
+    assert [v['name'] for v in page['items']] == ['10', '11']
+    assert page['items'][0]['preview'] == "{'id': 10}"
+
+    assert inspector.resolve(namespace, ['data', '1']) == 'one'
+    assert inspector.resolve(namespace, ['data', 'rows', '3', 'id']) == 3
+    page = inspector.expand(namespace, ['point'])
+    assert [v['name'] for v in page['items']] == ['x', 'y']
+
+    for path in [['missing'], ['data', 'other'], ['data', 'rows', '50'],
+                 ['data', '1']]:
+        with pytest.raises(KeyError):
+            inspector.expand(namespace, path)
+
+
+class Growing:
+    """Adds a key to its parent when its size is estimated"""
+
+    def __init__(self, parent):
+        self.parent = parent
+
+    def __sizeof__(self):
+        self.parent['added{}'.format(len(self.parent))] = 0
+        return 0
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_inspector_truncates_pages_of_changed_containers():
+    mapping = {'a': 1}
+    mapping['b'] = Growing(mapping)
+    mapping['c'] = 3
+    namespace = {'mapping': mapping}
+    inspector = NamespaceInspector()
+
+    page = inspector.expand(namespace, ['mapping'])
+    assert page['truncated']
+    assert [v['name'] for v in page['items']] == ['a', 'b']
+
+    page = inspector.expand(namespace, ['mapping'], limit=1)
+    assert not page['truncated']
+
+
+class Rows(list):
+
+    def __repr__(self):
+        raise AssertionError('The full repr is not built')
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_inspector_bounds_previews_of_subclasses():
+    inspector = NamespaceInspector()
+    counts = collections.defaultdict(int)
+    for i in range(1000):
+        counts[i] += 1
+
+    assert inspector.preview(counts).startswith('defaultdict({0: 1, 1: 1, ')
+    assert inspector.preview(counts).endswith(', ...})')
+    assert inspector.preview(collections.Counter('aab')) == \
+        "Counter({'a': 2, 'b': 1})"
+    assert inspector.preview({3, 1, 2}) == '{1, 2, 3}'
+
+    summary = inspector.summarize('rows', Rows(range(1000)))
+    assert 'error' not in summary
+    assert summary['preview'].startswith('Rows([0, 1, 2, ')
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_inspector_array_subclasses():
+    numpy = pytest.importorskip('numpy')
+
+    class Frame(numpy.ndarray):
+        pass
+
+    summary = NamespaceInspector().summarize('frame',
+                                             numpy.zeros(4).view(Frame))
+    assert summary['bytes'] == 32
+    assert summary['bytesExact']
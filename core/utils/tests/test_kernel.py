@@ -0,0 +1,75 @@
+# coding: utf8
+import code
+from io import StringIO
+
+import pytest
+
+from ..kernel import KernelLoop, capture_output, compile_cell, \
+    is_async_cell, TOP_LEVEL_AWAIT, _GlobalVar
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_compile_cell_without_top_level_await():
+    assert not is_async_cell(compile_cell('x = 1'))
+    if not TOP_LEVEL_AWAIT:
+        with pytest.raises(SyntaxError):
+            compile_cell('import asyncio\nawait asyncio.sleep(0)')
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_global_var():
+    var = _GlobalVar(default=None)
+    token = var.set('a')
+    inner = var.set('b')
+    assert var.get() == 'b'
+    var.reset(inner)
+    assert var.get() == 'a'
+    var.reset(token)
+    assert var.get() is None
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+@pytest.mark.skipif(not TOP_LEVEL_AWAIT, reason='Needs Python 3.8')
+def test_compile_cell_detects_top_level_await():
+    assert is_async_cell(
+        compile_cell('import asyncio\nawait asyncio.sleep(0)'))
+    assert not is_async_cell(compile_cell('x = 1'))
+    assert not is_async_cell(compile_cell('async def f():\n    await g()'))
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+@pytest.mark.skipif(not TOP_LEVEL_AWAIT, reason='Needs Python 3.8')
+def test_kernel_loop_runs_cell_in_console_namespace():
+    kernel = KernelLoop()
+    console = code.InteractiveConsole()
+    out, err = StringIO(), StringIO()
+    try:
+        future = kernel.run_cell(
+            console,
+            compile_cell('import asyncio\n'
+                         'value = await asyncio.sleep(0, result=7)\n'
+                         'print(value)\n'
+                         '1 / 0'), out, err)
+        future.result(timeout=5)
+    finally:
+        kernel.stop()
+
+    assert console.locals['value'] == 7
+    assert out.getvalue() == '7\n'
+    assert 'ZeroDivisionError' in err.getvalue()
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_capture_output_is_scoped_to_block(capsys):
+    out, err = StringIO(), StringIO()
+    with capture_output(out, err):
+        print('captured')
+    print('not captured')
+
+    assert out.getvalue() == 'captured\n'
+    assert capsys.readouterr().out == 'not captured\n'
@@ -0,0 +1,70 @@
+# coding: utf8
+import pytest
+
+from ..metrics import MetricsRegistry, observe_cell_text, CELL_OUTPUT_LINES, \
+    CELL_OUTPUT_BYTES
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_counter_render():
+    r = MetricsRegistry()
+    c = r.counter('test_events', 'Events seen', ['kind'])
+
+    c.inc(kind='a')
+    c.inc(2, kind='a')
+
+    assert c.get(kind='a') == 3
+    assert 'test_events_total{kind="a"} 3' in r.render()
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_gauge_function():
+    r = MetricsRegistry()
+    items = [1, 2]
+    g = r.gauge('test_size', 'Size of items')
+    g.set_function(lambda: len(items))
+
+    assert 'test_size 2' in r.render()
+    items.append(3)
+    assert 'test_size 3' in r.render()
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_histogram_buckets():
+    r = MetricsRegistry()
+    h = r.histogram('test_latency', 'Latency', ['route'], buckets=(0.1, 1))
+
+    h.observe(0.05, route='/ping')
+    h.observe(0.5, route='/ping')
+    h.observe(5, route='/ping')
+
+    assert h.get(route='/ping') == (3, 5.55)
+
+    text = r.render()
+    assert '# TYPE test_latency histogram' in text
+    assert 'test_latency_bucket{route="/ping",le="0.1"} 1' in text
+    assert 'test_latency_bucket{route="/ping",le="1"} 2' in text
+    assert 'test_latency_bucket{route="/ping",le="+Inf"} 3' in text
+    assert 'test_latency_count{route="/ping"} 3' in text
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_registry_returns_existing_metric():
+    r = MetricsRegistry()
+    assert r.counter('a', 'doc') is r.counter('a', 'doc')
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_observe_cell_text():
+    count, total = CELL_OUTPUT_LINES.get(mode='test')
+    bcount, btotal = CELL_OUTPUT_BYTES.get(mode='test')
+
+    observe_cell_text('test', 'a\nb\n', 'c')
+
+    assert CELL_OUTPUT_LINES.get(mode='test') == (count + 1, total + 3)
+    assert CELL_OUTPUT_BYTES.get(mode='test') == (bcount + 1, btotal + 5)
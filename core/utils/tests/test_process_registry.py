@@ -1,12 +1,16 @@
 # coding: utf8
 import pytest
+import signal
+import subprocess
 
-from ..process_registry import ProcessRegistry, ProcessRegistryObject
+from ..process_registry import ProcessRegistry, ProcessRegistryObject, \
+    SharedProcessRegistry, RemoteProcessRegistryObject
 
 __author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
 
 
 class FakePRO:
+
     def __init__(self):
         self.cell_id = 'cid'
 
@@ -63,3 +67,96 @@ def test_process_registry_object_deregister():
     pro.deregister()
 
     assert r.get_process_info('cid') is None
+
+
+class FakeProcess:
+
+    def __init__(self, pid):
+        self.pid = pid
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_process_registry_remove_ignores_replaced_object():
+    r = ProcessRegistry()
+
+    old = ProcessRegistryObject(r, 'cid')
+    old.register('p1')
+    new = ProcessRegistryObject(r, 'cid')
+    new.register('p2')
+
+    old.deregister()
+
+    assert r.get_process_info('cid') is new
+    assert len(r) == 1
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_shared_process_registry_cross_worker_lookup(tmpdir):
+    path = str(tmpdir.join('registry.db'))
+    first = SharedProcessRegistry(path, worker_id=0)
+    second = SharedProcessRegistry(path, worker_id=1)
+
+    pro = ProcessRegistryObject(first, 'cid')
+    pro.register(FakeProcess(1234))
+
+    assert first.get_process_info('cid') is pro
+
+    remote = second.get_process_info('cid')
+    assert isinstance(remote, RemoteProcessRegistryObject)
+    assert remote.pid == 1234
+    assert remote.worker_id == 0
+    assert len(second) == 0
+
+    pro.deregister()
+
+    assert first.get_process_info('cid') is None
+    assert second.get_process_info('cid') is None
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_shared_process_registry_clears_stale_rows(tmpdir):
+    path = str(tmpdir.join('registry.db'))
+    first = SharedProcessRegistry(path, worker_id=0)
+    ProcessRegistryObject(first, 'cid').register(FakeProcess(1234))
+    first.close()
+
+    # Worker 0 restarted
+    SharedProcessRegistry(path, worker_id=0)
+
+    assert SharedProcessRegistry(path,
+                                 worker_id=1).get_process_info('cid') is None
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+@pytest.mark.asyncio
+async def test_remote_process_registry_object_kill(tmpdir):
+    path = str(tmpdir.join('registry.db'))
+    first = SharedProcessRegistry(path, worker_id=0)
+    second = SharedProcessRegistry(path, worker_id=1)
+
+    process = subprocess.Popen(['sleep', '10'])
+    ProcessRegistryObject(first, 'cid').register(process)
+
+    await second.get_process_info('cid').kill()
+
+    assert process.wait(timeout=5) == -signal.SIGKILL
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+@pytest.mark.asyncio
+async def test_remote_process_registry_object_kill_missing_process(tmpdir):
+    path = str(tmpdir.join('registry.db'))
+    first = SharedProcessRegistry(path, worker_id=0)
+    second = SharedProcessRegistry(path, worker_id=1)
+
+    process = subprocess.Popen(['true'])
+    process.wait()
+    ProcessRegistryObject(first, 'cid').register(process)
+
+    assert await second.get_process_info('cid').kill() is None
+    assert second.get_process_info('cid') is None
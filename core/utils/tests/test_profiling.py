@@ -0,0 +1,57 @@
+# coding: utf8
+import pytest
+
+from ..profiling import CellProfiler
+
+
+def slow_function():
+    return sum(i * i for i in range(10000))
+
+
+def caller():
+    return slow_function()
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_cell_profiler_runcall():
+    profiler = CellProfiler(limit=3)
+    assert profiler.runcall(caller) == slow_function()
+
+    hotspots = profiler.hotspots()
+    assert hotspots['totalTime'] >= 0
+    assert len(hotspots['cumulative']) == 3
+    assert len(hotspots['self']) <= 3
+
+    functions = [row['function'] for row in hotspots['cumulative']]
+    assert any(f.endswith('(caller)') for f in functions)
+
+    row = hotspots['cumulative'][0]
+    assert set(row.keys()) == {
+        'function', 'calls', 'primitiveCalls', 'selfTime', 'cumulativeTime'
+    }
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_cell_profiler_skips_runtime_frames():
+    import code
+    console = code.InteractiveConsole()
+    profiler = CellProfiler()
+    profiler.runcall(console.runcode, 'x = sum(range(10))')
+
+    functions = [row['function'] for row in profiler.hotspots()['cumulative']]
+    assert not any('runcode' in f for f in functions)
+    assert not any('_lsprof' in f for f in functions)
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_cell_profiler_without_runs():
+    profiler = CellProfiler()
+    assert not profiler.ran
+    assert profiler.hotspots() == {
+        'totalTime': 0,
+        'cumulative': [],
+        'self': []
+    }
@@ -0,0 +1,79 @@
+# coding: utf8
+import os
+import time
+
+import pytest
+
+from ..run_cache import RunCache
+
+
+@pytest.fixture(scope='function')
+def project(tmpdir):
+    root = tmpdir.mkdir('files')
+    root.join('helper.py').write('VALUE = 1\n')
+    root.join('main.py').write('import helper\nprint(helper.VALUE)\n')
+    return root
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_run_cache_key_tracks_imports(project):
+    cache = RunCache(str(project.join('.cache')))
+    main = str(project.join('main.py'))
+
+    key = cache.key(main, str(project))
+    assert key == cache.key(main, str(project))
+
+    project.join('helper.py').write('VALUE = 2\n')
+    assert cache.key(main, str(project)) != key
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_run_cache_get_put(tmpdir):
+    cache = RunCache(str(tmpdir.join('cache')))
+
+    assert cache.get('abc') is None
+
+    cache.put('abc', {'output': 'Hello\n', 'error': '', 'status': 'done'})
+
+    assert cache.get('abc') == {
+        'output': 'Hello\n',
+        'error': '',
+        'status': 'done'
+    }
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_run_cache_evicts_least_recently_used(tmpdir):
+    root = tmpdir.join('cache')
+    cache = RunCache(str(root), max_entries=2)
+
+    cache.put('a', {'output': 'a'})
+    cache.put('b', {'output': 'b'})
+
+    # Make a older than b, then use it so b becomes least recently used
+    past = time.time() - 10
+    os.utime(str(root.join('a.json')), (past, past))
+    os.utime(str(root.join('b.json')), (past + 1, past + 1))
+    assert cache.get('a') is not None
+
+    cache.put('c', {'output': 'c'})
+
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert cache.get('c') is not None
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_run_cache_max_bytes(tmpdir):
+    cache = RunCache(str(tmpdir.join('cache')), max_bytes=100)
+
+    cache.put('big', {'output': 'x' * 200})
+    assert cache.get('big') is None
+
+    cache.put('a', {'output': 'x' * 40})
+    cache.put('b', {'output': 'x' * 40})
+    assert len(os.listdir(str(tmpdir.join('cache')))) == 1
@@ -0,0 +1,35 @@
+# coding: utf8
+import threading
+
+import pytest
+
+from ..sampler import sample_stacks, format_collapsed
+
+
+def spin_until(event):
+    while not event.is_set():
+        pass
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_sample_stacks():
+    stop = threading.Event()
+    thread = threading.Thread(target=spin_until, args=(stop, ), name='spinner')
+    thread.start()
+    try:
+        stacks = sample_stacks(0.1, interval=0.001)
+    finally:
+        stop.set()
+        thread.join()
+
+    spinning = [s for s in stacks if s.startswith('spinner;')]
+    assert spinning
+    assert all(';spin_until (test_sampler.py:' in s for s in spinning)
+    # The sampling thread leaves itself out
+    assert not any('sample_stacks' in s for s in stacks)
+
+    lines = format_collapsed(stacks).splitlines()
+    assert len(lines) == len(stacks)
+    counts = [int(line.rsplit(' ', 1)[1]) for line in lines]
+    assert counts == sorted(counts, reverse=True)
@@ -0,0 +1,142 @@
+# coding: utf8
+import pytest
+from tornado import gen
+from tornado.ioloop import IOLoop
+
+from ..scheduler import CellScheduler
+
+
+def make_cell(log, name, delay=0.01):
+
+    @gen.coroutine
+    def run():
+        log.append(('start', name))
+        yield gen.sleep(delay)
+        log.append(('end', name))
+
+    return run
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_scheduler_runs_channel_in_order():
+    log = []
+    queued = []
+
+    @gen.coroutine
+    def main():
+        scheduler = CellScheduler(max_concurrent=4)
+        futures = [
+            scheduler.submit('a',
+                             str(i),
+                             make_cell(log, i),
+                             on_queued=lambda p, i=i: queued.append((i, p)))
+            for i in range(3)
+        ]
+        assert len(scheduler) == 2
+        yield futures
+
+    IOLoop.current().run_sync(main)
+
+    assert log == [('start', 0), ('end', 0), ('start', 1), ('end', 1),
+                   ('start', 2), ('end', 2)]
+    assert queued == [(1, 1), (2, 2)]
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_scheduler_round_robins_channels():
+    log = []
+
+    @gen.coroutine
+    def main():
+        scheduler = CellScheduler(max_concurrent=1)
+        futures = [
+            scheduler.submit('busy', 'b{}'.format(i),
+                             make_cell(log, 'b{}'.format(i))) for i in range(3)
+        ]
+        futures.append(scheduler.submit('other', 'o0', make_cell(log, 'o0')))
+        yield futures
+
+    IOLoop.current().run_sync(main)
+
+    started = [name for event, name in log if event == 'start']
+    assert started == ['b0', 'o0', 'b1', 'b2']
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_scheduler_respects_concurrency_cap():
+    running = []
+    peak = []
+
+    def make(name):
+
+        @gen.coroutine
+        def run():
+            running.append(name)
+            peak.append(len(running))
+            yield gen.sleep(0.01)
+            running.remove(name)
+
+        return run
+
+    @gen.coroutine
+    def main():
+        scheduler = CellScheduler(max_concurrent=2)
+        yield [
+            scheduler.submit('c{}'.format(i), str(i), make(i))
+            for i in range(6)
+        ]
+        assert scheduler.running == 0
+
+    IOLoop.current().run_sync(main)
+
+    assert max(peak) == 2
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_scheduler_cancel_queued_cell():
+    log = []
+    dequeued = []
+
+    @gen.coroutine
+    def main():
+        scheduler = CellScheduler()
+        first = scheduler.submit('a', 'first', make_cell(log, 'first'))
+        scheduler.submit('a', 'second', make_cell(log, 'second'))
+        third = scheduler.submit('a',
+                                 'third',
+                                 make_cell(log, 'third'),
+                                 on_dequeued=lambda: dequeued.append('third'))
+        assert scheduler.cancel('second') == 'a'
+        assert scheduler.cancel('first') is None
+        yield [first, third]
+
+    IOLoop.current().run_sync(main)
+
+    assert [name for event, name in log
+            if event == 'start'] == ['first', 'third']
+    assert dequeued == ['third']
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_scheduler_cancel_all():
+    log = []
+
+    @gen.coroutine
+    def main():
+        scheduler = CellScheduler(max_concurrent=1)
+        first = scheduler.submit('a', 'first', make_cell(log, 'first'))
+        scheduler.submit('a', 'second', make_cell(log, 'second'))
+        scheduler.submit('b', 'third', make_cell(log, 'third'))
+        assert sorted(scheduler.cancel_all()) == [('second', 'a'),
+                                                  ('third', 'b')]
+        assert len(scheduler) == 0
+        yield first
+
+    IOLoop.current().run_sync(main)
+
+    assert [name for event, name in log if event == 'start'] == ['first']
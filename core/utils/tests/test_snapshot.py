@@ -0,0 +1,84 @@
+# coding: utf8
+import json
+import os
+
+import pytest
+
+from ..snapshot import snapshot_namespace, restore_namespace, read_manifest, \
+    _is_array
+
+
+class Point:
+
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_snapshot_and_restore(tmpdir):
+    directory = str(tmpdir.join('snapshot'))
+    namespace = {
+        '__name__': '__console__',
+        'json': json,
+        'rows': list(range(100)),
+        'point': Point(1, 2),
+        'square': lambda x: x * x
+    }
+
+    manifest = snapshot_namespace(namespace, directory)
+    variables = {v['name']: v for v in manifest['variables']}
+    assert sorted(variables) == ['json', 'point', 'rows']
+    assert variables['json'] == {
+        'name': 'json',
+        'format': 'module',
+        'module': 'json'
+    }
+    assert variables['rows']['format'] == 'pickle'
+    assert variables['rows']['bytes'] == os.path.getsize(
+        os.path.join(directory, variables['rows']['file']))
+    assert [w['name'] for w in manifest['warnings']] == ['square']
+    assert read_manifest(directory) == manifest
+
+    restored = {}
+    report = restore_namespace(restored, directory)
+    assert sorted(report['restored']) == ['json', 'point', 'rows']
+    assert report['errors'] == []
+    assert restored['json'] is json
+    assert restored['rows'] == list(range(100))
+    assert (restored['point'].x, restored['point'].y) == (1, 2)
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_snapshot_replaces_previous(tmpdir):
+    directory = str(tmpdir.join('snapshot'))
+    snapshot_namespace({'a': 1, 'b': 2}, directory)
+    snapshot_namespace({'c': 3}, directory)
+
+    assert sorted(os.listdir(str(tmpdir))) == ['snapshot']
+    restored = {}
+    restore_namespace(restored, directory)
+    assert restored == {'c': 3}
+
+    assert restore_namespace({}, str(tmpdir.join('missing'))) is None
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_restored_arrays_stay_memory_mapped(tmpdir):
+    numpy = pytest.importorskip('numpy')
+    directory = str(tmpdir.join('snapshot'))
+    snapshot_namespace({'values': numpy.arange(1000)},
+                       directory,
+                       array_threshold=1)
+
+    restored = {}
+    restore_namespace(restored, directory)
+    assert isinstance(restored['values'], numpy.memmap)
+    assert _is_array(restored['values'])
+
+    # A memmap is saved as an array again, instead of being pickled
+    manifest = snapshot_namespace(restored, directory, array_threshold=1)
+    assert manifest['variables'][0]['format'] == 'npy'
@@ -1,10 +1,14 @@
 # coding: utf8
 import pytest
+import sys
+import types
 
 from support.socket import DummySocketIO
 
 from core.constants import CellEvents, CellExecutionStatus
-from ..socket import LocalSocketIO, CellEventsSocket
+from ..metrics import SOCKET_EMIT_DURATION
+from ..socket import LocalSocketIO, CellEventsSocket, InstrumentedSocketIO, \
+    LazySocketIO
 
 __author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
 
@@ -116,3 +120,59 @@ def test_cell_events_socket_done_error(mocker):
         'id': 'cid',
         'status': CellExecutionStatus.ERROR
     })
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_cell_events_socket_counts_output(mocker):
+    lio = LocalSocketIO(DummySocketIO(), 'c', 'n')
+
+    csocket = CellEventsSocket(lio, 'cid')
+
+    mocker.patch.object(lio, 'emit', autospec=True)
+
+    csocket.stdout(['a', 'b'])
+    csocket.stderr(['cd'])
+
+    assert csocket.lines_emitted == 3
+    assert csocket.bytes_emitted == 4
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_instrumented_socketio(mocker):
+    gsio = DummySocketIO()
+    mocked = mocker.patch.object(gsio, 'emit', autospec=True)
+
+    sio = InstrumentedSocketIO(gsio)
+    count, _ = SOCKET_EMIT_DURATION.get(event='test_event')
+
+    sio.emit('test_event', 'test_args', room='r')
+
+    mocked.assert_called_once_with('test_event', 'test_args', room='r')
+    assert SOCKET_EMIT_DURATION.get(event='test_event')[0] == count + 1
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_lazy_socketio_connects_on_first_emit(mocker):
+    created = []
+
+    class FakeSocketIO(DummySocketIO):
+
+        def __init__(self, **kwargs):
+            super().__init__()
+            created.append(kwargs)
+
+    module = types.ModuleType('flask_socketio')
+    module.SocketIO = FakeSocketIO
+    mocker.patch.dict(sys.modules, {'flask_socketio': module})
+
+    sio = LazySocketIO(message_queue='redis://queue')
+    assert created == []
+
+    sio.emit('test_event', 'test_args', room='r')
+    sio.emit('test_event', 'test_args', room='r')
+
+    assert created == [{'message_queue': 'redis://queue'}]
+    assert sio.connect().find_event('test_event', 'test_args', room='r')
@@ -0,0 +1,33 @@
+# coding: utf8
+import pytest
+
+from ..startup import StartupReport, STARTUP_PHASE_DURATION
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_startup_report_phases():
+    report = StartupReport()
+
+    with report.phase('test_phase'):
+        pass
+    report.record('other_phase', 0.5)
+
+    phases = report.as_dict()['phases']
+    assert [p['name'] for p in phases] == ['test_phase', 'other_phase']
+    assert phases[1]['seconds'] == 0.5
+    assert STARTUP_PHASE_DURATION.get(phase='other_phase') == 0.5
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_startup_report_mark_ready_once():
+    report = StartupReport()
+    assert report.as_dict()['timeToFirstPing'] is None
+
+    report.mark_ready()
+    ready_at = report.ready_at
+    assert report.time_to_ready > 0
+
+    report.mark_ready()
+    assert report.ready_at == ready_at
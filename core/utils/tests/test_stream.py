@@ -0,0 +1,76 @@
+# coding: utf8
+import json
+
+import pytest
+from tornado.ioloop import IOLoop
+from tornado.websocket import WebSocketClosedError
+
+from ..stream import ChannelHub, StreamingSocketIO
+
+
+class FakeSubscriber:
+
+    def __init__(self, closed=False):
+        self.loop = IOLoop.current()
+        self.closed = closed
+        self.messages = []
+
+    def write_message(self, message):
+        if self.closed:
+            raise WebSocketClosedError()
+        self.messages.append(json.loads(message))
+
+
+class FakeSocketIO:
+
+    def __init__(self):
+        self.emitted = []
+
+    def emit(self, event, args, **kwargs):
+        self.emitted.append((event, args, kwargs))
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_hub_publishes_to_room_subscribers():
+    hub = ChannelHub()
+    subscriber = FakeSubscriber()
+    closed = FakeSubscriber(closed=True)
+    hub.subscribe('a', subscriber)
+    hub.subscribe('a', closed)
+    hub.subscribe('b', closed)
+
+    assert hub.publish('ev', {'id': 1}, room='a', namespace='/cells')
+    assert not hub.publish('ev', {'id': 1}, room='c', namespace='/cells')
+
+    assert subscriber.messages == [{
+        'event': 'ev',
+        'namespace': '/cells',
+        'room': 'a',
+        'data': {
+            'id': 1
+        }
+    }]
+    # Closed connections are dropped from every channel
+    assert len(hub) == 1
+    assert not hub.has_subscribers('b')
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_streaming_socketio_bypasses_broker_for_subscribed_rooms():
+    hub = ChannelHub()
+    hub.subscribe('direct', FakeSubscriber())
+
+    relayed = FakeSocketIO()
+    StreamingSocketIO(relayed, hub).emit('ev', {}, room='direct')
+    assert len(relayed.emitted) == 1
+
+    bypassed = FakeSocketIO()
+    socketio = StreamingSocketIO(bypassed, hub, bypass_broker=True)
+    socketio.emit('ev', {}, room='direct')
+    assert bypassed.emitted == []
+
+    # The message queue remains the fallback for rooms without subscribers
+    socketio.emit('ev', {}, room='other')
+    assert bypassed.emitted == [('ev', {}, {'room': 'other'})]
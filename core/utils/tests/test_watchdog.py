@@ -0,0 +1,62 @@
+# coding: utf8
+import sys
+import threading
+import time
+
+import pytest
+import tornado.web
+
+from ..capacity import LoopLagMonitor
+from ..watchdog import LoopWatchdog, stall_context
+
+
+def run_cell(cell_id):
+    return stall_context(sys._getframe())
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_stall_context():
+    context = run_cell('c1')
+    assert context == {'handler': None, 'route': None, 'cellId': 'c1'}
+
+
+class BrokenHandler(tornado.web.RequestHandler):
+
+    @property
+    def request(self):
+        raise RuntimeError('Request is gone')
+
+
+def run_broken_handler(cell_id):
+    self = object.__new__(BrokenHandler)
+    return stall_context(sys._getframe())
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_stall_context_skips_unreadable_frames():
+    context = run_broken_handler('c2')
+    assert context == {'handler': None, 'route': None, 'cellId': 'c2'}
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_watchdog_reports_stall_once():
+    monitor = LoopLagMonitor(interval=0.01)
+    watchdog = LoopWatchdog(monitor, threshold=0.05)
+    assert watchdog.check() is None
+
+    watchdog._loop_thread_id = threading.get_ident()
+    monitor._last_tick = time.monotonic()
+    assert watchdog.check() is None
+
+    time.sleep(0.1)
+    context = watchdog.check()
+    assert 'test_watchdog_reports_stall_once' in context['stack']
+    assert watchdog.last_stall is context
+    assert watchdog.check() is None
+
+    # The next tick ends the stall
+    monitor._tick()
+    assert watchdog.check() is None
@@ -0,0 +1,123 @@
+# coding: utf8
+import subprocess
+import sys
+
+import pytest
+
+from ..zygote import Zygote, ZygoteError, ZygoteRunLost, run_python_file
+
+
+@pytest.fixture(scope='module')
+def zygote(tmpdir_factory):
+    socket_path = str(tmpdir_factory.mktemp('zygote').join('zygote.sock'))
+    z = Zygote(['json'], socket_path=socket_path)
+    z.ensure_started()
+    yield z
+    z.stop()
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_zygote_runs_file_with_cwd_and_env(zygote, tmpdir):
+    tmpdir.join('helper.py').write('VALUE = 42\n')
+    script = tmpdir.mkdir('scripts').join('main.py')
+    script.write('import os, sys, helper\n'
+                 'print(__name__, helper.VALUE, os.getcwd())\n'
+                 'print(sorted(os.environ))\n'
+                 'print("warning", file=sys.stderr)\n')
+
+    returncode, out, err = zygote.run(str(script), str(tmpdir),
+                                      {'PYTHONPATH': str(tmpdir)})
+
+    assert returncode == 0
+    assert out == "__main__ 42 {}\n['PYTHONPATH']\n".format(tmpdir)
+    assert err == 'warning\n'
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_zygote_passes_arguments(zygote, tmpdir):
+    script = tmpdir.join('args.py')
+    script.write('import sys\nprint(sys.argv[1:])\n')
+
+    assert zygote.run(str(script), str(tmpdir), {},
+                      args=['a', 'b'])[1] == "['a', 'b']\n"
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_zygote_output_matches_interpreter(zygote, tmpdir):
+    script = tmpdir.join('fail.py')
+    script.write('def f():\n    raise ValueError("boom")\n\nprint("before")\n'
+                 'f()\n')
+
+    p = subprocess.run([sys.executable, str(script)],
+                       stdout=subprocess.PIPE,
+                       stderr=subprocess.PIPE)
+    returncode, out, err = zygote.run(str(script), str(tmpdir), {})
+
+    assert returncode == p.returncode == 1
+    assert out == p.stdout.decode('utf-8')
+    assert err == p.stderr.decode('utf-8')
+
+    script.write('import sys\nsys.exit(3)\n')
+    assert zygote.run(str(script), str(tmpdir), {})[0] == 3
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_zygote_runs_are_isolated(zygote, tmpdir):
+    script = tmpdir.join('state.py')
+    script.write('import json, random\n'
+                 'json.marker = getattr(json, "marker", 0) + 1\n'
+                 'print(json.marker, random.random())\n')
+
+    first = zygote.run(str(script), str(tmpdir), {})[1].split()
+    second = zygote.run(str(script), str(tmpdir), {})[1].split()
+
+    # Preloaded modules are not mutated by runs
+    assert first[0] == second[0] == '1'
+    # Random state is not inherited from the zygote
+    assert first[1] != second[1]
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_zygote_timeout_kills_run(zygote, tmpdir):
+    script = tmpdir.join('slow.py')
+    script.write('import subprocess, time\n'
+                 'subprocess.Popen(["sleep", "30"])\n'
+                 'time.sleep(30)\n')
+
+    with pytest.raises(TimeoutError):
+        zygote.run(str(script), str(tmpdir), {}, timeout=0.5)
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_run_python_file_falls_back_without_zygote(tmpdir):
+    script = tmpdir.join('main.py')
+    script.write('print("hello")\n')
+
+    broken = Zygote(socket_path=str(tmpdir.join('missing.sock')))
+    broken._connect = lambda: (_ for _ in ()).throw(ZygoteError('down'))
+
+    assert run_python_file(str(script), str(tmpdir), {},
+                           zygote=broken) == (0, 'hello\n', '')
+    assert run_python_file(str(script), str(tmpdir), {}) == (0, 'hello\n', '')
+
+
+@pytest.mark.unit
+@pytest.mark.utils
+def test_run_python_file_does_not_rerun_lost_runs(zygote, tmpdir):
+    marker = tmpdir.join('runs.txt')
+    script = tmpdir.join('main.py')
+    # The supervisor of the run goes away before reporting the return code
+    script.write('import os, signal\n'
+                 'with open({!r}, "a") as f:\n'
+                 '    f.write("run\\n")\n'
+                 'os.kill(os.getppid(), signal.SIGKILL)\n'.format(str(marker)))
+
+    with pytest.raises(ZygoteRunLost):
+        run_python_file(str(script), str(tmpdir), {}, zygote=zygote)
+    assert marker.read() == 'run\n'
@@ -0,0 +1,131 @@
+# coding: utf8
+"""
+Detection of calls that block the event loop.
+
+The ticks of the `LoopLagMonitor` timer are the heartbeat of the loop. A
+watchdog thread checks the heartbeat, and when the next tick is late by more
+than a threshold it captures the stack of the loop thread. The request
+handler and cell id being run are found in the frames of that stack, so no
+handler has to report what it is doing. Each stall is logged once, with its
+stack.
+"""
+import sys
+import threading
+import time
+import traceback
+
+import tornado.web
+from tornado.log import app_log
+
+from core.utils.metrics import LOOP_STALLS
+
+
+def _read_frame(frame, context):
+    local_vars = frame.f_locals
+    if context['cellId'] is None and \
+            isinstance(local_vars.get('cell_id'), str):
+        context['cellId'] = local_vars['cell_id']
+    handler = local_vars.get('self')
+    if context['handler'] is None and \
+            isinstance(handler, tornado.web.RequestHandler):
+        route = '{} {}'.format(handler.request.method, handler.request.path)
+        context['handler'] = type(handler).__name__
+        context['route'] = route
+
+
+def stall_context(frame):
+    """The handler, route and cell id found in the frames of a stack
+
+    Best effort. The frames belong to a thread that keeps running, so frames
+    whose locals can not be read are skipped.
+
+    Returns
+    -------
+    dict
+        `handler` and `route` of the innermost request handler and the
+        innermost `cell_id` local, each None if not found
+    """
+    context = {'handler': None, 'route': None, 'cellId': None}
+    while frame is not None:
+        try:
+            _read_frame(frame, context)
+        except Exception:
+            pass
+        frame = frame.f_back
+    return context
+
+
+class LoopWatchdog:
+    """Logs the stack of the event loop thread when the loop stalls"""
+
+    def __init__(self, lag_monitor, threshold=0.5):
+        """
+        Parameters
+        ----------
+        lag_monitor: LoopLagMonitor
+            The monitor whose timer ticks are the heartbeat of the loop
+
+        threshold: float
+            Seconds a tick may be late before the loop is considered stalled
+        """
+        self.lag_monitor = lag_monitor
+        self.threshold = threshold
+        # Check often enough to catch stalls close to the threshold
+        self.interval = threshold / 5
+        self._loop_thread_id = None
+        # The tick a reported stall started after, None while not stalled
+        self._stalled_tick = None
+        # The context of the last stall, for debugging
+        self.last_stall = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """Start the watchdog thread.
+
+        Must be called on the IOLoop thread, after the lag monitor started
+        """
+        self._loop_thread_id = threading.get_ident()
+        threading.Thread(target=self._watch, name='loop-watchdog',
+                         daemon=True).start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _watch(self):
+        while not self._stopped.wait(self.interval):
+            self.check()
+
+    def check(self):
+        """Report a stall, once, if the loop has not ticked in time
+
+        Returns
+        -------
+        dict
+            The context of the stall, or None
+        """
+        last_tick = self.lag_monitor.last_tick
+        if last_tick is None:
+            return None
+        if self._stalled_tick is not None:
+            if last_tick == self._stalled_tick:
+                return None
+            # The next tick ends the stall
+            self._stalled_tick = None
+            app_log.warning('Event loop resumed after %.3fs',
+                            self.lag_monitor.lag)
+        late_by = time.monotonic() - last_tick - self.lag_monitor.interval
+        if late_by <= self.threshold:
+            return None
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return None
+        self._stalled_tick = last_tick
+        context = stall_context(frame)
+        context['stack'] = ''.join(traceback.format_stack(frame))
+        del frame
+        self.last_stall = context
+        LOOP_STALLS.inc(handler=context['handler'] or '')
+        app_log.warning('Event loop stalled for %.3fs in %s (cell %s)\n%s',
+                        late_by, context['route'] or 'no request',
+                        context['cellId'] or '-', context['stack'])
+        return context
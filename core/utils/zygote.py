@@ -0,0 +1,526 @@
+# coding: utf8
+"""
+A fork server ("zygote") for running python files with preloaded libraries.
+
+The zygote is a long lived python process that imports a configurable list of
+modules once. Every run forks from it, so the target starts with numpy, pandas
+etc. already imported instead of paying for the imports on every run.
+
+For each run the client connects to the zygote over a unix socket and sends
+the file to run, its working directory and environment, along with the write
+ends of its stdout and stderr pipes. The zygote forks a supervisor, which
+forks the process that runs the file with `runpy` in a fresh `__main__`. The
+supervisor reports the pid and later the return code of the run back over the
+connection.
+
+This module only depends on the standard library. It is executed as a script
+with `python -I` to start the zygote, and imported by the runtime for the
+client.
+"""
+import array
+import contextlib
+import importlib
+import itertools
+import json
+import logging
+import os
+import selectors
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+
+# Size of the chunks read from pipes and sockets
+CHUNK_SIZE = 65536
+
+# Distinguishes the sockets of zygotes started by one process
+_zygote_ids = itertools.count()
+
+
+class ZygoteError(Exception):
+    """Raised when a run can not be handed to the zygote.
+
+    The file has not started, so it is safe to run it some other way.
+    """
+    pass
+
+
+class ZygoteRunLost(Exception):
+    """Raised when the zygote loses a run after it started.
+
+    The file may have run, side effects included, so it must not be run
+    again.
+    """
+    pass
+
+
+def _send_message(conn, message, fds=None):
+    data = (json.dumps(message) + '\n').encode('utf-8')
+    if fds:
+        conn.sendmsg(
+            [data],
+            [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array('i', fds))])
+    else:
+        conn.sendall(data)
+
+
+class _MessageReader:
+    """Reads newline delimited JSON messages from a socket"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.buffer = b''
+
+    def read(self, max_fds=0):
+        """Read one message, returning it with any file descriptors received"""
+        fds = []
+        while b'\n' not in self.buffer:
+            if max_fds and not fds:
+                fd_size = array.array('i').itemsize
+                data, ancdata, _, _ = self.conn.recvmsg(
+                    CHUNK_SIZE, socket.CMSG_SPACE(max_fds * fd_size))
+                for level, kind, cdata in ancdata:
+                    if level == socket.SOL_SOCKET and \
+                            kind == socket.SCM_RIGHTS:
+                        received = array.array('i')
+                        received.frombytes(cdata[:len(cdata) -
+                                                 (len(cdata) % fd_size)])
+                        fds.extend(received)
+            else:
+                data = self.conn.recv(CHUNK_SIZE)
+            if not data:
+                raise EOFError('Connection closed')
+            self.buffer += data
+        line, self.buffer = self.buffer.split(b'\n', 1)
+        return json.loads(line.decode('utf-8')), fds
+
+
+# Server side
+
+
+def _exit_code(exc):
+    """The process exit code for a SystemExit, as the interpreter computes it"""
+    if exc.code is None:
+        return 0
+    if isinstance(exc.code, int):
+        return exc.code
+    print(exc.code, file=sys.stderr)
+    return 1
+
+
+def _print_exception(path):
+    """Print the current exception like the interpreter does for a script"""
+    etype, value, tb = sys.exc_info()
+    if isinstance(value, SyntaxError):
+        # Raised while compiling, the interpreter prints no traceback
+        traceback.print_exception(etype, value, None)
+        return
+    # Drop the frames of the zygote and runpy
+    while tb is not None and tb.tb_frame.f_code.co_filename != path:
+        tb = tb.tb_next
+    traceback.print_exception(etype, value, tb)
+
+
+def _reseed():
+    """Forked processes share the random state of the zygote, reseed it"""
+    import random
+    random.seed()
+    numpy_random = sys.modules.get('numpy.random')
+    if numpy_random is not None:
+        numpy_random.seed()
+
+
+def _finalize():
+    """Mirror the shutdown of the interpreter before exiting the run"""
+    try:
+        threading._shutdown()
+    except Exception:
+        pass
+    try:
+        import atexit
+        atexit._run_exitfuncs()
+    except Exception:
+        pass
+    for stream in (sys.stdout, sys.stderr):
+        try:
+            stream.flush()
+        except Exception:
+            pass
+
+
+def _run_target(request, base_path):
+    """Run the requested file. Called in the forked child, never returns"""
+    path = request['path']
+    env = request.get('env', {})
+    code = 1
+    try:
+        os.setsid()
+        os.chdir(request['cwd'])
+        os.environ.clear()
+        os.environ.update(env)
+
+        # The path a fresh interpreter would have: the script directory,
+        # then PYTHONPATH, then the standard library and site packages
+        python_path = [
+            p for p in env.get('PYTHONPATH', '').split(os.pathsep) if p
+        ]
+        sys.path[:] = [os.path.dirname(os.path.abspath(path))
+                       ] + python_path + base_path
+        sys.argv = [path] + request.get('args', [])
+        _reseed()
+
+        import runpy
+        try:
+            runpy.run_path(path, run_name='__main__')
+            code = 0
+        except SystemExit as e:
+            code = _exit_code(e)
+        except BaseException:
+            _print_exception(path)
+            code = 1
+        _finalize()
+    finally:
+        os._exit(code)
+
+
+def _supervise(conn, request, fds, base_path):
+    """Fork the run and report its pid and return code. Never returns"""
+    # Runs must be waited on, the zygote itself ignores SIGCHLD
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    try:
+        pid = os.fork()
+        if pid == 0:
+            conn.close()
+            stdout_fd, stderr_fd = fds
+            devnull = os.open(os.devnull, os.O_RDONLY)
+            os.dup2(devnull, 0)
+            os.dup2(stdout_fd, 1)
+            os.dup2(stderr_fd, 2)
+            for fd in (devnull, stdout_fd, stderr_fd):
+                os.close(fd)
+            _run_target(request, base_path)
+
+        for fd in fds:
+            os.close(fd)
+        _send_message(conn, {'pid': pid})
+        _, status = os.waitpid(pid, 0)
+        if os.WIFSIGNALED(status):
+            returncode = -os.WTERMSIG(status)
+        else:
+            returncode = os.WEXITSTATUS(status)
+        _send_message(conn, {'returncode': returncode})
+    finally:
+        os._exit(0)
+
+
+def serve(socket_path, preload, path=()):
+    """Preload modules and serve runs until stdin is closed
+
+    Parameters
+    ----------
+    socket_path: str
+        The unix socket path to listen on
+
+    preload: list
+        Names of modules to import before serving
+
+    path: list
+        Directories searched for the preloaded modules, before the standard
+        library and site packages
+    """
+    base_path = list(sys.path)
+    sys.path[:0] = path
+    # stdout carries the ready line, output of preloaded modules goes to stderr
+    with contextlib.redirect_stdout(sys.stderr):
+        for name in preload:
+            try:
+                importlib.import_module(name)
+            except Exception as e:
+                print('zygote: could not preload {}: {}'.format(name, e),
+                      file=sys.stderr)
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen(128)
+
+    # Supervisors are reaped automatically
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+
+    # Nothing else is written to stdout, so the buffer is empty when forking
+    sys.stdout.write('ready\n')
+    sys.stdout.flush()
+
+    selector = selectors.DefaultSelector()
+    selector.register(server, selectors.EVENT_READ)
+    # The client holds the other end of stdin, EOF means it went away
+    selector.register(sys.stdin, selectors.EVENT_READ)
+    try:
+        while True:
+            for key, _ in selector.select():
+                if key.fileobj is sys.stdin:
+                    if not os.read(sys.stdin.fileno(), CHUNK_SIZE):
+                        return
+                    continue
+                conn, _ = server.accept()
+                fds = []
+                try:
+                    request, fds = _MessageReader(conn).read(max_fds=2)
+                    if len(fds) != 2:
+                        raise ValueError('Expected stdout and stderr')
+                    pid = os.fork()
+                    if pid == 0:
+                        selector.close()
+                        server.close()
+                        _supervise(conn, request, fds, base_path)
+                except Exception as e:
+                    print('zygote: bad request: {}'.format(e), file=sys.stderr)
+                finally:
+                    conn.close()
+                    for fd in fds:
+                        os.close(fd)
+    finally:
+        server.close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+# Client side
+
+
+class Zygote:
+    """Client that starts a zygote process and runs python files through it"""
+
+    def __init__(self, preload=None, socket_path=None, path=None):
+        """
+        Parameters
+        ----------
+        preload: list, optional
+            Names of modules the zygote imports before serving runs
+
+        socket_path: str, optional
+            The unix socket the zygote listens on. Defaults to a path in a
+            temporary directory unique to this zygote
+
+        path: list, optional
+            Directories searched for preloaded modules, e.g. to preload the
+            local modules of a file. Runs see preloaded modules as they were
+            when the zygote started
+        """
+        self.preload = list(preload or [])
+        self.path = list(path or [])
+        self.socket_path = socket_path or os.path.join(
+            tempfile.gettempdir(), 'unklearn-zygote-{}-{}.sock'.format(
+                os.getpid(), next(_zygote_ids)))
+        self._process = None
+        self._lock = threading.Lock()
+
+    def is_running(self):
+        return self._process is not None and self._process.poll() is None
+
+    def start(self):
+        """Start the zygote and wait until its modules are preloaded"""
+        self.stop()
+        self._process = subprocess.Popen(
+            # -I keeps the script directory and user site out of sys.path
+            [
+                sys.executable, '-I',
+                os.path.abspath(__file__), self.socket_path
+            ] + ['--path={}'.format(p) for p in self.path] + self.preload,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE)
+        if self._process.stdout.readline().strip() != b'ready':
+            self._process.wait()
+            raise ZygoteError('Zygote exited with {} while starting'.format(
+                self._process.returncode))
+
+    def ensure_started(self):
+        """Start the zygote, unless it is already running"""
+        with self._lock:
+            if not self.is_running():
+                self.start()
+
+    def stop(self):
+        """Stop the zygote. Runs in progress are not affected"""
+        if self._process is None:
+            return
+        if self._process.poll() is None:
+            # Closing stdin tells the zygote to exit
+            self._process.stdin.close()
+            try:
+                self._process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+                self._process.wait()
+        self._process.stdout.close()
+        self._process = None
+
+    def _connect(self):
+        self.ensure_started()
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            conn.connect(self.socket_path)
+        except OSError as e:
+            conn.close()
+            raise ZygoteError('Could not connect to zygote: {}'.format(e))
+        return conn
+
+    def run(self, file_path, cwd, env, timeout=None, on_start=None, args=None):
+        """Run a python file in a process forked from the zygote.
+
+        Blocks until the run is complete.
+
+        Parameters
+        ----------
+        file_path: str
+            The absolute path of the file to run
+
+        cwd: str
+            The working directory of the run
+
+        env: dict
+            The environment of the run. PYTHONPATH is honoured as a fresh
+            interpreter would
+
+        timeout: float, optional
+            Seconds after which the process group of the run is killed
+
+        on_start: method, optional
+            Called with the pid of the run once it started
+
+        args: list, optional
+            Command line arguments passed on to the file
+
+        Returns
+        -------
+        tuple
+            The return code, stdout and stderr of the run
+
+        Raises
+        ------
+        ZygoteError
+            If the run could not be started
+        ZygoteRunLost
+            If the zygote went away after the run started
+        TimeoutError
+            If the run was killed because the timeout expired
+        """
+        conn = self._connect()
+        out_r, out_w = os.pipe()
+        err_r, err_w = os.pipe()
+        try:
+            try:
+                _send_message(
+                    conn, {
+                        'path': file_path,
+                        'cwd': cwd,
+                        'env': env,
+                        'args': list(args or [])
+                    }, [out_w, err_w])
+            finally:
+                os.close(out_w)
+                os.close(err_w)
+
+            reader = _MessageReader(conn)
+            try:
+                pid = reader.read()[0]['pid']
+            except (EOFError, OSError, ValueError, KeyError) as e:
+                raise ZygoteError('Zygote did not start the run: {}'.format(e))
+            if on_start is not None:
+                on_start(pid)
+
+            deadline = time.time() + timeout if timeout is not None else None
+            outputs, timed_out = self._collect(out_r, err_r, pid, deadline)
+            try:
+                returncode = reader.read()[0]['returncode']
+            except (EOFError, OSError, ValueError, KeyError) as e:
+                raise ZygoteRunLost('Lost the run of {}: {}'.format(
+                    file_path, e))
+        finally:
+            conn.close()
+            os.close(out_r)
+            os.close(err_r)
+
+        if timed_out:
+            raise TimeoutError('Run of {} timed out after {}s'.format(
+                file_path, timeout))
+        return (returncode, outputs[out_r].decode('utf-8', 'replace'),
+                outputs[err_r].decode('utf-8', 'replace'))
+
+    @staticmethod
+    def _collect(out_r, err_r, pid, deadline):
+        """Read stdout and stderr until both are closed"""
+        outputs = {out_r: b'', err_r: b''}
+        timed_out = False
+        with selectors.DefaultSelector() as selector:
+            for fd in outputs:
+                selector.register(fd, selectors.EVENT_READ)
+            while selector.get_map():
+                wait = None
+                if deadline is not None and not timed_out:
+                    wait = max(0, deadline - time.time())
+                events = selector.select(wait)
+                if not events and wait is not None:
+                    timed_out = True
+                    try:
+                        os.killpg(pid, signal.SIGKILL)
+                    except OSError:
+                        pass
+                    continue
+                for key, _ in events:
+                    data = os.read(key.fd, CHUNK_SIZE)
+                    if data:
+                        outputs[key.fd] += data
+                    else:
+                        selector.unregister(key.fd)
+        return outputs, timed_out
+
+
+def run_python_file(file_path, cwd, env, zygote=None, on_start=None):
+    """Run a python file, forking from the zygote when one is given.
+
+    Falls back to a fresh interpreter if the zygote can not take the run.
+    Blocks until the run is complete, and may start the zygote. Either way the
+    run leads its own process group, and on_start is called with its pid.
+
+    Returns
+    -------
+    tuple
+        The return code, stdout and stderr of the run
+
+    Raises
+    ------
+    ZygoteRunLost
+        If the zygote went away after the run started. The file is not run
+        again
+    """
+    if zygote is not None:
+        try:
+            return zygote.run(file_path, cwd, env, on_start=on_start)
+        except ZygoteError as e:
+            logging.getLogger('tornado.application').warning(
+                'Running %s without zygote: %s', file_path, e)
+    p = subprocess.Popen([sys.executable, file_path],
+                         env=env,
+                         stdout=subprocess.PIPE,
+                         stderr=subprocess.PIPE,
+                         cwd=cwd,
+                         start_new_session=True)
+    if on_start is not None:
+        on_start(p.pid)
+    stdout, stderr = p.communicate()
+    return p.returncode, stdout.decode('utf-8'), stderr.decode('utf-8')
+
+
+if __name__ == '__main__':
+    serve(sys.argv[1],
+          [a for a in sys.argv[2:] if not a.startswith('--path=')],
+          path=[
+              a[len('--path='):] for a in sys.argv[2:]
+              if a.startswith('--path=')
+          ])
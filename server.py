@@ -1,11 +1,111 @@
 # coding: utf8
-from tornado.ioloop import IOLoop
+import time
+
+# Taken before anything else is imported so that the startup report
+# includes import time
+IMPORTS_STARTED_AT = time.time()
+
+import os
+import signal
+
+from tornado.httpserver import HTTPServer
+from tornado.ioloop import IOLoop, PeriodicCallback
+from tornado.log import app_log
+from tornado.netutil import bind_sockets
+from tornado.options import define, options, parse_command_line
+from tornado.process import fork_processes, task_id
 
 from core.app import make_app
+from core.config import get_current_config
+from core.utils import SharedProcessRegistry, startup_report, \
+    restore_namespace
 
 __author__ = 'Tharun Mathew Paul (tmpaul06@gmail.com)'
 
+startup_report.record('imports', time.time() - IMPORTS_STARTED_AT)
+
+define('port', default=8888, type=int, help='Port to listen on')
+define('workers',
+       default=1,
+       type=int,
+       help='Number of pre-forked worker processes. 0 forks one per CPU. '
+       'Each worker has its own interactive python namespace')
+
+
+def connect_broker(socketio):
+    """Connect to the message queue. Runs in the background after listen"""
+    connect = getattr(socketio, 'connect', None)
+    if connect is not None:
+        with startup_report.phase('broker_connect'):
+            connect()
+
+
+def forward_sigterm(signum, frame):
+    """Pass SIGTERM on to the workers, which drain on their own"""
+    import psutil
+    for worker in psutil.Process().children():
+        worker.send_signal(signal.SIGTERM)
+
+
+async def shutdown(server, app, timeout):
+    """Drain running cells, then stop the server"""
+    if app.drain.draining:
+        return
+    app_log.info('Draining cells for up to %s seconds', timeout)
+    killed = await app.drain.run(timeout)
+    app_log.info('Drained, %s processes killed', killed)
+    server.stop()
+    IOLoop.current().stop()
+
+
 if __name__ == '__main__':
-    app = make_app()
-    app.listen(8888)
+    parse_command_line()
+
+    sockets = bind_sockets(options.port)
+
+    if options.workers != 1:
+        # Workers install their own handler after the fork
+        signal.signal(signal.SIGTERM, forward_sigterm)
+        # Fork before the config is loaded so that every worker connects to
+        # the message queue on its own
+        fork_processes(options.workers)
+
+    with startup_report.phase('config'):
+        config = get_current_config(
+            os.environ.get('UNKLEARN_ENVIRONMENT_TYPE'))
+
+    process_registry = None
+    worker_id = None
+    if options.workers != 1:
+        worker_id = task_id()
+        process_registry = SharedProcessRegistry(config.PROCESS_REGISTRY_PATH,
+                                                 worker_id=worker_id)
+
+    with startup_report.phase('make_app'):
+        app = make_app(process_registry=process_registry, worker_id=worker_id)
+
+    if config.SNAPSHOT_RESTORE_ON_START:
+        with startup_report.phase('restore_namespace'):
+            restore_namespace(app.console.locals, app.snapshot_dir)
+
+    with startup_report.phase('listen'):
+        server = HTTPServer(app)
+        server.add_sockets(sockets)
+
+    IOLoop.current().run_in_executor(None, connect_broker, config.SOCKETIO)
+    if app.zygote is not None:
+        # Preloading can take seconds, warm the zygote up in the background
+        IOLoop.current().run_in_executor(None, app.zygote.ensure_started)
+    app.lag_monitor.start()
+    if app.watchdog is not None:
+        app.watchdog.start()
+    if app.endpoint_workers is not None:
+        PeriodicCallback(app.endpoint_workers.check,
+                         config.ENDPOINT_WORKER_POLL_INTERVAL * 1000).start()
+
+    def on_sigterm(signum, frame):
+        IOLoop.current().add_callback_from_signal(
+            shutdown, server, app, config.SHUTDOWN_DRAIN_TIMEOUT)
+
+    signal.signal(signal.SIGTERM, on_sigterm)
     IOLoop.current().start()
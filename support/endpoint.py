@@ -0,0 +1,19 @@
+import json
+from urllib.parse import parse_qsl, urlparse
+
+import tornado.escape
+import tornado.web
+
+PARSE_ROUTE = r'/api/v1/cells/internal-endpoints/parse'
+
+
+class ParseStubHandler(tornado.web.RequestHandler):
+    """Stub of the server's endpoint parse API.
+
+    Query arguments of the request uri are returned as endpoint variables.
+    """
+
+    def post(self):
+        body = tornado.escape.json_decode(self.request.body)
+        query = dict(parse_qsl(urlparse(body['requestUri']).query))
+        self.write(json.dumps({'query': query, 'path': {}}))